@@ -1,141 +1,158 @@
+import sys
 import os
 import re
-
-def process_fortran_file(filepath):
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
-
-    modified_lines = []
-    inside_subroutine = False
-    inside_function = False
-    inside_module = False
-    current_subroutine_name = None
-    current_function_name = None
-    current_module_name = None
-    current_indent = ''
+import argparse
+
+from flt.batch import find_source_files, read_text, run_pipeline, run_tasks, text_lines
+from flt.fileio import update_file, report_check
+from flt.lexer import split_comment
+from flt import profiling
+
+FREE_FORM_SUFFIXES = ['.f90', '.src']
+
+# Statements that open a scope, tried only on lines starting like one of them
+_PROCEDURE_PREFIX = (r'(?:(?:recursive|non_recursive|pure|impure|elemental|module|integer|real|'
+                     r'double\s*precision|double\s*complex|complex|logical|character|type|class)\b'
+                     r'(?:\s*\([^()]*\)|\s*\*\s*\w+)?\s*)*')
+_PROCEDURE = re.compile(r'\s*' + _PROCEDURE_PREFIX + r'(subroutine|function)\s+(\w+)', re.IGNORECASE)
+_UNIT = re.compile(r'\s*(module|submodule|program)\b\s*(?:\([^()]*\))?\s*(\w+)', re.IGNORECASE)
+_END_UNIT = re.compile(r'\s*end\s*(subroutine|function|module|submodule|program)\b[ \t]*(\w*)', re.IGNORECASE)
+
+_STARTS = frozenset(word[:3] for word in (
+    'subroutine', 'function', 'module', 'submodule', 'program', 'end',
+    'recursive', 'non_recursive', 'pure', 'impure', 'elemental', 'integer', 'real',
+    'double', 'complex', 'logical', 'character', 'type', 'class'))
+
+def process_fortran_lines(lines):
+    """Generator that completes the 'end' statements of program units.
+
+    A plain 'end' becomes 'end subroutine/function/module/... <name>' and a
+    name is added to 'end subroutine/function/module/...' where it is
+    missing. Nesting (module procedures, contained procedures, interface
+    bodies) is followed with a stack of the open scopes.
+    """
+    scopes = []  # (kind, name), innermost last
 
     for line in lines:
-        subroutine_match = re.match(r'^(\s*)subroutine\s+(\w+)', line, re.IGNORECASE)
-        # Updated to match functions with a type prefix
-        function_match = re.match(r'^(\s*)((?:integer|real|double\s+precision|logical|character)\s+)?function\s+(\w+)', line, re.IGNORECASE)
-        module_match = re.match(r'^(\s*)module\s+(?!procedure\b)(\w+)', line, re.IGNORECASE)
-        end_subroutine_match = re.match(r'^(\s*)end\s+subroutine\s*(\w*)', line, re.IGNORECASE)
-        end_function_match = re.match(r'^(\s*)end\s+function\s*(\w*)', line, re.IGNORECASE)
-        end_module_match = re.match(r'^(\s*)end\s+module\s*(\w*)', line, re.IGNORECASE)
-
-        if subroutine_match:
-            inside_subroutine = True
-            inside_function = False
-            current_subroutine_name = subroutine_match.group(2)
-            current_indent = subroutine_match.group(1)
-
-        if function_match:
-            inside_function = True
-            inside_subroutine = False
-            current_function_name = function_match.group(3)
-            current_indent = function_match.group(1)
-
-        if module_match:
-            inside_module = True
-            current_module_name = module_match.group(2)
-            current_indent = module_match.group(1)
-
-        if inside_module and end_module_match:
-            if not end_module_match.group(2):
-                line = f'{end_module_match.group(1)}end module {current_module_name}\n'
-            inside_module = False
-
-        if inside_subroutine and end_subroutine_match:
-            if not end_subroutine_match.group(2):
-                line = f'{end_subroutine_match.group(1)}end subroutine {current_subroutine_name}\n'
-            inside_subroutine = False
-
-        if inside_function and end_function_match:
-            if not end_function_match.group(2):
-                line = f'{end_function_match.group(1)}end function {current_function_name}\n'
-            inside_function = False
-                    # If inside a module and the subroutine/function is ending
-        if inside_module:
-            if inside_subroutine and end_subroutine_match:
-                if not end_subroutine_match.group(2):
-                    line = f'{end_subroutine_match.group(1)}end subroutine {current_subroutine_name}\n'
-                inside_subroutine = False
-            if inside_function and end_function_match:
-                if not end_function_match.group(2):
-                    line = f'{end_function_match.group(1)}end function {current_function_name}\n'
-                inside_function = False
-
-        modified_lines.append(line)
-
-    with open(filepath, 'w') as file:
-        file.writelines(modified_lines)
-
-def replace_generic_end(filepath):
+        stripped = line.lstrip()
+        if stripped[:3].lower() not in _STARTS:
+            yield line
+            continue
+
+        if stripped[:3].lower() == 'end':
+            code, comment = split_comment(stripped)
+            end = code.rstrip()
+            if end.lower() == 'end':
+                if scopes:
+                    kind, name = scopes.pop()
+                    indent = line[:len(line) - len(stripped)]
+                    if end.isupper():
+                        kind = kind.upper()
+                    if comment:
+                        line = f'{indent}{end} {kind} {name}{code[len(end):]}{comment}'
+                    else:
+                        line = f'{indent}{end} {kind} {name}\n'
+                yield line
+                continue
+
+            end_match = _END_UNIT.match(line)
+            if end_match:
+                kind = end_match.group(1).lower()
+                for depth in range(len(scopes) - 1, -1, -1):
+                    if scopes[depth][0] == kind:
+                        name = scopes[depth][1]
+                        del scopes[depth:]
+                        if not end_match.group(2):
+                            line = f'{line[:end_match.end(1)]} {name}{line[end_match.end(1):]}'
+                        break
+            yield line
+            continue
+
+        unit_match = _PROCEDURE.match(line) or _UNIT.match(line)
+        if unit_match:
+            kind, name = unit_match.group(1).lower(), unit_match.group(2)
+            if not (kind == 'module' and name.lower() == 'procedure'):
+                scopes.append((kind, name))
+
+        yield line
+
+def process_fortran_file(filepath, check=False):
+    """Complete the 'end' statements of a file in a single pass.
+
+    The file is only rewritten if something changed. Returns True in that
+    case (with check set: if it would change, nothing is written).
+    """
     with open(filepath, 'r') as file:
-        lines = file.readlines()
-
-    modified_lines = []
-    inside_subroutine = False
-    inside_function = False
-    inside_module = False
-    current_subroutine_name = None
-    current_function_name = None
-    current_module_name = None
-    current_indent = ''
-
-    for line in lines:
-        subroutine_match = re.match(r'^(\s*)subroutine\s+(\w+)', line, re.IGNORECASE)
-        function_match = re.match(r'^(\s*)((?:integer|real|double\s+precision|logical|character)\s+)?function\s+(\w+)', line, re.IGNORECASE)
-        module_match = re.match(r'^(\s*)module\s+(?!procedure\b)(\w+)', line, re.IGNORECASE)
-        generic_end_match = re.match(r'^(\s*)end\s*$', line, re.IGNORECASE)
-
-        if subroutine_match:
-            inside_subroutine = True
-            inside_function = False
-            current_subroutine_name = subroutine_match.group(2)
-            current_indent = subroutine_match.group(1)
-
-        if function_match:
-            inside_function = True
-            inside_subroutine = False
-            current_function_name = function_match.group(3)
-            current_indent = function_match.group(1)
-
-        if module_match:
-            inside_module = True
-            current_module_name = module_match.group(2)
-            current_indent = module_match.group(1)
-
-        if generic_end_match:
-            if inside_subroutine:
-                line = f'{generic_end_match.group(1)}end subroutine {current_subroutine_name}\n'
-                inside_subroutine = False
-            elif inside_function:
-                line = f'{generic_end_match.group(1)}end function {current_function_name}\n'
-                inside_function = False
-            elif inside_module and not (inside_subroutine or inside_function):
-                line = f'{generic_end_match.group(1)}end module {current_module_name}\n'
-                inside_module = False
-
-        modified_lines.append(line)
-
-    with open(filepath, 'w') as file:
-        file.writelines(modified_lines)
-
-
-
-
-
-
-def process_directory(directory):
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.f90') or file.endswith('.src'):
-                filepath = os.path.join(root, file)
-                replace_generic_end(filepath)
-                process_fortran_file(filepath)
-
-# Example usage
-directory_path = 'source/'
-process_directory(directory_path)
-
+        lines = process_fortran_lines(profiling.source(file, filepath))
+        return update_file(profiling.stage('ends', lines), filepath, check)
+
+# both kinds of 'end' statements are handled in one pass now
+replace_generic_end = process_fortran_file
+
+def _process_file_job(job):
+    filepath, check = job
+    return filepath if process_fortran_file(filepath, check) else None
+
+# the stages of a pipelined process_files, see flt.batch.run_pipeline
+def _read_job(job):
+    return read_text(job[0])
+
+def _process_text_job(job, text):
+    return ''.join(process_fortran_lines(text_lines(text)))
+
+def _write_job(job, text):
+    filepath, check = job
+    return filepath if update_file([text], filepath, check) else None
+
+def process_files(files, jobs=None, check=False, profiler=None):
+    """Process files in a pool of worker processes.
+
+    Returns the sorted list of files that changed (with check set: would change).
+    A flt.profiling.Profiler measures every file, otherwise the files are
+    read and written by threads while the workers process others
+    (flt.batch.run_pipeline).
+    """
+    tasks = [(filepath, check) for filepath in files]
+    weight = lambda task: os.path.getsize(task[0])
+    if profiler is None:
+        results = run_pipeline(_read_job, _process_text_job, _write_job, tasks, jobs, weight=weight,
+                               stream=_process_file_job)
+    else:
+        results = run_tasks(_process_file_job, tasks, jobs, weight=weight, profiler=profiler)
+    return sorted(filter(None, results))
+
+def process_directory(directory, suffixes=FREE_FORM_SUFFIXES, jobs=None, check=False, profiler=None):
+    """Process all files below directory, see process_files."""
+    return process_files(find_source_files(directory, suffixes), jobs, check, profiler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add the unit names to 'end' statements of Fortran files, in place.")
+    parser.add_argument("roots", nargs='+', help="Fortran files or directory trees of such files.")
+    parser.add_argument("--suffix", action="append", dest="suffixes", help="File suffix to process in a directory tree, may be repeated (default: %s)." % ' '.join(FREE_FORM_SUFFIXES))
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of cores).")
+    parser.add_argument("--check", action="store_true", help="Only report the files that would change and exit with status 1 if there are any.")
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    profiler = profiling.from_args(args)
+
+    suffixes = args.suffixes or FREE_FORM_SUFFIXES
+    files = []
+    for root in args.roots:
+        if os.path.isdir(root):
+            files.extend(find_source_files(root, suffixes))
+        elif os.path.isfile(root):
+            files.append(root)
+        else:
+            parser.error(f"{root} does not exist")
+
+    files = list(dict.fromkeys(files))  # a file given twice must not be processed twice at once
+    changed = process_files(files, args.jobs, args.check, profiler)
+    if profiler is not None:
+        profiler.report()
+    if args.check:
+        return report_check(changed)
+    print(f"Processing completed. {len(changed)} of {len(files)} files updated.")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 import unittest
 import tempfile
 import os
-from add_names_to_ends import process_fortran_file, replace_generic_end
+from add_names_to_ends import process_fortran_file, replace_generic_end, main
 
 class TestFortranProcessing(unittest.TestCase):
 
@@ -175,6 +175,95 @@ class TestFortranProcessing(unittest.TestCase):
         self.assertEqual(result, expected_output)
 
 
+    def test_nested_scopes(self):
+        content = (
+            "program main\n"
+            "contains\n"
+            "  recursive integer(kind=8) function fact(n) result(r)\n"
+            "    if (n > 1) then\n"
+            "    end if\n"
+            "  end\n"
+            "  subroutine s()\n"
+            "    interface\n"
+            "      subroutine cb(x)\n"
+            "      endsubroutine\n"
+            "    end interface\n"
+            "  end subroutine ! done\n"
+            "END\n"
+            "module m\n"
+            "  interface g\n"
+            "    module procedure s\n"
+            "  end interface\n"
+            "contains\n"
+            "  function f()\n"
+            "  end  ! of f, 'quoted'\n"
+            "end\n"
+        )
+        expected_output = (
+            "program main\n"
+            "contains\n"
+            "  recursive integer(kind=8) function fact(n) result(r)\n"
+            "    if (n > 1) then\n"
+            "    end if\n"
+            "  end function fact\n"
+            "  subroutine s()\n"
+            "    interface\n"
+            "      subroutine cb(x)\n"
+            "      endsubroutine cb\n"
+            "    end interface\n"
+            "  end subroutine s ! done\n"
+            "END PROGRAM main\n"
+            "module m\n"
+            "  interface g\n"
+            "    module procedure s\n"
+            "  end interface\n"
+            "contains\n"
+            "  function f()\n"
+            "  end function f  ! of f, 'quoted'\n"
+            "end module m\n"
+        )
+
+        self.write_to_file(content)
+        self.assertTrue(process_fortran_file(self.test_file_path))
+        self.assertEqual(self.read_file(), expected_output)
+
+        # nothing left to do, the file is not written again
+        mtime = os.stat(self.test_file_path).st_mtime_ns
+        self.assertFalse(process_fortran_file(self.test_file_path))
+        self.assertEqual(os.stat(self.test_file_path).st_mtime_ns, mtime)
+
+    def test_main_tree(self):
+        content = (
+            "module m\n"
+            "contains\n"
+            "  subroutine s()\n"
+            "  end\n"
+            "end module\n"
+        )
+        expected_output = (
+            "module m\n"
+            "contains\n"
+            "  subroutine s()\n"
+            "  end subroutine s\n"
+            "end module m\n"
+        )
+        os.makedirs(os.path.join(self.test_dir.name, "sub"))
+        paths = [os.path.join(self.test_dir.name, "sub", name) for name in ("a.f90", "b.F90", "c.src")]
+        for path in paths:
+            with open(path, 'w') as file:
+                file.write(content)
+
+        self.assertEqual(main([self.test_dir.name, "--suffix", ".f90", "--suffix", ".F90", "--check"]), 1)
+        with open(paths[0], 'r') as file:
+            self.assertEqual(file.read(), content)
+
+        main([self.test_dir.name, "--suffix", ".f90", "--suffix", ".F90", "-j", "2"])
+        self.assertEqual(main([self.test_dir.name, "--suffix", ".f90", "--suffix", ".F90", "--check"]), 0)
+
+        for path, expected in zip(paths, (expected_output, expected_output, content)):
+            with open(path, 'r') as file:
+                self.assertEqual(file.read(), expected)
+
 if __name__ == "__main__":
     unittest.main()
 
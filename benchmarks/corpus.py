@@ -0,0 +1,249 @@
+# corpus.py: Synthetic legacy Fortran for the benchmarks.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Generates a corpus of fixed form (.f) or free form (.f90) files that look
+like old numerical code: subroutines with long continuation chains, OpenMP
+sentinels, Hollerith constants in DATA statements, large COMMON blocks,
+FORMAT statements, strings and inline comments. The same seed and size
+always give the same files.
+
+Files are written one at a time, so corpora of gigabytes need no more
+memory than one file.
+
+Usage: python corpus.py [--seed N] [--size 10MB] [--form fixed|free] output_dir
+"""
+
+import argparse
+import json
+import os
+import random
+
+# bump when the generated code changes, so that stored corpora are rebuilt
+GENERATOR_VERSION = 1
+
+DEFAULT_FILE_SIZE = 256 * 1024
+
+_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+def parse_size(text):
+    """Returns the number of bytes of a size like '500KB', '10MB' or '1GB'."""
+    text = text.strip().upper()
+    number = text.rstrip('KMGB')
+    unit = text[len(number):]
+    if unit not in _UNITS or not number:
+        raise ValueError(f"invalid size '{text}'")
+    return int(float(number) * _UNITS[unit])
+
+class CorpusGenerator:
+    """Generates program units from a random number generator."""
+
+    OPERATORS = [' + ', ' - ', ' * ', ' / ']
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.units = 0
+
+    def names(self, prefix, count):
+        return [f"{prefix}{i}" for i in range(1, count + 1)]
+
+    def chain(self, terms, count):
+        """Returns count terms joined by random operators, as items of a continued statement."""
+        rng = self.random
+        items = [rng.choice(terms) + rng.choice(self.OPERATORS) for _ in range(count - 1)]
+        return items + [rng.choice(terms)]
+
+    def common_members(self):
+        """Returns [(name, dimensions)] of a COMMON block, some hundred members at most."""
+        rng = self.random
+        members = []
+        for name in self.names('C', rng.choice([5, 20, 60, 150])):
+            dimensions = rng.choice(['', '', '', '(MXATM)', '(MXATM,3)', '(10)'])
+            members.append((name, dimensions))
+        return members
+
+    def fixed_unit(self):
+        """Returns the lines of a fixed form subroutine."""
+        rng = self.random
+        self.units += 1
+        n = self.units
+        block = rng.randint(1, 30)
+        members = self.common_members()
+        terms = ['A(I)', 'B(I)', 'X2', 'DBLE(I)', '2.0D0', 'C1'] + [name for name, dims in members if not dims][:10]
+
+        lines = [
+            f"      SUBROUTINE SOLV{n}(A, B, N, IERR)\n",
+            f"C     GENERATED ROUTINE {n}, DO NOT EDIT\n",
+            "      IMPLICIT DOUBLE PRECISION (A-H,O-Z)\n",
+            f"      PARAMETER (MXATM={rng.randint(100, 5000)})\n",
+            "      DIMENSION A(N), B(N)\n",
+            "      CHARACTER*8 LABEL\n",
+        ]
+        lines += self.fixed_continued(f"COMMON /BLK{block}/ ",
+                                      [name + dims for name, dims in members], ', ')
+        lines += [
+            "      DATA LABEL /8HCHECKING/\n",
+            "C$OMP PARALLEL DO PRIVATE(I)\n",
+            "C$OMP&   SHARED(A, B)\n",
+            f"      DO {100 + n % 800} I = 1, N\n",
+        ]
+        # up to some 50 continuation lines
+        lines += self.fixed_continued("   A(I) = ", self.chain(terms, rng.randint(5, 300)), '')
+        lines += [
+            f"  {100 + n % 800} CONTINUE\n",
+            "C$OMP END PARALLEL DO\n",
+            f"      IF (N .NE. 0) CALL REPORT('DONE! {n}', IERR)   ! CHECK\n",
+            "      WRITE(6, 9000) A(1), LABEL\n",
+            " 9000 FORMAT(' RESULT = ', F12.6, 2X, A8)\n",
+            "      RETURN\n",
+            "      END\n",
+        ]
+        return lines
+
+    def fixed_continued(self, start, items, separator):
+        """Statement start + items joined by separator, broken into 72 column lines."""
+        lines = []
+        line = '      ' + start
+        for index, item in enumerate(items):
+            text = item + (separator if index < len(items) - 1 else '')
+            if len(line) + len(text) > 72:
+                lines.append(line.rstrip() + '\n')
+                line = '     &   '
+            line += text
+        lines.append(line + '\n')
+        return lines
+
+    def free_unit(self):
+        """Returns the lines of a free form subroutine, declared for fdeclarations."""
+        rng = self.random
+        self.units += 1
+        n = self.units
+        block = rng.randint(1, 30)
+        members = [(name.lower(), dims.lower()) for name, dims in self.common_members()]
+        terms = ['a(i)', 'b(i)', 'x2', 'dble(i)', '2.0d0'] + [name for name, dims in members if not dims][:10]
+        upper = rng.random() < 0.5
+
+        lines = [
+            f"subroutine solv{n}(a, b, n, ierr)\n",
+            f"  ! generated routine {n}, do not edit\n",
+            "  implicit none\n",
+            f"  integer, parameter :: mxatm = {rng.randint(100, 5000)}\n",
+            "  integer n, ierr, i\n",
+            "  double precision a(n), b(n), x2\n",
+            "  character*8 label\n",
+        ]
+        for chunk in range(0, len(members), 8):
+            lines.append("  double precision " + ', '.join(name + dims for name, dims in members[chunk:chunk + 8]) + "\n")
+        lines += self.free_continued(f"  common /blk{block}/ ", [name for name, _ in members], ', ')
+        lines += [
+            "  data label /8HCHECKING/\n",
+            "  x2 = 0.5d0\n",
+            "!$omp parallel do private(i) &\n",
+            "!$omp&   shared(a, b)\n",
+            "  do i = 1, n\n",
+        ]
+        lines += self.free_continued("     a(i) = ", self.chain(terms, rng.randint(5, 300)), '')
+        lines += [
+            "  end do\n",
+            "!$omp end parallel do\n",
+            f"  if (a(1) > 0.0d0 .and. n /= 0) call report('done! {n}', ierr) ! check\n",
+            "  write(6, '(a, f12.6)') \" result = \", a(1)\n",
+            "end\n",
+        ]
+        if upper:
+            lines = [line.upper() if "'" not in line and '"' not in line else line for line in lines]
+        return lines
+
+    def free_continued(self, start, items, separator):
+        """Statement start + items joined by separator, continued with '&' every 100 columns."""
+        lines = []
+        line = start
+        for index, item in enumerate(items):
+            text = item + (separator if index < len(items) - 1 else '')
+            if len(line) + len(text) > 100:
+                lines.append(line.rstrip() + ' &\n')
+                line = '        '
+            line += text
+        lines.append(line + '\n')
+        return lines
+
+def generate(output_dir, size, form='fixed', seed=1, file_size=DEFAULT_FILE_SIZE):
+    """
+    Writes about size bytes of form ('fixed' or 'free') source to files of about
+    file_size bytes below output_dir. Returns the sorted list of files.
+    """
+    generator = CorpusGenerator(seed)
+    unit = generator.fixed_unit if form == 'fixed' else generator.free_unit
+    suffix = '.f' if form == 'fixed' else '.f90'
+
+    paths = []
+    written = 0
+    while written < size:
+        # a few files per directory, as in a real source tree
+        index = len(paths)
+        directory = os.path.join(output_dir, f"dir{index // 16:03d}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"file{index:05d}{suffix}")
+        file_bytes = 0
+        with open(path, 'w') as f:
+            while file_bytes < file_size and written + file_bytes < size:
+                text = ''.join(unit())
+                f.write(text)
+                file_bytes += len(text)
+        written += file_bytes
+        paths.append(path)
+    return paths
+
+def ensure_corpus(output_dir, size, form='fixed', seed=1, file_size=DEFAULT_FILE_SIZE):
+    """
+    Like generate, but keeps a corpus that output_dir already holds for the same
+    parameters (recorded in corpus.json). Returns the sorted list of files.
+    """
+    manifest_path = os.path.join(output_dir, 'corpus.json')
+    manifest = {'version': GENERATOR_VERSION, 'size': size, 'form': form, 'seed': seed, 'file_size': file_size}
+    try:
+        with open(manifest_path) as f:
+            stored = json.load(f)
+        files = [os.path.join(output_dir, name) for name in stored.pop('files')]
+        if stored == manifest and all(os.path.exists(path) for path in files):
+            return files
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if os.path.isdir(output_dir):
+        for root, dirs, files in os.walk(output_dir, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            for name in dirs:
+                os.rmdir(os.path.join(root, name))
+    files = generate(output_dir, size, form, seed, file_size)
+    with open(manifest_path, 'w') as f:
+        json.dump(dict(manifest, files=[os.path.relpath(path, output_dir) for path in files]), f)
+    return files
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic legacy Fortran corpus.")
+    parser.add_argument("output_dir", help="Directory for the generated files.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random number generator (default: %(default)s).")
+    parser.add_argument("--size", type=parse_size, default=parse_size('10MB'), help="Total size, e.g. 500KB, 10MB, 2GB (default: 10MB).")
+    parser.add_argument("--form", choices=['fixed', 'free'], default='fixed', help="Source form (default: %(default)s).")
+    parser.add_argument("--file-size", type=parse_size, default=DEFAULT_FILE_SIZE, help="Size of each file (default: 256KB).")
+    args = parser.parse_args(argv)
+
+    files = generate(args.output_dir, args.size, args.form, args.seed, args.file_size)
+    print(f"{len(files)} files written to {args.output_dir}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# run_benchmarks.py: Time every tool on a synthetic corpus and compare with a baseline.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Times every tool, and every stage of each tool (as measured by flt.profiling),
+on a corpus made by corpus.py, and compares the times with a stored baseline.
+
+Usage: python run_benchmarks.py [--size 2MB] [--repeat 3] [--tools fixed2free,ends]
+                                [--baseline baseline.json] [--update-baseline]
+
+Times depend on the machine and, on a shared one, drift from second to
+second, so a fixed piece of pure Python is timed (calibrate()) right before
+every run of a tool and times are compared in units of that. A tool or a
+stage is a regression when its time exceeds the baseline by more than its
+threshold: the one stored for the tool in the "thresholds" of the baseline
+file, otherwise --threshold. Stages that took less than MIN_STAGE_SHARE of
+their tool in the baseline are shown but not checked, they are mostly noise.
+The exit status is 1 if there was a regression.
+
+The corpus is generated once into --corpus-dir (a temporary directory if not
+given) and reused by later runs with the same size and seed.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from flt import import_tool, profiling
+from flt import pipeline
+
+import corpus
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# repeated runs on a busy shared machine were up to 30% apart, even relative
+# to their calibration
+DEFAULT_THRESHOLD = 0.35
+MIN_STAGE_SHARE = 0.25
+
+def _output(path, corpus_dir, output_dir):
+    output = os.path.join(output_dir, os.path.relpath(path, corpus_dir))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    return output
+
+def _copy(files, corpus_dir, output_dir):
+    copies = []
+    for path in files:
+        copies.append(_output(path, corpus_dir, output_dir))
+        shutil.copyfile(path, copies[-1])
+    return copies
+
+def bench_fixed2free(profiler, files, corpus_dir, output_dir):
+    fixed2free2 = import_tool('fixed2free', 'fixed2free2')
+    for path in files:
+        output = fixed2free2.free_form_name(_output(path, corpus_dir, output_dir))
+        profiling.call(profiler, fixed2free2.convert_file, path, output)
+
+def bench_lowercase(profiler, files, corpus_dir, output_dir):
+    flowercase = import_tool('flowercase', 'flowercase')
+    for path in files:
+        profiling.call(profiler, flowercase.convert_file, path, _output(path, corpus_dir, output_dir))
+
+def bench_ends(profiler, files, corpus_dir, output_dir):
+    add_names_to_ends = import_tool('add_proper_endings', 'add_names_to_ends')
+    for path in _copy(files, corpus_dir, output_dir):
+        profiling.call(profiler, add_names_to_ends.process_fortran_file, path)
+
+def _split_units(path, output_dir):
+    """Writes every subroutine of path to a file of its own, ending with 'end subroutine'."""
+    paths = []
+    unit = []
+    with open(path) as f:
+        for line in f:
+            if line.strip().lower() == 'end':
+                line = 'end subroutine\n'
+            unit.append(line)
+            if line == 'end subroutine\n':
+                paths.append(os.path.join(output_dir, f"{os.path.basename(path)}.{len(paths)}.f90"))
+                with open(paths[-1], 'w') as out:
+                    out.writelines(unit)
+                unit = []
+    return paths
+
+def bench_declarations(profiler, files, corpus_dir, output_dir):
+    # a wrapper is written for the first subroutine of a file only, so every
+    # subroutine gets a file of its own (not timed)
+    fdeclarations = import_tool('fdeclarations', 'fdeclarations')
+    units = [unit for path in files for unit in _split_units(path, output_dir)]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for path in units:
+            profiling.call(profiler, fdeclarations.wrapFile, path)
+
+def bench_analyze(profiler, files, corpus_dir, output_dir):
+    file_analyzer = import_tool('jfortran', 'file_analyzer')
+    for path in files:
+        profiling.call(profiler, file_analyzer.analyze_file, path)
+
+def bench_pipeline(profiler, files, corpus_dir, output_dir):
+    for path in files:
+        output = pipeline.output_name(_output(path, corpus_dir, output_dir), pipeline.STAGES)
+        profiling.call(profiler, pipeline.convert_file, path, output)
+
+# tool: (source form of its corpus, function(profiler, files, corpus_dir, output_dir))
+BENCHMARKS = {
+    'fixed2free': ('fixed', bench_fixed2free),
+    'lowercase': ('free', bench_lowercase),
+    'ends': ('free', bench_ends),
+    'declarations': ('free', bench_declarations),
+    'analyze': ('free', bench_analyze),
+    'pipeline': ('fixed', bench_pipeline),
+}
+
+_CALIBRATION_LINE = "      A(I) = B(I) * C1 + 2.0D0 / X2   ! UPDATE 'A'\n"
+_CALIBRATION_WORD = re.compile(r'\b[A-Z]\w*\b')
+
+def _calibration_work():
+    for line in [_CALIBRATION_LINE] * 5000:
+        code = line.split('!')[0]
+        _CALIBRATION_WORD.sub(lambda match: match.group(0).lower(), code)
+        code.strip().replace(' ', '').split('=')
+
+def calibrate(repeat=3):
+    """Returns the best time in seconds of a fixed piece of pure Python work."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _calibration_work()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def run_benchmark(name, files, corpus_dir, repeat):
+    """
+    Runs the benchmark name repeat times and returns the measurements of the
+    fastest run relative to its calibration: {'seconds': ..., 'calibration':
+    ..., 'lines': ..., 'stages': {stage: seconds}}.
+    """
+    _, function = BENCHMARKS[name]
+    best = None
+    for _ in range(repeat):
+        calibration = calibrate()
+        profiler = profiling.Profiler()
+        with tempfile.TemporaryDirectory(prefix='flt-bench-') as output_dir:
+            function(profiler, files, corpus_dir, output_dir)
+        seconds = sum(record.elapsed for record in profiler.records)
+        if best is None or seconds / calibration < best['seconds'] / best['calibration']:
+            stages = {}
+            for record in profiler.records:
+                for stage, stage_seconds in record.stages.items():
+                    stages[stage] = stages.get(stage, 0.0) + stage_seconds
+            best = {
+                'seconds': seconds,
+                'calibration': calibration,
+                'lines': sum(record.lines for record in profiler.records),
+                'stages': stages,
+            }
+    return best
+
+def run_benchmarks(names, corpus_dir, size, seed=1, repeat=3, file=None):
+    """Generates (or reuses) the corpora in corpus_dir and runs the benchmarks names."""
+    results = {
+        'size': size,
+        'seed': seed,
+        'generator': corpus.GENERATOR_VERSION,
+        'python': sys.version.split()[0],
+        'tools': {},
+    }
+    corpora = {}
+    for name in names:
+        form, _ = BENCHMARKS[name]
+        if form not in corpora:
+            directory = os.path.join(corpus_dir, form)
+            corpora[form] = (directory, corpus.ensure_corpus(directory, size, form, seed))
+        directory, files = corpora[form]
+        results['tools'][name] = run_benchmark(name, files, directory, repeat)
+        if file is not None:
+            measured = results['tools'][name]
+            print(f"{name:<14} {measured['seconds']:8.3f}s {measured['lines'] / measured['seconds']:12,.0f} lines/s", file=file)
+    return results
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares results with baseline, both as returned by run_benchmarks.
+    Returns a list of (tool, stage or None, seconds, baseline seconds or None,
+    relative change or None, regression) with the baseline times scaled to
+    the calibration of results.
+    """
+    thresholds = baseline.get('thresholds', {})
+    rows = []
+    for tool, measured in results['tools'].items():
+        limit = thresholds.get(tool, threshold)
+        base = baseline['tools'].get(tool)
+        if base is None or base['lines'] != measured['lines']:
+            # new tool or a different corpus: nothing to compare with
+            rows.append((tool, None, measured['seconds'], None, None, False))
+            continue
+        scale = measured['calibration'] / base['calibration']
+        expected = base['seconds'] * scale
+        change = measured['seconds'] / expected - 1
+        rows.append((tool, None, measured['seconds'], expected, change, change > limit))
+        for stage, seconds in sorted(measured['stages'].items(), key=lambda item: -item[1]):
+            base_seconds = base['stages'].get(stage)
+            if base_seconds is None:
+                rows.append((tool, stage, seconds, None, None, False))
+                continue
+            expected = base_seconds * scale
+            change = seconds / expected - 1 if expected else 0.0
+            checked = base_seconds >= MIN_STAGE_SHARE * base['seconds']
+            rows.append((tool, stage, seconds, expected, change, checked and change > limit))
+    return rows
+
+def print_comparison(rows, file=None):
+    file = file or sys.stdout
+    print(f"\n{'tool / stage':<24} {'time':>9} {'baseline':>9} {'change':>8}", file=file)
+    for tool, stage, seconds, expected, change, regression in rows:
+        label = tool if stage is None else '  ' + stage
+        if expected is None:
+            print(f"{label:<24} {seconds:8.3f}s {'-':>9} {'-':>8}", file=file)
+        else:
+            flag = '  REGRESSION' if regression else ''
+            print(f"{label:<24} {seconds:8.3f}s {expected:8.3f}s {100 * change:+7.1f}%{flag}", file=file)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the tools on a synthetic corpus and compare with a baseline.")
+    parser.add_argument("--size", type=corpus.parse_size, default=corpus.parse_size('2MB'), help="Size of each corpus, e.g. 500KB, 10MB, 2GB (default: 2MB).")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the corpus generator (default: %(default)s).")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per tool, the fastest counts (default: %(default)s).")
+    parser.add_argument("--tools", default=','.join(BENCHMARKS), help="Comma separated tools to run (default: all of %(default)s).")
+    parser.add_argument("--corpus-dir", help="Directory for the corpus, kept between runs (default: a temporary directory).")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file (default: baseline.json next to this script).")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown as a fraction, unless the baseline has one for the tool (default: %(default)s).")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline, keeping its thresholds and the tools not run.")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results to FILE.")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.tools.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown tools: {', '.join(unknown)}")
+
+    with contextlib.ExitStack() as stack:
+        corpus_dir = args.corpus_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix='flt-corpus-'))
+        results = run_benchmarks(names, corpus_dir, args.size, args.seed, args.repeat, file=sys.stdout)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    same_corpus = baseline is not None and all(baseline[key] == results[key] for key in ('size', 'seed', 'generator'))
+    if args.update_baseline:
+        if baseline is not None and 'thresholds' in baseline:
+            results['thresholds'] = baseline['thresholds']
+        if same_corpus:
+            # tools that were not run keep their measurements
+            results['tools'] = dict(baseline['tools'], **results['tools'])
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}.")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, run with --update-baseline to store one.")
+        return 0
+    if not same_corpus:
+        print("The baseline was measured on another corpus (size, seed or generator version), nothing to compare.")
+        return 0
+
+    rows = compare(results, baseline, args.threshold)
+    print_comparison(rows)
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above the threshold.")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import corpus
+import run_benchmarks
+
+def read_tree(paths):
+    contents = []
+    for path in paths:
+        with open(path) as f:
+            contents.append(f.read())
+    return contents
+
+class TestCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def directory(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_parse_size(self):
+        self.assertEqual(corpus.parse_size('500'), 500)
+        self.assertEqual(corpus.parse_size('20KB'), 20 * 1024)
+        self.assertEqual(corpus.parse_size('1.5mb'), 3 * 512 * 1024)
+        self.assertEqual(corpus.parse_size('2GB'), 2 * 1024 ** 3)
+        with self.assertRaises(ValueError):
+            corpus.parse_size('MB')
+
+    def test_reproducible(self):
+        first = corpus.generate(self.directory('a'), 40 * 1024, 'fixed', seed=3, file_size=16 * 1024)
+        second = corpus.generate(self.directory('b'), 40 * 1024, 'fixed', seed=3, file_size=16 * 1024)
+        other = corpus.generate(self.directory('c'), 40 * 1024, 'fixed', seed=4, file_size=16 * 1024)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(read_tree(first), read_tree(second))
+        self.assertNotEqual(read_tree(first), read_tree(other))
+        self.assertGreaterEqual(sum(os.path.getsize(path) for path in first), 40 * 1024)
+
+    def test_fixed_form(self):
+        text = ''.join(read_tree(corpus.generate(self.directory('fixed'), 20 * 1024, 'fixed')))
+        lines = text.splitlines()
+        for feature in ("C$OMP PARALLEL DO", "/8HCHECKING/", "COMMON /BLK", " 9000 FORMAT("):
+            self.assertIn(feature, text)
+        self.assertTrue(any(line.startswith('     &') for line in lines))
+        # only comments may go past column 72
+        self.assertTrue(all(len(line) <= 72 or '!' in line for line in lines))
+
+    def test_free_form(self):
+        text = ''.join(read_tree(corpus.generate(self.directory('free'), 20 * 1024, 'free'))).lower()
+        for feature in ("!$omp parallel do", "/8hchecking/", "common /blk", "implicit none"):
+            self.assertIn(feature, text)
+        self.assertIn(" &\n", text)
+
+    def test_ensure_corpus(self):
+        directory = self.directory('corpus')
+        files = corpus.ensure_corpus(directory, 10 * 1024, 'free')
+        mtimes = [os.stat(path).st_mtime_ns for path in files]
+        self.assertEqual(corpus.ensure_corpus(directory, 10 * 1024, 'free'), files)
+        self.assertEqual([os.stat(path).st_mtime_ns for path in files], mtimes)
+
+        bigger = corpus.ensure_corpus(directory, 40 * 1024, 'free', file_size=16 * 1024)
+        self.assertEqual(len(bigger), 3)
+        self.assertEqual(sorted(os.listdir(os.path.join(directory, 'dir000'))),
+                         sorted(os.path.basename(path) for path in bigger))
+
+class TestRunBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def results(self, seconds, calibration=0.1):
+        return {'size': 1, 'seed': 1, 'generator': corpus.GENERATOR_VERSION, 'tools': {
+            'ends': {'seconds': seconds, 'calibration': calibration, 'lines': 100,
+                     'stages': {'ends': seconds * 0.9, 'write': seconds * 0.1}},
+        }}
+
+    def test_compare(self):
+        baseline = self.results(1.0)
+        rows = run_benchmarks.compare(self.results(1.2), baseline, threshold=0.25)
+        self.assertEqual([(tool, stage) for tool, stage, *_ in rows],
+                         [('ends', None), ('ends', 'ends'), ('ends', 'write')])
+        self.assertFalse(any(row[5] for row in rows))
+
+        rows = run_benchmarks.compare(self.results(1.5), baseline, threshold=0.25)
+        # the write stage is too small to be checked
+        self.assertEqual([row[5] for row in rows], [True, True, False])
+        self.assertAlmostEqual(rows[0][4], 0.5)
+
+        # a machine twice as slow is no regression
+        rows = run_benchmarks.compare(self.results(2.0, calibration=0.2), baseline, threshold=0.25)
+        self.assertFalse(any(row[5] for row in rows))
+
+        # per tool thresholds in the baseline come first
+        baseline['thresholds'] = {'ends': 1.0}
+        rows = run_benchmarks.compare(self.results(1.5), baseline, threshold=0.25)
+        self.assertFalse(any(row[5] for row in rows))
+
+    def test_main(self):
+        baseline = os.path.join(self.tmpdir.name, 'baseline.json')
+        corpus_dir = os.path.join(self.tmpdir.name, 'corpus')
+        arguments = ['--size', '8KB', '--repeat', '1', '--corpus-dir', corpus_dir, '--baseline', baseline]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(run_benchmarks.main(arguments + ['--update-baseline']), 0)
+        with open(baseline) as f:
+            stored = json.load(f)
+        self.assertEqual(sorted(stored['tools']), sorted(run_benchmarks.BENCHMARKS))
+        for tool, measured in stored['tools'].items():
+            self.assertGreater(measured['lines'], 0, tool)
+            self.assertIn('read', measured['stages'], tool)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(run_benchmarks.main(arguments + ['--threshold', '100']), 0)
+
+        # a baseline ten times as fast
+        for measured in stored['tools'].values():
+            measured['seconds'] /= 10
+        with open(baseline, 'w') as f:
+            json.dump(stored, f)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(run_benchmarks.main(arguments + ['--tools', 'ends']), 1)
+        self.assertIn('REGRESSION', output.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,6 @@
+# Every tool directory links to the shared flt package (see flt/__init__.py),
+# its tests are collected once, from flt itself.
+
+def pytest_ignore_collect(collection_path):
+    if collection_path.is_symlink() and collection_path.name == 'flt':
+        return True
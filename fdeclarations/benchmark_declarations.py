@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the declaration splitting: a subroutine with one argument
+list and one declaration of N variables, continued over many lines, as in
+GAMESS. Times the joining of the continuation lines, the splitting of names
+and dimensions, and the whole wrapper.
+
+Usage: python benchmark_declarations.py [--variables N] [--repeat R]
+"""
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+
+from fdeclarations import (gen_removeLineContinuations, separate_names_and_dims, removeDimension,
+                           wrapFile)
+
+def make_lines(count, per_line=8):
+    """A subroutine with count arguments, declared in a single statement."""
+    names = [f"v{i}" for i in range(count)]
+    declared = [f"{name}(n, {i % 7 + 1})" if i % 3 == 0 else name for i, name in enumerate(names)]
+
+    def continued(start, items, end):
+        chunks = [', '.join(items[i:i + per_line]) for i in range(0, len(items), per_line)]
+        return ([start + chunks[0] + ", &\n"] + ["      " + chunk + ", &\n" for chunk in chunks[1:-1]]
+                + ["      " + chunks[-1] + end])
+
+    lines = continued("subroutine big(", names, ")\n")
+    lines.append("  implicit none\n")
+    lines += continued("  double precision ", declared, "\n")
+    lines += ["  integer n\n", "end subroutine big\n"]
+    return lines
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the declaration splitting on one huge declaration.")
+    parser.add_argument("--variables", type=int, default=5000, help="Number of variables (default: %(default)s).")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs, the best one counts (default: %(default)s).")
+    args = parser.parse_args()
+
+    lines = make_lines(args.variables)
+    statements = list(gen_removeLineContinuations(lines))
+    declaration = statements[2].split(None, 2)[2]  # the variables of 'double precision ...'
+
+    elapsed = best_time(lambda: list(gen_removeLineContinuations(lines)), args.repeat)
+    print(f"gen_removeLineContinuations: {elapsed * 1e3:8.2f} ms ({len(lines)} lines)")
+    elapsed = best_time(lambda: separate_names_and_dims(declaration), args.repeat)
+    print(f"separate_names_and_dims:     {elapsed * 1e3:8.2f} ms ({args.variables} variables, {len(declaration)} characters)")
+    elapsed = best_time(lambda: removeDimension(declaration), args.repeat)
+    print(f"removeDimension:             {elapsed * 1e3:8.2f} ms")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "big.f90")
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            elapsed = best_time(lambda: wrapFile(path), args.repeat)
+        print(f"wrapFile:                    {elapsed * 1e3:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -35,11 +35,23 @@ Furthermore a conversion to the Fortran 90 declaration style is performed.
 
 Usage: python fdeclarations.py file.f90 > output.f90
 
+All subroutines of many files or whole directory trees, with a manifest.json
+listing the wrappers:
+
+       python fdeclarations.py -o wrappers [--per-unit] [-j N] file_or_directory ...
+
+Every declared variable of all subroutines as JSON Lines, one record per
+variable with its subroutine, declaration, dimensions, initialiser and
+whether it is an argument or a parameter:
+
+       python fdeclarations.py --symbols symbols.jsonl [-j N] file_or_directory ...
+
 Restrictions:
 
 *) Assumes free source format
 *) Assumes 'implicit none'
-*) Only one subroutine per file allowed
+*) Only one subroutine per file allowed, unless the wrappers are written
+*) to a directory (-o): then every subroutine of every file gets one
 
 *) There might be problems when working with Fortran functions
 Workaround: replace 'function' keyword temporarily with 'subroutine'
@@ -60,11 +72,17 @@ https://www.github.com/ylikx/
 
 """
 
-from __future__ import print_function
-
+import argparse
+import json
+import os
 import re
 import sys
 
+from flt.batch import find_source_files, mirror_path, read_text, run_pipeline, run_tasks, stream_tasks, text_lines
+from flt.fileio import update_file
+from flt.lexer import split_comment
+from flt import profiling
+
 TYPEKEYS = ['integer', 'logical', 'real', 'complex',
             'double precision', 'double complex', 'character', 'doubleprecision', 'doublecomplex']
 
@@ -109,23 +127,10 @@ class FortranSubroutineHeader:
 def gen_removeComments(stream):
     """Remove Fortran comments from stream considering strings"""
 
-
     for line in stream:
-        string_delim = None
-        result_line = ''
-
-        for ch in line:
-            if ch in ["'", '"']:
-                if not string_delim:
-                    string_delim = ch
-                elif string_delim == ch:
-                    string_delim = None
-
-            if ch == '!' and not string_delim:
-                result_line += '\n'
-                break
-
-            result_line += ch
+        result_line, comment = split_comment(line)
+        if comment:
+            result_line += '\n'
 
         if result_line.isspace():
             continue
@@ -135,17 +140,23 @@ def gen_removeComments(stream):
 
 #------------------------------------------------------------------------------
 def gen_removeLineContinuations(stream):
-    result_line = ''
+    """Joins continued lines (ending with '&') with the line after them."""
+    # the pieces of a statement are joined once at its end, a statement of
+    # many continuation lines is not copied for each of them
+    pieces = []
 
     for line in stream:
-        if re.search(r'&\s*$', line):
-            result_line = result_line.rstrip() + line.rstrip().rstrip('&').lstrip()
+        stripped = line.rstrip()
+        if stripped.endswith('&'):
+            if pieces:
+                pieces[-1] = pieces[-1].rstrip()
+            pieces.append(stripped.rstrip('&').lstrip())
             continue
         else:
-            result_line += line
+            pieces.append(line)
 
-        yield result_line
-        result_line = ''
+        yield ''.join(pieces)
+        pieces = []
 
 #------------------------------------------------------------------------------
 def gen_removeEmptyLines(stream):
@@ -157,17 +168,26 @@ def gen_removeEmptyLines(stream):
         yield line
 
 
+# a declaration starts with one of the TYPEKEYS, the longest alternatives
+# first, with any blanks between 'double' and 'precision'/'complex'
+DECLARATION_TYPE = re.compile(r'\s*(' + '|'.join(re.escape(key).replace(r'\ ', r'\s+')
+                                                for key in sorted(TYPEKEYS, key=len, reverse=True))
+                              + r')\b', re.IGNORECASE)
+
 #TODO integer function etc... problematic
 # Misinterpretes function declaration
 #------------------------------------------------------------------------------
-def isDeclarationLine(line):
+def declarationType(line):
+    """Returns the entry of TYPEKEYS that line starts with, or None."""
+    match = DECLARATION_TYPE.match(line)
+    if match is None:
+        return None
+    return ' '.join(match.group(1).lower().split())
 
-    for ty in TYPEKEYS:
-        # search for whole words only
-        if re.search(r'\b'+ty+r'\b', line, re.IGNORECASE):
-            return True
+def isDeclarationLine(line):
+    return DECLARATION_TYPE.match(line) is not None
 
-    return False
+_PARENTHESES = re.compile(r'[()]')
 
 #------------------------------------------------------------------------------
 def separate_names_and_dims(varstr):
@@ -175,52 +195,58 @@ def separate_names_and_dims(varstr):
     names = []
     dims = []
 
-    namestr = ''
-    dimstr = ''
-
+    # the text between parentheses is taken as one slice: outside of them it
+    # is split at the commas into names, inside it goes to the dimensions
+    namestr = []
+    dimstr = []
     num_par = 0
+    pos = 0
+    end = len(varstr)
+
+    # the '(' added at the end stops the loop after the text behind the last parenthesis
+    for match in _PARENTHESES.finditer(varstr + '('):
+        start = match.start()
+        if num_par == 0:
+            outside = varstr[pos:start].split(',')
+            namestr.append(outside[0])
+            if len(outside) > 1:
+                # new variables
+                names.append(''.join(namestr).strip())
+                dims.append(''.join(dimstr).strip())
+                for name in outside[1:-1]:
+                    names.append(name.strip())
+                    dims.append('')
+                namestr = [outside[-1]]
+                dimstr = []
+        else:
+            dimstr.append(varstr[pos:start])
+
+        if start == end:
+            break
+        ch = match.group()
+        dimstr.append(ch)
+        num_par += 1 if ch == '(' else -1
+        pos = start + 1
 
-    for ch in varstr:
-
-        if not ch in '()':
-            if num_par == 0:
-                namestr += ch
-            else:
-                dimstr += ch
-        elif ch == '(':
-            num_par += 1
-            dimstr += ch
-        elif ch == ')':
-            num_par -= 1
-            dimstr += ch
-
-        if ch == ',' and num_par == 0:
-            namestr = namestr.replace(',', '')
-            # new variable
-            names.append(namestr.strip())
-            dims.append(dimstr.strip())
-            namestr = ''
-            dimstr = ''
-
-    names.append(namestr.strip())
-    dims.append(dimstr.strip())
+    names.append(''.join(namestr).strip())
+    dims.append(''.join(dimstr).strip())
 
     return names, dims
 
 #------------------------------------------------------------------------------
 def removeDimension(x):
     """Removes dimension list. E.g.: "var (n,m), x(5)" -> "var, x" """
-    result = ''
+    parts = []
     num_par = 0
-    for ch in x:
-        if not ch in '()':
-            if num_par == 0:
-                result += ch
-        elif ch == '(':
-            num_par += 1
-        elif ch == ')':
-            num_par -= 1
-    return result
+    pos = 0
+    for match in _PARENTHESES.finditer(x):
+        if num_par == 0:
+            parts.append(x[pos:match.start()])
+        pos = match.end()
+        num_par += 1 if match.group() == '(' else -1
+    if num_par == 0:
+        parts.append(x[pos:])
+    return ''.join(parts)
 
 #------------------------------------------------------------------------------
 def getVarsF90Style(line):
@@ -231,19 +257,19 @@ def getVarsF90Style(line):
 
 #------------------------------------------------------------------------------
 def getVarsF77Style(line):
+    """Splits "real*8 x, y(n)" into the declaration "real*8" and "x, y(n)"."""
     #([*][0-9]+)? is to support stuff like real*8
-    #varstr = re.sub('('+'|'.join(TYPEKEYS) + r')([*][0-9]+)?.*?', '', line, re.IGNORECASE).strip()
-    # deal also with stuff like real(8)
-    #print re.match('('+'|'.join(TYPEKEYS) + r')(([*][0-9]+)|\(.+?\))?.*?', line, re.IGNORECASE).group(0)
-    #varstr = re.sub('('+'|'.join(TYPEKEYS) + r')(([*][0-9]+)|\(.+?\))?', '', line, re.IGNORECASE).strip()
-    #print varstr
-    #ind = line.find(varstr)
-    #decl = line[:ind].strip()
-    sline = line.split()
-    decl = sline.pop(0).strip()
-    if decl.lower() == 'double':
-        decl += ' ' + sline.pop(0).strip()
-    varstr = ' '.join(sline)    
+    # real(8) or real * 8 (with blanks) are not supported
+    match = DECLARATION_TYPE.match(line)
+    if match is None:
+        sline = line.split()
+        return sline.pop(0).strip(), ' '.join(sline)
+
+    # the type as one word with single blanks, and the kind or length written right after it
+    rest = line[match.end():]
+    kind = rest.split(None, 1)[0] if rest[:1] and not rest[:1].isspace() else ''
+    decl = ' '.join(match.group(1).split()) + kind
+    varstr = ' '.join(rest[len(kind):].split())
 
     return decl, varstr
 
@@ -293,88 +319,381 @@ def getArgumentList(argline):
 #TODO: store declaration line, extract type info, save dimension info
 
 #------------------------------------------------------------------------------
-def printWrapperCode(subname, arglist, varlist):
-    print("!" + "-"*79)
-    print("!> A wrapper for the subroutine " + subname)
+def wrapperCode(subname, arglist, varlist):
+    """Returns the lines of the wrapper code for a subroutine."""
+    lines = []
+    lines.append("!" + "-"*79)
+    lines.append("!> A wrapper for the subroutine " + subname)
     #for entry in arglist:
     #    print "!> @param        " + entry
-    print("subroutine " + subname + "_wrapper(" + ','.join(arglist) + ')')
-    print()
-    print("  implicit none")
-    print()
+    lines.append("subroutine " + subname + "_wrapper(" + ','.join(arglist) + ')')
+    lines.append("")
+    lines.append("  implicit none")
+    lines.append("")
     # parameters first
-    print( "  ! Parameters")
+    lines.append("  ! Parameters")
     for entry in varlist:
         if not entry.is_argument and entry.is_parameter:
-            print ("  " + entry.getDeclString())
+            lines.append("  " + entry.getDeclString())
     # print scalar arguments
-    print()
-    print( "  ! Arguments")
+    lines.append("")
+    lines.append("  ! Arguments")
     for entry in varlist:
         if entry.is_argument:
-            print ("  " + entry.getDeclString())
+            lines.append("  " + entry.getDeclString())
     # print array arguments
     #print
     #print "  ! Array arguments"
     #for entry in varlist:
     #    if entry.is_argument and entry.dim:
     #        print "  " + entry.getDeclString()
-    print()
-    print("  ! Former local variables of " + subname)
+    lines.append("")
+    lines.append("  ! Former local variables of " + subname)
     for entry in varlist:
         if not entry.is_argument:
-            print("  ! " + entry.getDeclString())
-    
-    print()
-    print ("  call " + subname + "(" + ','.join(arglist) + ')')
-    print()
-    print("end subroutine")
+            lines.append("  ! " + entry.getDeclString())
 
-if __name__ == "__main__":
-
-    f = open(sys.argv[1], 'r')
-
-    xf = gen_removeEmptyLines(gen_removeLineContinuations(gen_removeComments(f)))
-
-    class NoArgList:
-        pass
-
-    # get argument list first:
-    args = None
+    lines.append("")
+    lines.append("  call " + subname + "(" + ','.join(arglist) + ')')
+    lines.append("")
+    lines.append("end subroutine")
+    return [line + '\n' for line in lines]
 
-    for line in xf:
-        temp = getArgumentList(line)
-        if temp != None:
-            subname, args = temp
-            break
-
-    if not args:
-        print("ERROR: no subroutine header found!")
-        raise NoArgList
-
-    vardict = {}
-    varlist = []
+def printWrapperCode(subname, arglist, varlist):
+    sys.stdout.writelines(wrapperCode(subname, arglist, varlist))
 
-    for line in xf:
-        if isDeclarationLine(line):
-            decl, names, dims, initstr = getVariablenames(line)
-            #print getVariablenames(line)
-            for name, dim in zip(names, dims):
-                entry = FortranVariable(name, decl, dim, initstr, is_argument=False)
-                vardict[name.lower()] = entry
-                varlist.append(entry)
+class NoArgList(Exception):
+    pass
 
-        if "end subroutine" in line:
-            break
+class UndeclaredArgument(Exception):
+    def __init__(self, subname, arg):
+        Exception.__init__(self, "argument '%s' of %s is not declared" % (arg, subname))
+        self.subname = subname
+        self.arg = arg
 
-    #print varlist
+# 'end' or 'end subroutine [name]', the end of a subroutine
+END_UNIT = re.compile(r'^\s*end\s*(subroutine\b.*)?$', re.IGNORECASE)
 
-    # Flag arguments
-    for arg in args:
-        vardict[arg.lower()].is_argument = True
+class FortranSubroutine:
+    """The arguments and declarations of one subroutine."""
 
+    def __init__(self, name, arglist, number):
+        self.name = name
+        self.arglist = arglist
+        self.number = number  # counting the subroutines of the file from 1
+        self.varlist = []
+        self.vardict = {}
+
+    def parseDeclarations(self, line):
+        """Returns a FortranVariable for every variable declared in line, arguments flagged."""
+        decl, names, dims, initstr = getVariablenames(line)
+        argnames = set(arg.lower() for arg in self.arglist)
+        return [FortranVariable(name, decl, dim, initstr, is_argument=name.lower() in argnames)
+                for name, dim in zip(names, dims)]
+
+    def addDeclarations(self, line):
+        for entry in self.parseDeclarations(line):
+            self.vardict[entry.name.lower()] = entry
+            self.varlist.append(entry)
+
+    def flagArguments(self):
+        """Marks the declarations of the arguments, raises UndeclaredArgument for a missing one."""
+        for arg in self.arglist:
+            if not arg:
+                continue  # subroutine without arguments
+            if arg.lower() not in self.vardict:
+                raise UndeclaredArgument(self.name, arg)
+            self.vardict[arg.lower()].is_argument = True
+
+    def wrapperCode(self):
+        return wrapperCode(self.name, self.arglist, self.varlist)
 
-    f.close()
+#------------------------------------------------------------------------------
+def gen_declarationLines(stream):
+    """
+    Yields (FortranSubroutine, line) for every declaration line of every
+    subroutine in a preprocessed stream, and (FortranSubroutine, None) at
+    the end of each. The subroutines are yielded empty.
+    """
+    unit = None
+    number = 0
+    for line in stream:
+        if unit is None:
+            temp = getArgumentList(line)
+            if temp != None:
+                number += 1
+                unit = FortranSubroutine(temp[0], temp[1], number)
+            continue
 
-    printWrapperCode(subname, args, varlist)
+        if END_UNIT.match(line):
+            yield unit, None
+            unit = None
+        elif isDeclarationLine(line):
+            yield unit, line
+
+    # missing end at the end of the file
+    if unit is not None:
+        yield unit, None
+
+def gen_subroutines(stream):
+    """Yields a FortranSubroutine for every subroutine in a preprocessed stream."""
+    for unit, line in gen_declarationLines(stream):
+        if line is None:
+            yield unit
+        else:
+            unit.addDeclarations(line)
+
+def gen_variables(stream):
+    """
+    Yields (FortranSubroutine, FortranVariable) for every variable declared in
+    a subroutine of a preprocessed stream, as soon as it is parsed; nothing
+    is kept, the varlist of the subroutines stays empty.
+    """
+    for unit, line in gen_declarationLines(stream):
+        if line is not None:
+            for entry in unit.parseDeclarations(line):
+                yield unit, entry
+
+def preprocess(f, filename):
+    """Returns the statements read from the open file f, without comments and continuations."""
+    xf = gen_removeEmptyLines(gen_removeLineContinuations(gen_removeComments(profiling.source(f, filename))))
+    return profiling.stage('preprocess', xf)
+
+def readSubroutines(f, filename):
+    """Yields a FortranSubroutine for every subroutine read from the open file f."""
+    return gen_subroutines(preprocess(f, filename))
+
+def wrapFile(filename):
+    """Prints the wrapper code for the (first) subroutine in file filename."""
+
+    with profiling.timing('declarations'):
+        with open(filename, 'r') as f:
+            unit = next(readSubroutines(f, filename), None)
+
+        if unit is None:
+            raise NoArgList(filename)
+
+        unit.flagArguments()
+        printWrapperCode(unit.name, unit.arglist, unit.varlist)
+
+# suffixes picked up when a directory tree is wrapped
+FREE_FORM_SUFFIXES = ['.f90', '.F90']
+
+MANIFEST = 'manifest.json'
+
+def wrapper_paths(output_base, units, per_unit):
+    """
+    Returns the wrapper file of every unit: output_base + '_wrappers.f90' for
+    all of them, or output_base/<name>_wrapper.f90 for each with per_unit
+    (with the number of the unit added to a repeated name).
+    """
+    if not per_unit:
+        return [output_base + '_wrappers.f90'] * len(units)
+    paths = []
+    seen = set()
+    for unit in units:
+        name = unit.name.lower()
+        if name in seen:
+            name += '_%d' % unit.number
+        seen.add(name)
+        paths.append(os.path.join(output_base, name + '_wrapper.f90'))
+    return paths
+
+def wrapSubroutines(filename, output_base, per_unit=False):
+    """
+    Writes the wrappers for all subroutines in file filename, to one file or
+    to a file per subroutine (see wrapper_paths). Returns the manifest
+    entries of the file: a dict per subroutine, with an 'error' instead of
+    an 'output' for those that could not be wrapped.
+    """
+    with profiling.timing('declarations'):
+        with open(filename, 'r') as f:
+            entries, outputs = wrapperOutputs(readSubroutines(f, filename), filename, output_base, per_unit)
+    writeWrappers(outputs)
+    return entries
+
+def wrapperOutputs(units, filename, output_base, per_unit=False):
+    """
+    Returns the manifest entries of the subroutines units of file filename
+    (see wrapSubroutines) and the lines of each wrapper file.
+    """
+    units = list(units)
+    entries = []
+    outputs = {}  # wrapper file -> lines
+    for unit, path in zip(units, wrapper_paths(output_base, units, per_unit)):
+        entry = {'source': filename, 'subroutine': unit.name, 'number': unit.number}
+        try:
+            unit.flagArguments()
+        except UndeclaredArgument as e:
+            entry['error'] = str(e)
+        else:
+            entry['output'] = path
+            entry['arguments'] = len([arg for arg in unit.arglist if arg])
+            entry['locals'] = len([var for var in unit.varlist if not var.is_argument])
+            lines = outputs.setdefault(path, [])
+            if lines:
+                lines.append('\n')
+            lines += unit.wrapperCode()
+        entries.append(entry)
+    return entries, outputs
+
+def writeWrappers(outputs):
+    """Writes the wrapper files of wrapperOutputs."""
+    for path, lines in outputs.items():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        update_file(lines, path)
+
+def _wrap_file_job(job):
+    filename, output_base, per_unit = job
+    return wrapSubroutines(filename, output_base, per_unit)
+
+# the stages of a pipelined wrap_tree, see flt.batch.run_pipeline
+def _read_job(job):
+    return read_text(job[0])
+
+def _wrap_text_job(job, text):
+    filename, output_base, per_unit = job
+    return wrapperOutputs(readSubroutines(text_lines(text), filename), filename, output_base, per_unit)
+
+def _write_wrappers_job(job, result):
+    entries, outputs = result
+    writeWrappers(outputs)
+    return entries
+
+def source_files(paths, suffixes=FREE_FORM_SUFFIXES):
+    """Returns (file, root) for the files paths and the files below the directories paths."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [(filename, path) for filename in find_source_files(path, suffixes)]
+        else:
+            files.append((path, os.path.dirname(path)))
+    return files
+
+def wrap_tree(paths, output_dir, per_unit=False, suffixes=FREE_FORM_SUFFIXES, jobs=None, profiler=None):
+    """
+    Writes the wrappers of all subroutines in the files and directory trees
+    paths to output_dir, mirroring the layout of each tree, using a pool of
+    worker processes. Writes and returns the manifest: {'units': [...],
+    'errors': [...]} with the entries of wrapSubroutines in the order of
+    the files. A flt.profiling.Profiler measures every file, otherwise the
+    files are read and written by threads while the workers wrap others
+    (flt.batch.run_pipeline).
+    """
+    tasks = []
+    for filename, root in source_files(paths, suffixes):
+        output_base = os.path.splitext(mirror_path(filename, root, output_dir, makedirs=False))[0]
+        tasks.append((filename, output_base, per_unit))
+
+    order = {task[0]: index for index, task in enumerate(tasks)}
+    weight = lambda task: os.path.getsize(task[0])
+    if profiler is None:
+        results = run_pipeline(_read_job, _wrap_text_job, _write_wrappers_job, tasks, jobs, weight=weight,
+                               stream=_wrap_file_job)
+    else:
+        results = run_tasks(_wrap_file_job, tasks, jobs, weight=weight, profiler=profiler)
+    entries = [entry for entries in results for entry in entries]
+    entries.sort(key=lambda entry: (order[entry['source']], entry['number']))
+
+    manifest = {
+        'units': [entry for entry in entries if 'output' in entry],
+        'errors': [entry for entry in entries if 'error' in entry],
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    update_file([json.dumps(manifest, indent=1), '\n'], os.path.join(output_dir, MANIFEST))
+    return manifest
+
+def symbolRecords(filename):
+    """Yields a JSON line for every variable declared in a subroutine of file filename."""
+    with profiling.timing('declarations'):
+        with open(filename, 'r') as f:
+            yield from gen_symbolRecords(f, filename)
+
+def gen_symbolRecords(lines, filename):
+    """Yields a JSON line for every variable declared in a subroutine of the lines of file filename."""
+    for unit, entry in gen_variables(preprocess(lines, filename)):
+        yield json.dumps({
+            'source': filename,
+            'subroutine': unit.name,
+            'number': unit.number,
+            'name': entry.name,
+            'decl': entry.decl,
+            'dim': entry.dim,
+            'initialiser': entry.initialiser,
+            'is_argument': entry.is_argument,
+            'is_parameter': entry.is_parameter,
+        }) + '\n'
+
+def gen_symbols_tree(paths, suffixes=FREE_FORM_SUFFIXES, jobs=None, profiler=None):
+    """
+    Yields the JSON lines of symbolRecords for all files and directory trees
+    paths, in the order of the files. A pool of worker processes parses the
+    files and sends their records in batches, of which a bounded number is
+    held in memory (flt.batch.stream_tasks); with a single file or jobs 1 the
+    records are streamed as they are parsed. A flt.profiling.Profiler
+    measures every file.
+    """
+    files = [filename for filename, root in source_files(paths, suffixes)]
+    yield from stream_tasks(symbolRecords, files, jobs, profiler=profiler)
+
+def dump_symbols(paths, output, suffixes=FREE_FORM_SUFFIXES, jobs=None, profiler=None):
+    """
+    Writes the JSON lines of all variables in the files and directory trees
+    paths to the file output ('-' for stdout), one self-contained record per
+    line, so that dumps can be concatenated. Returns the number of records.
+    """
+    count = 0
+    def counted(lines):
+        nonlocal count
+        for line in lines:
+            count += 1
+            yield line
+
+    lines = counted(gen_symbols_tree(paths, suffixes, jobs, profiler))
+    if output == '-':
+        sys.stdout.writelines(lines)
+    else:
+        update_file(lines, output)
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a wrapper that separates the arguments of a subroutine from its local variables.")
+    parser.add_argument("files", nargs='+', help="Fortran files (free form), one subroutine each; with -o or --symbols also directory trees, any number of subroutines.")
+    parser.add_argument("-o", "--output-dir", help="Write the wrappers of all subroutines to this directory, with a %s listing them." % MANIFEST)
+    parser.add_argument("--per-unit", action="store_true", help="With -o, write a file per subroutine instead of one per source file.")
+    parser.add_argument("--symbols", metavar="FILE", help="Write every declared variable of all subroutines as a line of JSON to FILE ('-' for stdout).")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="With -o or --symbols, number of worker processes (default: number of cores).")
+    parser.add_argument("--suffix", action="append", dest="suffixes", help="With -o or --symbols, file suffix to look for in directory trees, may be repeated (default: %s)." % ' '.join(FREE_FORM_SUFFIXES))
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    profiler = profiling.from_args(args)
+
+    status = 0
+    if args.symbols:
+        count = dump_symbols(args.files, args.symbols, args.suffixes or FREE_FORM_SUFFIXES,
+                             jobs=args.jobs, profiler=profiler)
+        if args.symbols != '-':
+            print("%d symbols written to %s." % (count, args.symbols))
+    if args.output_dir:
+        manifest = wrap_tree(args.files, args.output_dir, args.per_unit, args.suffixes or FREE_FORM_SUFFIXES,
+                             jobs=args.jobs, profiler=profiler)
+        for entry in manifest['errors']:
+            print("ERROR: %s: %s" % (entry['source'], entry['error']))
+        print("%d wrappers written to %s." % (len(manifest['units']), args.output_dir))
+        status = 1 if manifest['errors'] else 0
+    elif not args.symbols:
+        for filename in args.files:
+            try:
+                profiling.call(profiler, wrapFile, filename)
+            except NoArgList:
+                print("ERROR: no subroutine header found!")
+                status = 1
+            except UndeclaredArgument as e:
+                print("ERROR: %s: %s" % (filename, e))
+                status = 1
+    if profiler is not None:
+        profiler.report()
+    return status
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import fdeclarations
+
+SINGLE = """\
+subroutine solve(a, n, ierr)
+  implicit none
+  integer, parameter :: mx = 10
+  integer n, ierr ! sizes
+  double precision a(n), &
+                   work(mx)
+  work = 0.0d0
+end subroutine solve
+"""
+
+EXPECTED = """\
+!-------------------------------------------------------------------------------
+!> A wrapper for the subroutine solve
+subroutine solve_wrapper(a,n,ierr)
+
+  implicit none
+
+  ! Parameters
+  integer, parameter :: mx =10
+
+  ! Arguments
+  integer :: n
+  integer :: ierr
+  double precision, dimension(n) :: a
+
+  ! Former local variables of solve
+  ! integer, parameter :: mx =10
+  ! double precision, dimension(mx) :: work
+
+  call solve(a,n,ierr)
+
+end subroutine
+"""
+
+MULTI = """\
+subroutine first(x)
+  implicit none
+  real x
+  x = 1.0
+end
+
+SUBROUTINE SECOND(N, Y)
+  IMPLICIT NONE
+  INTEGER N
+  REAL Y(N)
+END SUBROUTINE SECOND
+
+subroutine broken(z)
+  implicit none
+end subroutine broken
+
+subroutine first(x)
+  implicit none
+  integer x
+end subroutine
+"""
+
+class TestFdeclarations(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sources = os.path.join(self.tmpdir.name, 'src')
+        os.makedirs(os.path.join(self.sources, 'sub'))
+        self.single = self.write('single.f90', SINGLE)
+        self.multi = self.write(os.path.join('sub', 'multi.f90'), MULTI)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.sources, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_wrap_file(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            fdeclarations.wrapFile(self.single)
+        self.assertEqual(output.getvalue(), EXPECTED)
+
+        # only the first subroutine
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            fdeclarations.wrapFile(self.multi)
+        self.assertEqual(output.getvalue().count('_wrapper('), 1)
+
+        with self.assertRaises(fdeclarations.NoArgList):
+            fdeclarations.wrapFile(self.write('none.f90', "x = 1\n"))
+
+    def test_declaration_type(self):
+        self.assertEqual(fdeclarations.declarationType("  DOUBLE   PRECISION a\n"), 'double precision')
+        self.assertEqual(fdeclarations.declarationType("doublecomplex z\n"), 'doublecomplex')
+        self.assertEqual(fdeclarations.declarationType("real*8 x\n"), 'real')
+        self.assertEqual(fdeclarations.declarationType("character(len=8) :: s\n"), 'character')
+        for line in ["x = real(i)\n", "implicit double precision (a-h)\n", "realx = 1\n", "call f(integer)\n"]:
+            self.assertIsNone(fdeclarations.declarationType(line), line)
+            self.assertFalse(fdeclarations.isDeclarationLine(line), line)
+
+        self.assertEqual(fdeclarations.getVarsF77Style("  real*8  a,   b(n)\n"), ('real*8', 'a, b(n)'))
+        self.assertEqual(fdeclarations.getVarsF77Style("DOUBLE  PRECISION A\n"), ('DOUBLE PRECISION', 'A'))
+        self.assertEqual(fdeclarations.getVarsF77Style("character*(*) s\n"), ('character*(*)', 's'))
+
+    def test_separate_names_and_dims(self):
+        self.assertEqual(fdeclarations.separate_names_and_dims("var (n,m), x(5)"), (['var', 'x'], ['(n,m)', '(5)']))
+        self.assertEqual(fdeclarations.separate_names_and_dims(" a, b ,c"), (['a', 'b', 'c'], ['', '', '']))
+        self.assertEqual(fdeclarations.separate_names_and_dims("a(f(1), 2) b, c("), (['a b', 'c'], ['(f(1), 2)', '(']))
+        self.assertEqual(fdeclarations.separate_names_and_dims("a), b, c"), (['a'], ['), b, c']))
+        self.assertEqual(fdeclarations.removeDimension("var (n,m), x(5)"), "var , x")
+        self.assertEqual(fdeclarations.removeDimension("a), b"), "a")
+
+    def test_line_continuations(self):
+        lines = ["integer a, &\n", "   &\n", "     b,  &  \n", "  c ! x\n", "real d\n"]
+        self.assertEqual(list(fdeclarations.gen_removeLineContinuations(lines)),
+                         ["integer a,b,    c ! x\n", "real d\n"])
+
+    def test_subroutines(self):
+        with open(self.multi) as f:
+            units = list(fdeclarations.readSubroutines(f, self.multi))
+        self.assertEqual([(unit.name, unit.number) for unit in units],
+                         [('first', 1), ('SECOND', 2), ('broken', 3), ('first', 4)])
+        self.assertEqual([var.name for var in units[1].varlist], ['N', 'Y'])
+        with self.assertRaises(fdeclarations.UndeclaredArgument):
+            units[2].flagArguments()
+
+    def test_wrap_tree(self):
+        output_dir = os.path.join(self.tmpdir.name, 'out')
+        manifest = fdeclarations.wrap_tree([self.sources], output_dir, jobs=1)
+        with open(os.path.join(output_dir, fdeclarations.MANIFEST)) as f:
+            self.assertEqual(json.load(f), manifest)
+
+        single = os.path.join(output_dir, 'single_wrappers.f90')
+        multi = os.path.join(output_dir, 'sub', 'multi_wrappers.f90')
+        self.assertEqual([(entry['subroutine'], entry['output']) for entry in manifest['units']],
+                         [('solve', single), ('first', multi), ('SECOND', multi), ('first', multi)])
+        self.assertEqual(manifest['units'][0]['arguments'], 3)
+        self.assertEqual(manifest['units'][0]['locals'], 2)
+        self.assertEqual([(entry['subroutine'], entry['source']) for entry in manifest['errors']],
+                         [('broken', self.multi)])
+        with open(single) as f:
+            self.assertEqual(f.read(), EXPECTED)
+        with open(multi) as f:
+            self.assertEqual(f.read().count('_wrapper('), 3)
+
+        # unchanged wrappers are not written again
+        mtime = os.stat(single).st_mtime_ns
+        fdeclarations.wrap_tree([self.sources], output_dir, jobs=1)
+        self.assertEqual(os.stat(single).st_mtime_ns, mtime)
+
+    def test_per_unit(self):
+        output_dir = os.path.join(self.tmpdir.name, 'out')
+        manifest = fdeclarations.wrap_tree([self.multi], output_dir, per_unit=True, jobs=2)
+        self.assertEqual([os.path.relpath(entry['output'], output_dir) for entry in manifest['units']],
+                         [os.path.join('multi', 'first_wrapper.f90'),
+                          os.path.join('multi', 'second_wrapper.f90'),
+                          os.path.join('multi', 'first_4_wrapper.f90')])
+        for entry in manifest['units']:
+            with open(entry['output']) as f:
+                self.assertEqual(f.read().count('_wrapper('), 1)
+
+    def test_symbols(self):
+        records = [json.loads(line) for line in fdeclarations.symbolRecords(self.single)]
+        self.assertEqual([(record['name'], record['is_argument'], record['is_parameter']) for record in records],
+                         [('mx', False, True), ('n', True, False), ('ierr', True, False),
+                          ('a', True, False), ('work', False, False)])
+        self.assertEqual(records[0], {'source': self.single, 'subroutine': 'solve', 'number': 1,
+                                      'name': 'mx', 'decl': 'integer, parameter', 'dim': '',
+                                      'initialiser': '10', 'is_argument': False, 'is_parameter': True})
+        self.assertEqual(records[3]['dim'], '(n)')
+
+        # a tree in file order, the same with any number of workers
+        output = os.path.join(self.tmpdir.name, 'symbols.jsonl')
+        self.assertEqual(fdeclarations.dump_symbols([self.sources], output, jobs=2), 9)
+        with open(output) as f:
+            lines = f.readlines()
+        self.assertEqual(lines, list(fdeclarations.gen_symbols_tree([self.sources], jobs=1)))
+        profiler = fdeclarations.profiling.Profiler()
+        self.assertEqual(lines, list(fdeclarations.gen_symbols_tree([self.sources], jobs=2, profiler=profiler)))
+        self.assertEqual(len(profiler.records), 2)
+        self.assertEqual([json.loads(line)['source'] for line in lines], [self.single] * 5 + [self.multi] * 4)
+        self.assertEqual([(record['subroutine'], record['number'], record['name'], record['is_argument'])
+                          for record in map(json.loads, lines[5:])],
+                         [('first', 1, 'x', True), ('SECOND', 2, 'N', True), ('SECOND', 2, 'Y', True),
+                          ('first', 4, 'x', True)])
+
+    def test_main(self):
+        output_dir = os.path.join(self.tmpdir.name, 'out')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(fdeclarations.main(['-o', output_dir, '-j', '1', self.single]), 0)
+            self.assertEqual(fdeclarations.main(['-o', output_dir, '--per-unit', self.sources]), 1)
+        self.assertIn("argument 'z' of broken is not declared", output.getvalue())
+        self.assertIn("4 wrappers written", output.getvalue())
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(fdeclarations.main(['--symbols', '-', '-j', '1', self.sources]), 0)
+        self.assertEqual(len(output.getvalue().splitlines()), 9)
+
+        # an implicitly typed argument stops neither the run nor the files after it
+        broken = self.write('broken.f90', "subroutine broken(z)\n  implicit none\nend\n")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(fdeclarations.main([broken, self.single]), 1)
+        self.assertIn("ERROR: %s: argument 'z' of broken is not declared" % broken, output.getvalue())
+        self.assertIn(EXPECTED, output.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
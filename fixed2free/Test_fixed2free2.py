@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
 from fixed2free2 import *
 try:
     from StringIO import StringIO
@@ -234,6 +236,116 @@ def dotest(self, instr, solution):
 
 def makeTest(instr, solution):
     return lambda self: dotest(self, instr, solution)
+
+def reference_extract_inline_comment(code):
+    """Character by character scanner that extract_inline_comment replaced."""
+    stringmode = False
+    stringchar = ""
+
+    for column, character in enumerate(code):
+        is_string_delimiter = (character == "'" or character == '"')
+        if not stringmode and is_string_delimiter:
+            stringmode = True
+            stringchar = character
+        elif stringmode and is_string_delimiter:
+            stringmode = (character != stringchar)
+        elif not stringmode and character == "!":
+            return code[:column], code[column:]
+
+    return code, ""
+
+class Test_ExtractInlineComment(unittest.TestCase):
+
+    def test_examples(self):
+        self.assertEqual(extract_inline_comment("X = 1\n"), ("X = 1\n", ""))
+        self.assertEqual(extract_inline_comment("X = 1 ! c\n"), ("X = 1 ", "! c\n"))
+        self.assertEqual(extract_inline_comment("C = '!' // \"'!\" ! c\n"),
+                         ("C = '!' // \"'!\" ", "! c\n"))
+        self.assertEqual(extract_inline_comment("C = 'IT''S!' !\n"), ("C = 'IT''S!' ", "!\n"))
+        self.assertEqual(extract_inline_comment("C = 'OPEN ! \n"), ("C = 'OPEN ! \n", ""))
+
+    def test_matches_reference(self):
+        import random
+        rng = random.Random(4)
+        for _ in range(5000):
+            code = ''.join(rng.choice("ab !'\"") for _ in range(rng.randint(0, 12)))
+            self.assertEqual(extract_inline_comment(code), reference_extract_inline_comment(code), code)
+
+class Test_ConvertTree(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.srcdir = os.path.join(self.tmpdir.name, "src")
+        self.outdir = os.path.join(self.tmpdir.name, "out")
+        os.makedirs(os.path.join(self.srcdir, "sub"))
+        self.files = {"a.f": teststr[1], os.path.join("sub", "b.src"): teststr[3],
+                      os.path.join("sub", "c.F"): teststr[11]}
+        for name, content in self.files.items():
+            with open(os.path.join(self.srcdir, name), 'w') as f:
+                f.write(content)
+        with open(os.path.join(self.srcdir, "notes.txt"), 'w') as f:
+            f.write("C not Fortran\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_tree(self, jobs):
+        changed = convert_tree(self.srcdir, self.outdir, jobs=jobs)
+        self.assertEqual(len(changed), len(self.files))
+        for name, content in self.files.items():
+            with open(os.path.join(self.outdir, free_form_name(name))) as f:
+                self.assertEqual(f.read(), ''.join(convertToFree(StringIO(content))))
+        self.assertFalse(os.path.exists(os.path.join(self.outdir, "notes.txt")))
+
+    def test_serial(self):
+        self.check_tree(jobs=1)
+
+    def test_pool(self):
+        self.check_tree(jobs=2)
+
+    def test_inplace(self):
+        convert_tree(self.srcdir, None, jobs=2, inplace=True)
+        with open(os.path.join(self.srcdir, "a.f")) as f:
+            self.assertEqual(f.read(), ''.join(convertToFree(StringIO(teststr[1]))))
+
+    def test_unchanged_and_check(self):
+        self.assertEqual(len(convert_tree(self.srcdir, self.outdir, jobs=1, check=True)), len(self.files))
+        self.assertFalse(os.path.exists(self.outdir))
+        convert_tree(self.srcdir, self.outdir, jobs=1)
+        output = os.path.join(self.outdir, "a.f90")
+        mtime = os.stat(output).st_mtime_ns
+        self.assertEqual(convert_tree(self.srcdir, self.outdir, jobs=1), [])
+        self.assertEqual(convert_tree(self.srcdir, self.outdir, jobs=1, check=True), [])
+        self.assertEqual(os.stat(output).st_mtime_ns, mtime)
+
+    def test_main_files(self):
+        # several files on the command line are converted together
+        inputs = [os.path.join(self.srcdir, name) for name in sorted(self.files)]
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        try:
+            with redirect_stdout(StringIO()) as output:
+                main(["-j", "2"] + inputs)
+                main(["-j", "2"] + inputs)
+                self.assertEqual(main(["--check", "-j", "2"] + inputs), 0)
+        finally:
+            os.chdir(cwd)
+        for name, content in self.files.items():
+            with open(os.path.join(self.tmpdir.name, "converted_" + free_form_name(os.path.basename(name)))) as f:
+                self.assertEqual(f.read(), ''.join(convertToFree(StringIO(content))))
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[:3], ["Conversion completed. Output written to converted_%s." %
+                                     free_form_name(os.path.basename(name)) for name in sorted(self.files)])
+        self.assertEqual(lines[3:], ["%s is unchanged, nothing to do." % name for name in inputs] +
+                         ["All files are up to date."])
+
+        # two inputs must not be written to the same file
+        other = os.path.join(self.tmpdir.name, "a.f")
+        with open(other, 'w') as f:
+            f.write(teststr[0])
+        with redirect_stderr(StringIO()) as error, self.assertRaises(SystemExit):
+            main([inputs[0], other])
+        self.assertIn("would both be written to converted_a.f90", error.getvalue())
    
 if __name__ == "__main__":
     num = 0
@@ -28,17 +28,58 @@ import sys
 import os
 import argparse
 
+from flt.fileio import update_file, report_check
+from flt.batch import find_source_files, mirror_path, output_collision, run_conversions
+from flt.cache import ConversionCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from flt.lexer import split_comment
+from flt import profiling
+
+# suffixes picked up when a directory tree is converted
+FIXED_FORM_SUFFIXES = ['.f', '.F', '.for', '.FOR', '.src']
+
 class FortranLine:
+    """A single line of fixed form source and its free form conversion.
+
+    One of these is created for every input line, so the record is kept
+    small (no instance __dict__) and only the line classification is done
+    up front. The label, the code part, text beyond column 72 and the
+    converted line are derived when they are first needed.
+    """
+    __slots__ = ('line', 'isComment', 'isNewComment', 'isOMP', 'isCppLine',
+                 'is_regular', 'isContinuation', '_line_conv', '_excess_line')
+
     def __init__(self, line):
         self.line = line
-        self.line_conv = line
-        self.isComment = False
-        self.isContinuation = False
+        self._line_conv = None
+        self._excess_line = None
         self.__analyse()
 
     def __repr__(self):
         return self.line_conv
 
+    @property
+    def line_conv(self):
+        if self._line_conv is None:
+            self._line_conv = self.__convert()
+        return self._line_conv
+
+    @property
+    def label(self):
+        if self.isOMP or len(self.line) <= 1:
+            return ''
+        return self.line[0:5].strip().lower() + ' '
+
+    @property
+    def code(self):
+        line = self.line if self._excess_line is not None else self.__cut_excess()
+        return line[6:] if len(line) > 6 else '\n'
+
+    @property
+    def excess_line(self):
+        if self._excess_line is None:
+            self.__cut_excess()
+        return self._excess_line
+
     def continueLine(self):
         """Insert line continuation symbol at correct position in a free format line."""
 
@@ -49,86 +90,74 @@ class FortranLine:
             before_inline_comment = "!" + tmp
 
         if inline_comment == "":
-            self.line_conv = self.line_conv.rstrip() + " &\n"
+            self._line_conv = self.line_conv.rstrip() + " &\n"
         else:
             len_before = len(before_inline_comment)
             before = before_inline_comment.rstrip() + " & "
-            self.line_conv = before.ljust(len_before) + inline_comment
+            self._line_conv = before.ljust(len_before) + inline_comment
 
     def __analyse(self):
         line = self.line
-        firstchar = line[0] if len(line) > 0 else ''
-        self.label = line[0:5].strip().lower() + ' ' if len(line) > 1 else ''
-        cont_char = line[5] if len(line) >= 6 else ''
-        fivechars = line[1:5] if len(line) > 1 else ''
-        self.isShort = (len(line) <= 6)
-        self.isLong  = (len(line) > 73)
+        firstchar = line[:1]
+        fivechars = line[1:5]
 
         self.isComment = firstchar in "cC*!"
-        self.isNewComment = '!' in fivechars and not self.isComment
         # this is a very specific use case for the application called GAMESS, sometimes there's omp behind C$ which was annoying to deal with
         self.isOMP = self.isComment and (fivechars.lower() == "$omp" or fivechars.lower() == "$   ")
 #        self.isOMP = self.isComment and fivechars.lower() == "$omp"
-        if self.isOMP:
-            self.isComment = False
-            self.label = ''
+        if self.isComment and not self.isOMP:
+            # plain comment, nothing else to look at
+            self.isNewComment = self.isCppLine = False
+            self.is_regular = self.isContinuation = False
+            return
+
+        self.isComment = False
+        self.isNewComment = '!' in fivechars and not self.isOMP
         self.isCppLine = (firstchar == '#')
-        self.is_regular = (not (self.isComment or self.isNewComment or
-                           self.isCppLine or self.isShort))
+        self.is_regular = (not (self.isNewComment or self.isCppLine or
+                           len(line) <= 6))
+        cont_char = line[5:6]
         self.isContinuation = (not (cont_char.isspace() or cont_char == '0') and
                                self.is_regular)
 
-        self.code = line[6:] if len(line) > 6 else '\n'
-
-        self.excess_line = ''
-        if self.isLong and self.is_regular:
-            code, inline_comment = extract_inline_comment(self.code)
+    def __cut_excess(self):
+        """Split off the text after column 72, which fixed form compilers ignore."""
+        line = self.line
+        self._excess_line = ''
+        if len(line) > 73 and self.is_regular:
+            code, inline_comment = extract_inline_comment(line[6:])
             if inline_comment == "" or len(code) >= 72 - 6:
-                self.excess_line = line[72:]
-                line = line[:72] + '\n'
-                self.code = line[6:]
-
-        self.line = line
-        self.__convert()
+                self._excess_line = line[72:]
+                self.line = line = line[:72] + '\n'
+        return line
 
     def __convert(self):
         line = self.line
 
         if self.isComment:
-            self.line_conv = '!' + line[1:]
+            return '!' + line[1:]
         elif self.isNewComment or self.isCppLine:
-            self.line_conv = line
+            return line
         elif self.isOMP:
-            self.line_conv = '!' + line[1:5] + ' ' + self.code
+            line_conv = '!' + line[1:5] + ' ' + self.code
         elif not self.label.isspace():
-            self.line_conv = self.label + self.code
+            line_conv = self.label + self.code
         else:
-            self.line_conv = self.code
+            line_conv = self.code
 
-        if self.excess_line != '':
-            if self.excess_line.lstrip().startswith("!"):
+        excess_line = self.excess_line
+        if excess_line != '':
+            if excess_line.lstrip().startswith("!"):
                 marker = ""
             else:
                 marker = "!"
 
-            self.line_conv = self.line_conv.rstrip().ljust(72) + marker + self.excess_line
-
-def extract_inline_comment(code):
-    """Splits line of code into (code, inline comment)"""
-    stringmode = False
-    stringchar = ""
+            line_conv = line_conv.rstrip().ljust(72) + marker + excess_line
 
-    for column, character in enumerate(code):
-        is_string_delimiter = (character == "'" or character == '"')
-        if not stringmode and is_string_delimiter:
-            stringmode = True
-            stringchar = character
-        elif stringmode and is_string_delimiter:
-            stringmode = (character != stringchar)
-        elif not stringmode and character == "!":
-            return code[:column], code[column:]
+        return line_conv
 
-    return code, ""
+# splits a line of code into (code, inline comment)
+extract_inline_comment = split_comment
 
 def convertToFree(stream):
     """Convert stream from fixed source form to free source form."""
@@ -149,37 +178,120 @@ def convertToFree(stream):
     for l in linestack:
         yield str(l)
 
-def main():
-    parser = argparse.ArgumentParser(description="Convert fixed-form Fortran to free-form.")
-    parser.add_argument("input_file", help="Input Fortran file (fixed form).")
-    parser.add_argument("-i", "--inplace", action="store_true", help="Edit the file in place.")
-    parser.add_argument("-o", "--output", help="Redirect to an output file (default: converted_<input_file>).")
-
-    args = parser.parse_args()
+def free_form_name(filename):
+    """Returns the name of the free form counterpart of a fixed form file."""
+    base_name, suffix = os.path.splitext(filename)
+    if suffix in [".f", ".F"]:
+        return base_name + (".f90" if suffix == ".f" else ".F90")
+    return filename
 
-    input_file = args.input_file
-    output_file = args.output
+def convert_file(input_file, output_file, check=False):
+    """Convert a single fixed form file and write the result to output_file.
 
-    if not output_file:
-        base_name, suffix = os.path.splitext(input_file)
-        if suffix in [".f", ".F"]:
-            output_suffix = ".f90" if suffix == ".f" else ".F90"
-            output_file = f"converted_{os.path.basename(base_name)}{output_suffix}"
+    output_file is left alone if it already holds the result. Returns True if
+    output_file changed (with check set: would change, nothing is written).
+    """
+    with open(input_file, 'r') as infile:
+        lines = convertToFree(profiling.source(infile, input_file))
+        return update_file(profiling.stage('fixed2free', lines), output_file, check)
+
+def convert_tree(input_dir, output_dir, suffixes=FIXED_FORM_SUFFIXES, jobs=None, inplace=False, cache=None, check=False,
+                 profiler=None):
+    """Convert all fixed form files below input_dir using a pool of worker processes.
+
+    The directory layout of input_dir is mirrored below output_dir, unless the
+    files are converted in place. Files found in the cache are not converted
+    again. Returns the sorted list of output files that changed, or with check
+    set, that would change. See convert_files for how the files are converted.
+    """
+    files = []
+    for input_path in find_source_files(input_dir, suffixes):
+        if inplace:
+            output_path = input_path
         else:
-            output_file = f"converted_{os.path.basename(base_name)}{suffix}"
+            output_path = mirror_path(input_path, input_dir, output_dir, free_form_name, makedirs=not check)
+        files.append((input_path, output_path))
 
-    with open(input_file, 'r') as infile:
-        converted_lines = list(convertToFree(infile))
+    changed = convert_files(files, jobs, cache, check, profiler)
 
-    if args.inplace:
-        with open(input_file, 'w') as outfile:
-            outfile.writelines(converted_lines)
-    else:
-        with open(output_file, 'w') as outfile:
-            outfile.writelines(converted_lines)
+    if cache is not None:
+        cache.evict()
 
-    print(f"Conversion completed. Output written to {output_file if not args.inplace else input_file}.")
+    return changed
 
-if __name__ == "__main__":
-    main()
+def convert_files(files, jobs=None, cache=None, check=False, profiler=None):
+    """Convert the (input file, output file) pairs files using a pool of worker processes.
+
+    Files found in the cache are not converted again, see
+    flt.batch.run_conversions. Returns the sorted list of output files that
+    changed, or with check set, that would change.
+    """
+    return run_conversions(convertToFree, convert_file, files, jobs, cache, check, profiler)
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert fixed-form Fortran to free-form.")
+    parser.add_argument("input_files", nargs='+', metavar="input_file", help="Input Fortran files (fixed form) or directory trees of such files.")
+    parser.add_argument("-i", "--inplace", action="store_true", help="Edit the files in place.")
+    parser.add_argument("-o", "--output", help="Redirect to an output file or, for a directory, an output tree (default: converted_<input_file>); only with a single input.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes for several files or a directory tree (default: number of cores).")
+    parser.add_argument("--suffix", action="append", dest="suffixes", help="File suffix to convert in a directory tree, may be repeated (default: %s)." % ' '.join(FIXED_FORM_SUFFIXES))
+    parser.add_argument("--check", action="store_true", help="Only report the files that would change and exit with status 1 if there are any.")
+    parser.add_argument("--cache", action="store_true", help="Skip files that are unchanged since an earlier run.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directory of the conversion cache (default: %(default)s).")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // 2**20, help="Size limit of the cache in MB (default: %(default)s).")
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    if args.output and len(args.input_files) > 1:
+        parser.error("-o/--output needs a single input")
+    profiler = profiling.from_args(args)
+
+    cache = None
+    if args.cache and not args.check:
+        cache = ConversionCache(args.cache_dir, __file__, [('inplace', args.inplace)],
+                                max_bytes=args.cache_size * 2**20)
+
+    # the files are converted together, the directory trees one after another
+    outputs = {}
+    for input_file in args.input_files:
+        if not os.path.isdir(input_file):
+            output_file = args.output or f"converted_{free_form_name(os.path.basename(input_file))}"
+            outputs[input_file] = input_file if args.inplace else output_file
+    collision = output_collision(outputs.items())
+    if collision:
+        parser.error("%s and %s would both be written to %s" % collision)
+    changed = convert_files(list(outputs.items()), args.jobs, cache, args.check, profiler)
+    written = set(changed)
+
+    for input_file in args.input_files:
+        output_file = args.output
+
+        if os.path.isdir(input_file):
+            output_dir = output_file
+            if not output_dir and not args.inplace:
+                output_dir = f"converted_{os.path.basename(os.path.normpath(input_file))}"
+            written_tree = convert_tree(input_file, output_dir, args.suffixes or FIXED_FORM_SUFFIXES,
+                                   jobs=args.jobs, inplace=args.inplace, cache=cache, check=args.check,
+                                   profiler=profiler)
+            changed += written_tree
+            if not args.check:
+                print(f"Conversion completed. {len(written_tree)} files written to {output_dir if not args.inplace else input_file}.")
+            continue
+
+        if args.check:
+            continue
+        if outputs[input_file] not in written:
+            print(f"{input_file} is unchanged, nothing to do.")
+            continue
+
+        print(f"Conversion completed. Output written to {outputs[input_file]}.")
+
+    if cache is not None:
+        cache.evict()
+    if profiler is not None:
+        profiler.report()
+    if args.check:
+        return report_check(changed)
+
+if __name__ == "__main__":
+    sys.exit(main())
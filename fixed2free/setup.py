@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from distutils.core import setup
+from setuptools import setup
 
 mymail = '12345.0$gmail.com'.replace('1','y').replace('2','l')
 mymail = mymail.replace('3','i').replace('4','k').replace('5','x').replace('$', '@')
@@ -29,7 +29,10 @@ This tool takes a more minimalistic approach and changes only the source form.
       author='Elias Rabel',
       author_email=mymail,
       url='https://github.com/ylikx/fortran-legacy-tools',
-      scripts=['fixed2free2.py'],
+      py_modules=['fixed2free2'],
+      # the shared helpers, found through the link fixed2free/flt
+      packages=['flt'],
+      entry_points={'console_scripts': ['fixed2free2 = fixed2free2:main']},
       classifiers=['Development Status :: 4 - Beta',
                    'Environment :: Console',
                    'Intended Audience :: Developers',
@@ -35,79 +35,232 @@ Usage: file name as first command line parameter
 import sys
 import os
 import argparse
+import re
+import string
+from itertools import islice
+
+from flt.batch import output_collision, run_conversions
+from flt.fileio import update_file, report_check
+from flt.cache import ConversionCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from flt.lexer import split_code
+from flt import profiling
 
 def is_hollerith_constant(word):
     """Check if a word is a Hollerith constant."""
     return len(word) > 1 and word[0].isdigit() and word[1].lower() == 'h'
 
+# runs of characters for which str.isalnum() is true, plus '_'
+_WORD = re.compile(r'\w+')
+_TRAILING_WORD = re.compile(r'\w+\Z')
+
+# classes of ASCII characters: lowercase letters 'a', digits '0', 'H' for
+# itself (Hollerith), other word characters 'A', everything else ' '
+_MARKS = dict.fromkeys(range(128), ' ')
+_MARKS.update((ord(c), 'A') for c in string.ascii_uppercase + '_')
+_MARKS.update((ord(c), 'a') for c in string.ascii_lowercase)
+_MARKS.update((ord(c), '0') for c in string.digits)
+_MARKS[ord('H')] = 'H'
+
+# number of lines converted together
+BLOCK_LINES = 512
+
+def _lower_word(match):
+    word = match.group()
+    if word.isupper() and not is_hollerith_constant(word):  # don't convert Hollerith constants
+        return word.lower()
+    return word
+
+def lower_code(code):
+    """Convert the all uppercase words in a piece of code (no strings or comments) to lowercase."""
+    lowered = code.lower()
+    if lowered == code:
+        return code
+    if not code.isascii():
+        return _WORD.sub(_lower_word, code)
+
+    # Lower everything, then put back the few words that keep their case:
+    # those with a lowercase letter and Hollerith constants. They are
+    # found with str.find on a copy of code where each character is
+    # replaced by its class.
+    marks = code.translate(_MARKS)
+    find = marks.find
+    lower_at = find('a')
+    hollerith_at = find('0H')
+
+    pieces = []
+    position = 0
+    while lower_at >= 0 or hollerith_at >= 0:
+        if hollerith_at < 0 or 0 <= lower_at < hollerith_at:
+            start = lower_at
+        else:
+            start = hollerith_at
+        start = marks.rfind(' ', position, start) + 1 or position
+        end = find(' ', start)
+        if end < 0:
+            end = len(code)
+
+        word = code[start:end]
+        if not word.isupper() or is_hollerith_constant(word):
+            pieces += lowered[position:start], word
+            position = end
+
+        if 0 <= lower_at < end:
+            lower_at = find('a', end)
+        if 0 <= hollerith_at < end:
+            hollerith_at = find('0H', end)
+
+    if not pieces:
+        return lowered
+    pieces.append(lowered[position:])
+    return ''.join(pieces)
+
+def _convert_text(text, stringchar):
+    """Convert one or more complete lines at once.
+
+    stringchar is the delimiter of a string that is still open from the
+    previous line, or ''. Returns the converted text and the delimiter of
+    a string left open at its end.
+    """
+    if not text.isascii() or '\0' in text:
+        return _convert_segments(text, stringchar)
+
+    # [code, string or comment, code, ..., code]: lower all pieces of code
+    # in one go, with NUL (not a word character) keeping them apart.
+    parts, stringchar = split_code(text, stringchar)
+    if len(parts) == 1:
+        return lower_code(text), stringchar
+    parts[0::2] = lower_code('\0'.join(parts[0::2])).split('\0')
+    return ''.join(parts), stringchar
+
+def _convert_segments(text, stringchar, final=False):
+    """Same as _convert_text, for any text. Each piece of code between
+    strings and comments goes to lower_code on its own.
+
+    With final set, a word at the very end of text is left alone, as the
+    original line by line conversion did for a last line without newline.
+    """
+    parts, stringchar = split_code(text, stringchar)
+    for index in range(0, len(parts), 2):
+        code = parts[index]
+        last = code[-1:]
+        trailing_word = (final and not stringchar and index == len(parts) - 1 and
+                         (last.isalnum() or last == '_') and _TRAILING_WORD.search(code))
+        if trailing_word:
+            parts[index] = lower_code(code[:trailing_word.start()]) + trailing_word.group()
+        else:
+            parts[index] = lower_code(code)
+    return ''.join(parts), stringchar
+
 def convert_to_lowercase(stream):
     """Convert all uppercase keywords in the Fortran source file to lowercase."""
-    commentmode = False
-    stringmode = False
-    stringchar = ''
-
-    for line in stream:
-        line_new = ''
-        word = ''
-        commentmode = False
-
-        for character in line:
-            if not character.isalnum() and character != '_':
-                if not stringmode and not commentmode:
-                    if word.isupper() and not is_hollerith_constant(word):  # don't convert Hollerith constants
-                        word = word.lower()
-
-                line_new += word
-                line_new += character
-                word = ''
-
-                if (character == '"' or character == "'") and not commentmode:
-                    if not stringmode:
-                        stringchar = character
-                        stringmode = True
-                    else:
-                        stringmode = not (character == stringchar)
-
-                if character == '!' and not stringmode:
-                    commentmode = True  # treat rest of line as comment
+    stringchar = ''  # strings may go on in the next line
+    stream = iter(stream)
+
+    # Whole blocks of lines are converted in one go: a newline ends
+    # comments and words, so the result is the same as line by line.
+    while True:
+        block = list(islice(stream, BLOCK_LINES))
+        if not block:
+            break
 
+        text = ''.join(block)
+        if text.count('\n') == len(block) and text.endswith('\n'):
+            text, stringchar = _convert_text(text, stringchar)
+            lines = text.splitlines(True)
+            if len(lines) == len(block):
+                yield from lines
             else:
-                word += character
+                # there are line breaks besides '\n' (e.g. form feeds)
+                lines = text.split('\n')
+                lines.pop()
+                for line in lines:
+                    yield line + '\n'
+            continue
 
-        line_new += word
-        yield line_new
+        # some line without newline (usually the last one)
+        for line in block:
+            if line.endswith('\n'):
+                line, stringchar = _convert_text(line, stringchar)
+            else:
+                line, stringchar = _convert_segments(line, stringchar, final=True)
+            yield line
+
+def convert_file(input_file, output_file, check=False):
+    """Convert a single file and write the result to output_file.
+
+    output_file is left alone if it already holds the result. Returns True if
+    output_file changed (with check set: would change, nothing is written).
+    """
+    with open(input_file, 'r') as infile:
+        lines = convert_to_lowercase(profiling.source(infile, input_file))
+        return update_file(profiling.stage('lowercase', lines), output_file, check)
 
-def main():
+def convert_files(files, jobs=None, cache=None, check=False, profiler=None):
+    """Convert the (input file, output file) pairs files using a pool of worker processes.
+
+    Files found in the cache are not converted again, see
+    flt.batch.run_conversions. Returns the sorted list of output files that
+    changed, or with check set, that would change.
+    """
+    return run_conversions(convert_to_lowercase, convert_file, files, jobs, cache, check, profiler)
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Convert Fortran file keywords to lowercase.")
-    parser.add_argument("input_file", help="Input Fortran file.")
-    parser.add_argument("-i", "--inplace", action="store_true", help="Edit the file in place.")
-    parser.add_argument("-o", "--output", help="Redirect to an output file (default: converted_<input_file>.f90 or .F90).")
+    parser.add_argument("input_files", nargs='+', metavar="input_file", help="Input Fortran files.")
+    parser.add_argument("-i", "--inplace", action="store_true", help="Edit the files in place.")
+    parser.add_argument("-o", "--output", help="Redirect to an output file (default: converted_<input_file>.f90 or .F90); only with a single input.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes for several files (default: number of cores).")
+    parser.add_argument("--check", action="store_true", help="Only report whether the files would change and exit with status 1 if any would.")
+    parser.add_argument("--cache", action="store_true", help="Skip files that are unchanged since an earlier run.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Directory of the conversion cache (default: %(default)s).")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // 2**20, help="Size limit of the cache in MB (default: %(default)s).")
+    profiling.add_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.output and len(args.input_files) > 1:
+        parser.error("-o/--output needs a single input")
+    profiler = profiling.from_args(args)
 
-    input_file = args.input_file
-    output_file = args.output
+    cache = None
+    if args.cache and not args.check:
+        cache = ConversionCache(args.cache_dir, __file__, [('inplace', args.inplace)],
+                                max_bytes=args.cache_size * 2**20)
 
-    if not output_file:
-        base_name, suffix = os.path.splitext(input_file)
-        if suffix in [".f", ".F"]:
-            output_suffix = ".f90" if suffix == ".f" else ".F90"
-            output_file = f"converted_{os.path.basename(base_name)}{output_suffix}"
-        else:
-            output_file = f"converted_{os.path.basename(base_name)}{suffix}"
+    outputs = {}
+    for input_file in args.input_files:
+        output_file = args.output
+        if not output_file:
+            base_name, suffix = os.path.splitext(input_file)
+            if suffix in [".f", ".F"]:
+                output_suffix = ".f90" if suffix == ".f" else ".F90"
+                output_file = f"converted_{os.path.basename(base_name)}{output_suffix}"
+            else:
+                output_file = f"converted_{os.path.basename(base_name)}{suffix}"
 
-    with open(input_file, 'r') as infile:
-        converted_lines = list(convert_to_lowercase(infile))
+        if args.inplace:
+            output_file = input_file
+        outputs[input_file] = output_file
+    collision = output_collision(outputs.items())
+    if collision:
+        parser.error("%s and %s would both be written to %s" % collision)
+
+    changed = convert_files(list(outputs.items()), args.jobs, cache, args.check, profiler)
 
-    if args.inplace:
-        with open(input_file, 'w') as outfile:
-            outfile.writelines(converted_lines)
-    else:
-        with open(output_file, 'w') as outfile:
-            outfile.writelines(converted_lines)
+    if not args.check:
+        written = set(changed)
+        for input_file, output_file in outputs.items():
+            if output_file not in written:
+                print(f"{input_file} is unchanged, nothing to do.")
+            else:
+                print(f"Conversion completed. Output written to {output_file}.")
 
-    print(f"Conversion completed. Output written to {output_file if not args.inplace else input_file}.")
+    if cache is not None:
+        cache.evict()
+    if profiler is not None:
+        profiler.report()
+    if args.check:
+        return report_check(changed)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
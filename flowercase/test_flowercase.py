@@ -1,8 +1,49 @@
 #!/usr/bin/python3
+import os
 import unittest
+import random
+import tempfile
 from io import StringIO
+import flowercase
 from flowercase import is_hollerith_constant, convert_to_lowercase
 
+def reference_convert_to_lowercase(stream):
+    """Character by character conversion that convert_to_lowercase replaced."""
+    commentmode = False
+    stringmode = False
+    stringchar = ''
+
+    for line in stream:
+        line_new = ''
+        word = ''
+        commentmode = False
+
+        for character in line:
+            if not character.isalnum() and character != '_':
+                if not stringmode and not commentmode:
+                    if word.isupper() and not is_hollerith_constant(word):
+                        word = word.lower()
+
+                line_new += word
+                line_new += character
+                word = ''
+
+                if (character == '"' or character == "'") and not commentmode:
+                    if not stringmode:
+                        stringchar = character
+                        stringmode = True
+                    else:
+                        stringmode = not (character == stringchar)
+
+                if character == '!' and not stringmode:
+                    commentmode = True
+
+            else:
+                word += character
+
+        line_new += word
+        yield line_new
+
 class TestFlowercase(unittest.TestCase):
 
     def test_is_hollerith_constant(self):
@@ -55,6 +96,56 @@ class TestFlowercase(unittest.TestCase):
         )
         self._run_convert_to_lowercase_test(input_data, expected_output)
 
+    def test_strings_comments_and_blocks(self):
+        # String continued in the next line
+        input_data = "CALL FOO('ABC\nDEF', X) ! X\nY = 'Z' // \"W'\"\n"
+        expected_output = "call foo('ABC\nDEF', x) ! X\ny = 'Z' // \"W'\"\n"
+        self._run_convert_to_lowercase_test(input_data, expected_output)
+
+        # Hollerith constant inside a word, mixed case Hollerith constant
+        input_data = "X8HCHECK = 8HCheck + 12HABC\n"
+        expected_output = "x8hcheck = 8HCheck + 12habc\n"
+        self._run_convert_to_lowercase_test(input_data, expected_output)
+
+        # Last line without a newline keeps its final word
+        input_data = "A = B\nEND"
+        expected_output = "a = b\nEND"
+        self._run_convert_to_lowercase_test(input_data, expected_output)
+
+    def test_matches_reference(self):
+        rng = random.Random(7)
+        alphabet = "ABCHhxyz09_ '\"!(),\u00e9\u00c9\x0c\r"
+        block_lines = flowercase.BLOCK_LINES
+        try:
+            for _ in range(2000):
+                lines = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) + '\n'
+                         for _ in range(rng.randint(0, 30))]
+                if lines and rng.random() < 0.5:
+                    lines[-1] = lines[-1].rstrip('\n')
+                flowercase.BLOCK_LINES = rng.choice([1, 3, 512])
+                self.assertEqual(list(convert_to_lowercase(lines)),
+                                 list(reference_convert_to_lowercase(lines)), lines)
+        finally:
+            flowercase.BLOCK_LINES = block_lines
+
+    def test_convert_files(self):
+        texts = ["INTEGER I\n", "CALL FOO('BAR')\nEND\n", "x = 1\n"]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = []
+            for i, text in enumerate(texts):
+                input_file = os.path.join(tmpdir, f"f{i}.f90")
+                with open(input_file, 'w') as f:
+                    f.write(text)
+                files.append((input_file, os.path.join(tmpdir, f"converted_f{i}.f90")))
+
+            for jobs in [1, 2]:
+                self.assertEqual(flowercase.convert_files(files, jobs, check=True), [output for _, output in files])
+            self.assertEqual(flowercase.convert_files(files, 2), [output for _, output in files])
+            for (_, output_file), text in zip(files, texts):
+                with open(output_file) as f:
+                    self.assertEqual(f.read(), ''.join(convert_to_lowercase(StringIO(text))))
+            self.assertEqual(flowercase.convert_files(files, 2), [])
+
     def _run_convert_to_lowercase_test(self, input_data, expected_output):
         """Helper method to run the convert_to_lowercase tests"""
         stream = StringIO(input_data)
@@ -0,0 +1,22 @@
+"""
+Helpers shared by the fortran-legacy-tools scripts.
+
+The tools live in their own directories and are run as plain scripts.
+Every tool directory has a symbolic link flt to this package, so a script
+finds it next to itself; an installed tool (see fixed2free/setup.py) has
+the package installed with it.
+"""
+
+import importlib
+import os
+import sys
+
+# the repository, also when this package was found through the link of a tool
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+def import_tool(directory, module):
+    """Imports the module of a tool script from its directory in the repository."""
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.append(path)
+    return importlib.import_module(module)
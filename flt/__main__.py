@@ -0,0 +1,5 @@
+import sys
+
+from flt.cli import main
+
+sys.exit(main())
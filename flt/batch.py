@@ -0,0 +1,359 @@
+# batch.py: Running a tool over many files.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import functools
+import io
+import itertools
+import os
+import queue
+
+from flt.cache import convert_cached
+from flt.fileio import update_file
+
+# threads for each of reading and writing in run_pipeline
+DEFAULT_IO_THREADS = 4
+
+# content of the files held by run_pipeline at a time, and the size from
+# which a file is rather streamed by a worker
+DEFAULT_PIPELINE_BYTES = 64 * 2**20
+DEFAULT_STREAM_BYTES = 4 * 2**20
+
+# items stream_tasks sends from a worker at a time, and the batches a
+# worker may send ahead before it waits for them to be taken
+DEFAULT_BATCH_SIZE = 1000
+_BATCHES_AHEAD = 4
+
+def find_source_files(directory, suffixes):
+    """Walk a directory tree and yield the files with one of the given suffixes."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1] in suffixes:
+                yield os.path.join(root, name)
+
+def mirror_path(input_path, input_dir, output_dir, rename=None, makedirs=True):
+    """Returns the place of input_path in a copy of the tree input_dir at output_dir.
+
+    rename optionally maps the relative path to a new one, e.g. to change
+    the suffix. Missing directories are created unless makedirs is False.
+    """
+    relative_path = os.path.relpath(input_path, input_dir)
+    if rename:
+        relative_path = rename(relative_path)
+    output_path = os.path.join(output_dir, relative_path)
+    if makedirs:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return output_path
+
+def output_collision(files):
+    """Returns (first input, second input, output) for two of the (input file,
+    output file) pairs files with the same output file, or None."""
+    inputs = {}
+    for input_file, output_file in files:
+        key = os.path.realpath(output_file)
+        if key in inputs and os.path.realpath(inputs[key]) != os.path.realpath(input_file):
+            return inputs[key], input_file, output_file
+        inputs.setdefault(key, input_file)
+    return None
+
+def run_tasks(function, tasks, jobs=None, weight=None, profiler=None):
+    """Yields function(task) for all tasks, computed by a pool of worker processes.
+
+    Results come in the order the tasks finish. If weight is given, tasks
+    are started heaviest first, so that a few big ones at the end do not
+    leave most of the workers idle. With a flt.profiling.Profiler, every
+    task is measured and its FileProfile handed to profiler.
+    """
+    if profiler is not None:
+        for result, record in run_tasks(profiler.task_function(function), tasks, jobs, weight):
+            profiler.add(record)
+            yield result
+        return
+
+    tasks = list(tasks)
+    if weight is not None:
+        tasks.sort(key=weight, reverse=True)
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+
+    # imported here, a serial run (one file, -j 1) starts faster without it
+    import multiprocessing
+
+    chunksize = max(1, min(16, len(tasks) // (4 * jobs)))
+    with multiprocessing.Pool(min(jobs, len(tasks))) as pool:
+        yield from pool.imap_unordered(function, tasks, chunksize)
+
+# the channels of stream_tasks in a worker process
+_channels = None
+
+def _init_stream_worker(channels):
+    global _channels
+    _channels = channels
+
+def _stream_task(generate, batch_size, job):
+    slot, task = job
+    channel = _channels[slot]
+    try:
+        batch = []
+        for item in generate(task):
+            batch.append(item)
+            if len(batch) == batch_size:
+                channel.put(batch)
+                batch = []
+        if batch:
+            channel.put(batch)
+    finally:
+        channel.put(None)
+
+def stream_tasks(generate, tasks, jobs=None, batch_size=DEFAULT_BATCH_SIZE, profiler=None):
+    """Yields the items of generate(task) for all tasks, in the order of tasks.
+
+    The generators run in a pool of worker processes, which send their items
+    in batches of batch_size. A worker that is ahead of the one whose items
+    are taken waits after a few batches, so the items held at a time are
+    bounded, however many a task has. With jobs 1 or a single task the items
+    come straight from generate in this process, unless a
+    flt.profiling.Profiler measures every task in a worker; the FileProfile
+    is handed to profiler.
+    """
+    tasks = list(tasks)
+    if not tasks:
+        return
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    if profiler is None and jobs == 1:
+        for task in tasks:
+            yield from generate(task)
+        return
+
+    import multiprocessing  # see run_tasks
+
+    # a task is given the channel of its slot, free again once its items are taken
+    slots = 2 * jobs
+    channels = [multiprocessing.Queue(_BATCHES_AHEAD) for _ in range(slots)]
+    function = functools.partial(_stream_task, generate, batch_size)
+    if profiler is not None:
+        function = profiler.task_function(function)
+    pending = iter(enumerate(tasks))
+    started = collections.deque()
+    with multiprocessing.Pool(jobs, _init_stream_worker, (channels,)) as pool:
+        while True:
+            for index, task in itertools.islice(pending, slots - len(started)):
+                job = (index % slots, task)
+                started.append((job[0], pool.apply_async(function, (job,))))
+            if not started:
+                break
+            slot, result = started.popleft()
+            for batch in iter(channels[slot].get, None):
+                yield from batch
+            result = result.get()  # raises the exception of the task
+            if profiler is not None:
+                profiler.add(result[1])
+
+def read_text(path):
+    """Returns the content of the text file path."""
+    with open(path, 'r') as f:
+        return f.read()
+
+def text_lines(text):
+    """Returns the lines of text read by read_text, split like those of a file."""
+    return io.StringIO(text)
+
+def _run_stages(read, convert, write, task):
+    result = convert(task, read(task))
+    return result if write is None else write(task, result)
+
+def _no_read(task):
+    return None
+
+def _run_job(job, task, data):
+    return job(task)
+
+def run_pipeline(read, convert, write, tasks, jobs=None, threads=DEFAULT_IO_THREADS, depth=None, weight=None,
+                 ordered=False, profiler=None, stream=None, max_bytes=DEFAULT_PIPELINE_BYTES,
+                 stream_bytes=DEFAULT_STREAM_BYTES):
+    """Yields write(task, convert(task, read(task))) for all tasks, the reading,
+    converting and writing of different tasks overlapping.
+
+    read and write run in pools of threads, as they mostly wait for the disk
+    or the network; convert runs in a pool of worker processes, or in this
+    process with jobs 1. With write None, the results of convert are yielded.
+    At most depth tasks (default: enough to keep every thread and worker
+    busy) are between the start of reading and the end of writing. Results
+    come in the order the tasks finish, or with ordered set in the order of
+    tasks: a task then counts until its result is yielded, so depth also
+    bounds the results waiting for an earlier one. weight orders the tasks as
+    in run_tasks. An exception of any stage stops the run and is raised here.
+
+    weight(task) is also taken as the size of the content of task: the tasks
+    in the pipeline together weigh at most max_bytes (a heavier one runs
+    alone). stream(task) is an alternative job that does all three stages
+    in bounded memory, e.g. by streaming lines. If it is given, it is run
+    instead of the stages for a single task and for every task heavier than
+    stream_bytes.
+
+    With a flt.profiling.Profiler, every task is done in a worker by stream,
+    or by the three stages one after another, which is measured and the
+    FileProfile handed to profiler; ordered and depth still hold.
+    """
+    if profiler is not None:
+        job = profiler.task_function(stream or functools.partial(_run_stages, read, convert, write))
+        for result, record in run_pipeline(_no_read, functools.partial(_run_job, job), None, tasks, jobs,
+                                           threads, depth, weight, ordered, max_bytes=max_bytes):
+            profiler.add(record)
+            yield result
+        return
+
+    tasks = list(tasks)
+    weights = [weight(task) for task in tasks] if weight is not None else [0] * len(tasks)
+    if weight is not None:
+        order = sorted(range(len(tasks)), key=weights.__getitem__, reverse=True)
+        tasks = [tasks[index] for index in order]
+        weights = [weights[index] for index in order]
+
+    if len(tasks) <= 1:
+        for task in tasks:
+            yield stream(task) if stream is not None else _run_stages(read, convert, write, task)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+    depth = depth or 2 * (jobs + threads)
+
+    # the stages report to this thread, which moves every task on
+    events = queue.SimpleQueue()
+
+    def done(stage, index):
+        def callback(future):
+            error = future.exception()
+            events.put((stage, index, None if error else future.result(), error))
+        return callback
+
+    def finished_by(stage, index):
+        return (lambda result: events.put((stage, index, result, None)),
+                lambda error: events.put((stage, index, None, error)))
+
+    pool = None
+    if jobs > 1:
+        import multiprocessing  # see run_tasks
+        pool = multiprocessing.Pool(jobs)
+    readers = ThreadPoolExecutor(threads, 'read')
+    writers = ThreadPoolExecutor(threads, 'write') if write is not None else None
+    streamed = [stream is not None and size > stream_bytes for size in weights]
+    next_task = 0
+    in_flight = 0
+    in_flight_bytes = 0  # the weight of the tasks in flight whose content is held
+    finished = {}  # index -> result, of those waiting for an earlier task when ordered
+    next_index = 0
+    try:
+        while True:
+            while next_task < len(tasks) and in_flight < depth:
+                index, task = next_task, tasks[next_task]
+                if streamed[index] and pool is None:
+                    events.put(('done', index, stream(task), None))
+                elif streamed[index]:
+                    callback, error_callback = finished_by('done', index)
+                    pool.apply_async(stream, (task,), callback=callback, error_callback=error_callback)
+                elif in_flight_bytes and in_flight_bytes + weights[index] > max_bytes:
+                    break
+                else:
+                    readers.submit(read, task).add_done_callback(done('read', index))
+                    in_flight_bytes += weights[index]
+                next_task += 1
+                in_flight += 1
+            if not in_flight:
+                break
+
+            stage, index, value, error = events.get()
+            if error is not None:
+                raise error
+            task = tasks[index]
+            if stage == 'read':
+                if pool is not None:
+                    callback, error_callback = finished_by('convert', index)
+                    pool.apply_async(convert, (task, value), callback=callback, error_callback=error_callback)
+                    continue
+                value = convert(task, value)
+                stage = 'convert'
+            if stage == 'convert' and writers is not None:
+                writers.submit(write, task, value).add_done_callback(done('write', index))
+                continue
+            if not ordered:
+                in_flight -= 1
+                if not streamed[index]:
+                    in_flight_bytes -= weights[index]
+                yield value
+                continue
+            finished[index] = value
+            while next_index in finished:
+                in_flight -= 1
+                if not streamed[next_index]:
+                    in_flight_bytes -= weights[next_index]
+                yield finished.pop(next_index)
+                next_index += 1
+    finally:
+        readers.shutdown(cancel_futures=True)
+        if writers is not None:
+            writers.shutdown(cancel_futures=True)
+        if pool is not None:
+            pool.terminate()
+
+def _convert_file_job(job):
+    convert_lines, convert_file, cache, input_file, output_file, check = job
+    if check:
+        changed = convert_file(input_file, output_file, check=True)
+    else:
+        changed = convert_cached(cache, convert_file, input_file, output_file)
+    return output_file if changed else None
+
+# the stages of a pipelined run_conversions
+def _read_input_job(job):
+    return read_text(job[3])
+
+def _convert_text_job(job, text):
+    return ''.join(job[0](text_lines(text)))
+
+def _write_output_job(job, text):
+    convert_lines, convert_file, cache, input_file, output_file, check = job
+    return output_file if update_file([text], output_file, check) else None
+
+def run_conversions(convert_lines, convert_file, files, jobs=None, cache=None, check=False, profiler=None):
+    """Convert the (input file, output file) pairs files using a pool of worker processes.
+
+    convert_lines(lines) yields the converted lines, convert_file(input_file,
+    output_file, check=False) converts a file by streaming its lines and
+    returns whether output_file changed (see flt.fileio.update_file). Both
+    must be module level functions, so that they can be sent to workers.
+
+    Without cache and profiler, threads read and write the files while the
+    workers convert others with convert_lines (run_pipeline, which streams
+    a single or large file with convert_file); otherwise every file is a job
+    of its own, looked up in the flt.cache.ConversionCache or measured by the
+    flt.profiling.Profiler. Returns the sorted list of output files that
+    changed, or with check set, that would change.
+    """
+    tasks = [(convert_lines, convert_file, cache, input_file, output_file, check) for input_file, output_file in files]
+    weight = lambda task: os.path.getsize(task[3])
+    if cache is None and profiler is None:
+        results = run_pipeline(_read_input_job, _convert_text_job, _write_output_job, tasks, jobs, weight=weight,
+                               stream=_convert_file_job)
+    else:
+        results = run_tasks(_convert_file_job, tasks, jobs, weight=weight, profiler=profiler)
+    return sorted(filter(None, results))
@@ -0,0 +1,139 @@
+# cache.py: Content addressed cache of converted files.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cache of converted files, so that re-running a tool over an unchanged
+tree neither redoes the conversion nor touches the output files.
+
+An entry maps a key to the converted output. The key is a SHA-256 hash of
+the tool source, the shared modules the conversions use (SHARED_SOURCES),
+the tool options and the input content, which makes
+entries invalid as soon as any of them changes. Entries are stored as
+<directory>/<key[:2]>/<key>; the modification time of an entry is its last
+use, and evict() removes the least recently used ones once the cache grows
+beyond its size limit.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from flt.fileio import update_file
+
+DEFAULT_CACHE_DIR = '.flt-cache'
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+_BLOCKSIZE = 1 << 20
+
+# modules of this package that change the result of a conversion
+SHARED_SOURCES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexer.py')]
+
+def file_digest(path, digest=None):
+    """Returns the SHA-256 hash object of a file's content."""
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_BLOCKSIZE), b''):
+            digest.update(block)
+    return digest
+
+class ConversionCache:
+    def __init__(self, directory, tool_file, options=(), max_bytes=DEFAULT_MAX_BYTES):
+        """Cache for the tool implemented in tool_file, run with the given options."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        tool_digest = file_digest(tool_file)
+        for path in SHARED_SOURCES:
+            tool_digest = file_digest(path, tool_digest)
+        tool_digest.update(repr(sorted(options)).encode())
+        self.tool_digest = tool_digest.hexdigest()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path):
+        """Returns the cache key for converting the file at path."""
+        digest = hashlib.sha256(self.tool_digest.encode())
+        return file_digest(path, digest).hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def lookup(self, key):
+        """Returns the path of the cached output for key, or None."""
+        entry = self.entry(key)
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def store(self, key, output_path):
+        """Puts a copy of output_path into the cache."""
+        entry = self.entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry), suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(output_path, tmp_path)
+            os.replace(tmp_path, entry)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits into max_bytes."""
+        entries = []
+        total = 0
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def convert_cached(cache, convert, input_file, output_file):
+    """Runs convert(input_file, output_file) unless the cache has the result.
+
+    convert returns whether it changed output_file, and so does this
+    function. An output file that already holds the cached result is left
+    alone, so its timestamp stays as it is.
+    """
+    if cache is None:
+        return convert(input_file, output_file)
+
+    key = cache.key(input_file)
+    entry = cache.lookup(key)
+    if entry is not None:
+        with open(entry, 'r', newline='') as f:
+            return update_file(f, output_file)
+
+    changed = convert(input_file, output_file)
+    cache.store(key, output_file)
+    if os.path.abspath(input_file) == os.path.abspath(output_file):
+        # Edited in place: the next run sees the converted content as input,
+        # remember that it is final. The options of an in place cache must
+        # tell it apart from a regular one, as this is not a real conversion.
+        cache.store(cache.key(output_file), output_file)
+    return changed
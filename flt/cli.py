@@ -0,0 +1,76 @@
+# cli.py: One command for all the tools.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Runs any of the tools as a subcommand, so that a batch job can hand a whole
+list of files to one process instead of starting a script per file:
+
+    python -m flt fixed2free [options] file_or_directory ...
+    python -m flt lowercase [options] file ...
+    python -m flt ends [options] file_or_directory ...
+    python -m flt declarations [-o dir] [--symbols file] file_or_directory ...
+    python -m flt analyze [options] file_or_directory ...
+
+Only the module of the selected tool is imported, the options after the
+subcommand go to its main(). Starting up and doing a first small file takes
+at most STARTUP_BUDGET longer than starting a bare interpreter (tested in
+test_cli.py with FLT_TIMING_TESTS=1; 15 to 30 ms when this was written).
+"""
+
+import sys
+
+from flt import import_tool
+
+# seconds from process start to the first small file done, on top of the
+# start of a bare interpreter
+STARTUP_BUDGET = 0.1
+
+# subcommand: (directory, module, description)
+COMMANDS = {
+    'fixed2free': ('fixed2free', 'fixed2free2', "Convert fixed form source to free form."),
+    'lowercase': ('flowercase', 'flowercase', "Convert all uppercase code to lowercase."),
+    'ends': ('add_proper_endings', 'add_names_to_ends', "Add the unit names to 'end' statements."),
+    'declarations': ('fdeclarations', 'fdeclarations', "Print a wrapper separating arguments from local variables."),
+    'analyze': ('jfortran', 'file_analyzer', "Report undeclared variables and COMMON blocks."),
+}
+
+def usage():
+    width = max(len(command) for command in COMMANDS)
+    lines = ["usage: python -m flt <command> [options] files ...", "", "commands:"]
+    lines += [f"  {command:<{width}}  {description}" for command, (_, _, description) in COMMANDS.items()]
+    lines += ["", "Run 'python -m flt <command> --help' for the options of a command."]
+    return '\n'.join(lines)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0 if argv else 2
+
+    command = argv[0]
+    if command not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        print(f"\nflt: unknown command '{command}'", file=sys.stderr)
+        return 2
+
+    directory, module, _ = COMMANDS[command]
+    tool = import_tool(directory, module)
+    # usage and error messages of the tool show the subcommand
+    program = sys.argv[0]
+    sys.argv[0] = f"flt {command}"
+    try:
+        return tool.main(argv[1:])
+    finally:
+        sys.argv[0] = program
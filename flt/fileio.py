@@ -0,0 +1,110 @@
+# fileio.py: File handling shared by the conversion tools.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+from itertools import chain
+
+from flt import profiling
+
+# permissions of newly created files, mkstemp would only give us 0600
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+_BLOCKSIZE = 1 << 20
+
+def write_atomic(lines, path):
+    """Stream lines into a temporary file next to path, then rename it to path.
+
+    Only the line currently produced by the generator is held in memory.
+    The target is replaced in one step after all lines have been written,
+    so a crash half way through leaves an existing file untouched. This
+    makes it safe to read from path while writing to it (in place editing).
+    A symbolic link at path is written through, like open(path, 'w') does.
+    """
+    path = os.path.realpath(path)
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + name + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as outfile:
+            outfile.writelines(lines)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _read_prefix(path, size):
+    with open(path, 'r', newline='') as f:
+        while size > 0:
+            block = f.read(min(size, _BLOCKSIZE))
+            if not block:
+                break
+            size -= len(block)
+            yield block
+
+def update_file(lines, path, check=False):
+    """Write lines to path, unless path already has exactly this content.
+
+    The lines are compared to the file while they are produced. Nothing is
+    written as long as they match; at the first difference the matching
+    part is copied from the file and the rest is streamed after it (see
+    write_atomic). So a file that does not change keeps its timestamp.
+
+    Returns True if the content of path differs from lines. With check set,
+    path is never written, only compared.
+    """
+    with profiling.timing('write'):
+        changed = _update_file(lines, path, check)
+    if changed and not check:
+        profiling.wrote(path)
+    return changed
+
+def _update_file(lines, path, check):
+    lines = iter(lines)
+    try:
+        existing = open(path, 'r', newline='')
+    except FileNotFoundError:
+        if not check:
+            write_atomic(lines, path)
+        return True
+
+    with existing:
+        matched = 0
+        for line in lines:
+            if existing.read(len(line)) != line:
+                break
+            matched += len(line)
+        else:
+            if not existing.read(1):
+                return False
+            line = ''  # the file is longer than the new content
+
+    if not check:
+        write_atomic(chain(_read_prefix(path, matched), (line,), lines), path)
+    return True
+
+def report_check(changed):
+    """Print the files found by a --check run. Returns the exit status."""
+    for path in changed:
+        print(f"{path} would be changed.")
+    if not changed:
+        print("All files are up to date.")
+        return 0
+    return 1
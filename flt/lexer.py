@@ -0,0 +1,116 @@
+# lexer.py: Strings and comments of Fortran source, shared by all tools.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Splits Fortran source into code, strings and comments.
+
+All tools find strings and comments with split_code, split_comment and the
+helpers built on them, so they agree on where a string or a comment starts
+and this is the one place to make it fast. Continuation marks are left to
+the tools, as free and fixed form differ there. No tokens are shared
+between tools: each one splits the lines it looks at (see flt.pipeline).
+
+Strings are delimited by ' or " (a doubled quote inside a string reads as
+two adjacent strings, which gives the same split), a '!' outside a string
+starts a comment that goes on to the end of the line. A string that is not
+closed at the end of a line goes on in the next one; the functions that
+care take and return its delimiter (stringchar, '' outside a string).
+
+Lines are expected in free form; fixed form tools pass the code part of a
+line (after column 6).
+"""
+
+import re
+
+# strings (an open string goes on to the end of the text) and comments
+STRING_OR_COMMENT = re.compile(r"""('[^']*'?|"[^"]*"?|![^\n]*)""")
+
+def _has_delimiter(text):
+    return "'" in text or '"' in text or '!' in text
+
+def split_code(text, stringchar=''):
+    """Splits text, one or more lines, into [code, string or comment, code, ..., code].
+
+    The list always has code at the even positions (possibly empty) and
+    strings or comments at the odd ones, so ''.join(pieces[0::2]) is the
+    code without strings and comments. stringchar is the delimiter of a
+    string left open by the previous line. Returns the pieces and the
+    delimiter of a string left open at the end of text, or ''.
+    """
+    prefix = []
+    if stringchar:
+        end = text.find(stringchar) + 1
+        if end == 0:
+            return ['', text, ''], stringchar
+        prefix = ['', text[:end]]
+        text = text[end:]
+
+    if not _has_delimiter(text):
+        return prefix + [text], ''
+
+    pieces = STRING_OR_COMMENT.split(text)
+    stringchar = ''
+    last = pieces[-2]
+    if last[0] != '!' and (len(last) == 1 or last[-1] != last[0]):
+        stringchar = last[0]
+    return prefix + pieces, stringchar
+
+def split_comment(code, stringchar=''):
+    """Splits a line into (code, inline comment); the comment keeps its '!' and newline.
+
+    A line that ends inside a string has no comment.
+    """
+    # Jump from delimiter to delimiter with str.find instead of looking at
+    # every character; most lines contain neither a quote nor a '!'.
+    position = 0
+    if stringchar:
+        position = code.find(stringchar) + 1
+        if position == 0:
+            return code, ""
+
+    while True:
+        column = code.find("!", position)
+        if column < 0:
+            return code, ""
+
+        single = code.find("'", position, column)
+        double = code.find('"', position, column)
+        if single < 0 and double < 0:
+            return code[:column], code[column:]
+
+        # skip the string that starts before the '!'
+        start = double if single < 0 or 0 <= double < single else single
+        position = code.find(code[start], start + 1) + 1
+        if position == 0:
+            # unterminated string
+            return code, ""
+
+def strip_comment(line):
+    """Returns line without its inline comment (and without the newline that ends it)."""
+    if '!' not in line:
+        return line
+    return split_comment(line)[0]
+
+def remove_strings(code):
+    """Removes the string literals, both '...' and "...", from a line without comment."""
+    if "'" not in code and '"' not in code:
+        return code
+    return ''.join(split_code(code)[0][0::2])
+
+def code_text(line):
+    """Returns the code of a line, without strings and comment."""
+    if not _has_delimiter(line):
+        return line
+    return ''.join(split_code(line)[0][0::2])
@@ -0,0 +1,181 @@
+# pipeline.py: Run several conversion tools over a file, reading and writing it once.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Chains the line generators of the conversion tools, so that a file is read
+once and written once no matter how many stages are applied:
+
+    fixed2free  fixed2free2.convertToFree
+    lowercase   flowercase.convert_to_lowercase
+    ends        add_names_to_ends.process_fortran_lines
+
+The stages always run in this order; the result is the same as running the
+tools one after another. This saves the file input and output between the
+tools, not the scanning: every stage still finds the strings and comments
+of each line itself with flt.lexer (fixed2free on the fixed form code,
+lowercase and ends on the free form lines), there is no token stream that
+the stages share.
+
+Usage (from the repository root):
+
+    python -m flt.pipeline [--stages fixed2free,lowercase] file_or_directory
+"""
+
+import argparse
+import os
+import sys
+
+from flt import import_tool
+from flt.batch import find_source_files, mirror_path, read_text, run_pipeline, run_tasks, text_lines
+from flt.fileio import update_file, report_check
+from flt import profiling
+
+STAGES = ('fixed2free', 'lowercase', 'ends')
+
+FREE_FORM_SUFFIXES = ['.f90', '.F90', '.src']
+
+def _fixed2free(lines):
+    return import_tool('fixed2free', 'fixed2free2').convertToFree(lines)
+
+def _lowercase(lines):
+    return import_tool('flowercase', 'flowercase').convert_to_lowercase(lines)
+
+def _ends(lines):
+    ends = import_tool('add_proper_endings', 'add_names_to_ends')
+    return ends.process_fortran_lines(lines)
+
+_STAGE_FUNCTIONS = {'fixed2free': _fixed2free, 'lowercase': _lowercase, 'ends': _ends}
+
+def convert_lines(lines, stages=STAGES):
+    """Returns a generator of lines that went through all selected stages."""
+    for stage in STAGES:
+        if stage in stages:
+            lines = profiling.stage(stage, _STAGE_FUNCTIONS[stage](lines))
+    return lines
+
+def output_name(filename, stages):
+    """Returns the name of the converted file."""
+    if 'fixed2free' in stages:
+        return import_tool('fixed2free', 'fixed2free2').free_form_name(filename)
+    return filename
+
+def convert_file(input_file, output_file, stages=STAGES, check=False):
+    """Read input_file once, run it through the stages, write output_file at most once.
+
+    Returns True if output_file changed (with check set: would change).
+    """
+    with open(input_file, 'r') as infile:
+        return update_file(convert_lines(profiling.source(infile, input_file), stages), output_file, check)
+
+def _convert_file_job(job):
+    input_file, output_file, stages, check = job
+    return output_file if convert_file(input_file, output_file, stages, check) else None
+
+# the stages of a pipelined convert_tree, see flt.batch.run_pipeline
+def _read_job(job):
+    return read_text(job[0])
+
+def _convert_text_job(job, text):
+    return ''.join(convert_lines(text_lines(text), job[2]))
+
+def _write_job(job, text):
+    input_file, output_file, stages, check = job
+    return output_file if update_file([text], output_file, check) else None
+
+def convert_tree(input_dir, output_dir, stages=STAGES, suffixes=None, jobs=None, inplace=False, check=False,
+                 profiler=None):
+    """Convert all files below input_dir in a pool of worker processes.
+
+    Returns the sorted list of output files that changed (with check set:
+    would change). A flt.profiling.Profiler measures every file, otherwise
+    the files are read and written by threads while the workers convert
+    others (flt.batch.run_pipeline).
+    """
+    if suffixes is None:
+        fixed2free2 = import_tool('fixed2free', 'fixed2free2')
+        suffixes = fixed2free2.FIXED_FORM_SUFFIXES if 'fixed2free' in stages else FREE_FORM_SUFFIXES
+
+    tasks = []
+    for input_path in find_source_files(input_dir, suffixes):
+        if inplace:
+            output_path = input_path
+        else:
+            output_path = mirror_path(input_path, input_dir, output_dir,
+                                      lambda name: output_name(name, stages), makedirs=not check)
+        tasks.append((input_path, output_path, stages, check))
+
+    weight = lambda task: os.path.getsize(task[0])
+    if profiler is None:
+        results = run_pipeline(_read_job, _convert_text_job, _write_job, tasks, jobs, weight=weight,
+                               stream=_convert_file_job)
+    else:
+        results = run_tasks(_convert_file_job, tasks, jobs, weight=weight, profiler=profiler)
+    return sorted(filter(None, results))
+
+def parse_stages(text):
+    stages = [stage.strip() for stage in text.split(',') if stage.strip()]
+    for stage in stages:
+        if stage not in STAGES:
+            raise argparse.ArgumentTypeError(f"unknown stage '{stage}', choose from {', '.join(STAGES)}")
+    return stages
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run fixed2free, lowercase and end-name conversion, reading and writing every file once.")
+    parser.add_argument("input_file", help="Input Fortran file or a directory tree of such files.")
+    parser.add_argument("-i", "--inplace", action="store_true", help="Edit the file in place.")
+    parser.add_argument("-o", "--output", help="Redirect to an output file or, for a directory, an output tree (default: converted_<input_file>).")
+    parser.add_argument("-s", "--stages", type=parse_stages, default=list(STAGES), help="Comma separated stages to run (default: %s)." % ','.join(STAGES))
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes for a directory tree (default: number of cores).")
+    parser.add_argument("--suffix", action="append", dest="suffixes", help="File suffix to convert in a directory tree, may be repeated.")
+    parser.add_argument("--check", action="store_true", help="Only report the files that would change and exit with status 1 if there are any.")
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    profiler = profiling.from_args(args)
+
+    input_file = args.input_file
+    output_file = args.output
+
+    if os.path.isdir(input_file):
+        output_dir = output_file
+        if not output_dir and not args.inplace:
+            output_dir = f"converted_{os.path.basename(os.path.normpath(input_file))}"
+        changed = convert_tree(input_file, output_dir, args.stages, args.suffixes,
+                               jobs=args.jobs, inplace=args.inplace, check=args.check, profiler=profiler)
+        if profiler is not None:
+            profiler.report()
+        if args.check:
+            return report_check(changed)
+        print(f"Conversion completed. {len(changed)} files written to {output_dir if not args.inplace else input_file}.")
+        return
+
+    if not output_file:
+        output_file = f"converted_{output_name(os.path.basename(input_file), args.stages)}"
+    if args.inplace:
+        output_file = input_file
+
+    changed = profiling.call(profiler, convert_file, input_file, output_file, args.stages, args.check)
+    if profiler is not None:
+        profiler.report()
+    if args.check:
+        return report_check([output_file] if changed else [])
+    if not changed:
+        print(f"{output_file} is unchanged, nothing to do.")
+        return
+
+    print(f"Conversion completed. Output written to {output_file}.")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# profiling.py: Time per stage for the --profile option of the tools.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures where the time of a run goes: per stage, per file, in lines per
+second, and the bytes read and written.
+
+The tools mark their stages with source() for the input lines, stage() for
+a line generator and timing() for any other piece of work; update_file()
+times the comparison and writing of the output as 'write'. Time spent in a
+stage while it waits for the stage before it counts for that one, so the
+stage times add up to the time per file, and whatever is not in a stage is
+'other'.
+
+A file is measured by running its job through call() or run_tasks(...,
+profiler=...), also in worker processes; the measurements are sent back and
+collected by a Profiler. When no file is being measured, the marks return
+their input unchanged: the cost is a global lookup per file.
+"""
+
+import contextlib
+import functools
+import os
+import sys
+import time
+
+# the FileProfile of the job running in this process, None when not profiling
+_current = None
+
+_NO_TIMING = contextlib.nullcontext()
+
+class FileProfile:
+    """Measurements of one job, usually one file."""
+
+    def __init__(self):
+        self.path = None
+        self.lines = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.stages = {'other': 0.0}  # stage name -> seconds
+        self.start = time.time()
+        self.elapsed = 0.0
+        self.pid = os.getpid()
+        self.cprofile_stats = None
+        self._stack = ['other']
+        self._mark = time.perf_counter()
+
+    def enter(self, name):
+        now = time.perf_counter()
+        self.stages[self._stack[-1]] += now - self._mark
+        self.stages.setdefault(name, 0.0)
+        self._stack.append(name)
+        self._mark = now
+
+    def leave(self):
+        now = time.perf_counter()
+        self.stages[self._stack.pop()] += now - self._mark
+        self._mark = now
+
+    def finish(self):
+        while self._stack:
+            self.leave()
+        self.elapsed = sum(self.stages.values())
+
+def _timed(profile, name, iterable):
+    iterator = iter(iterable)
+    while True:
+        profile.enter(name)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            profile.leave()
+        yield item
+
+def _counted(profile, lines):
+    for line in lines:
+        profile.lines += 1
+        yield line
+
+def source(lines, path):
+    """Returns the lines read from the file path, timed as 'read' and counted."""
+    if _current is None:
+        return lines
+    if _current.path is None:
+        _current.path = path
+    _current.bytes_read += os.path.getsize(path)
+    return _timed(_current, 'read', _counted(_current, lines))
+
+def stage(name, lines):
+    """Returns the line generator lines, timed as stage name."""
+    if _current is None:
+        return lines
+    return _timed(_current, name, lines)
+
+@contextlib.contextmanager
+def _timing(profile, name):
+    profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.leave()
+
+def timing(name):
+    """Context manager that times its block as stage name."""
+    if _current is None:
+        return _NO_TIMING
+    return _timing(_current, name)
+
+def wrote(path):
+    """Counts the size of the file path as written."""
+    if _current is not None:
+        _current.bytes_written += os.path.getsize(path)
+
+def _run(function, args, kwargs, cprofile):
+    global _current
+    record = _current = FileProfile()
+    profiler = None
+    if cprofile:
+        import cProfile  # only when asked for, like pstats and json below
+        profiler = cProfile.Profile()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        result = function(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _current = None
+        record.finish()
+    if profiler is not None:
+        profiler.create_stats()
+        record.cprofile_stats = profiler.stats
+    return result, record
+
+def _run_task(function, cprofile, task):
+    return _run(function, (task,), {}, cprofile)
+
+def call(profiler, function, *args, **kwargs):
+    """Returns function(*args, **kwargs), measured by profiler unless that is None."""
+    if profiler is None:
+        return function(*args, **kwargs)
+    result, record = _run(function, args, kwargs, profiler.dump is not None)
+    profiler.add(record)
+    return result
+
+class _Stats:
+    """A finished cProfile.Profile as far as pstats.Stats is concerned."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class Profiler:
+    """
+    Collects the FileProfile of every job of a run. report() prints the
+    summary, the slowest top files, and writes the cProfile statistics of
+    all jobs to dump and a Chrome trace (chrome://tracing, Perfetto) with an
+    event per file to trace, if they are given.
+    """
+
+    def __init__(self, top=10, dump=None, trace=None):
+        self.top = top
+        self.dump = dump
+        self.trace = trace
+        self.records = []
+        self.start = time.perf_counter()
+
+    def task_function(self, function):
+        """Returns a picklable function that runs function(task) and returns (result, FileProfile)."""
+        return functools.partial(_run_task, function, self.dump is not None)
+
+    def add(self, record):
+        self.records.append(record)
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        wall = time.perf_counter() - self.start
+        records = self.records
+        lines = sum(record.lines for record in records)
+        busy = sum(record.elapsed for record in records)
+        stages = {}
+        for record in records:
+            for name, seconds in record.stages.items():
+                stages[name] = stages.get(name, 0.0) + seconds
+
+        print(f"\nProfile: {len(records)} files, {lines:,} lines, "
+              f"{sum(record.bytes_read for record in records):,} bytes read, "
+              f"{sum(record.bytes_written for record in records):,} bytes written, "
+              f"{wall:.3f} s wall time", file=file)
+        print(f"{'stage':<12} {'time':>10} {'share':>7} {'lines/s':>13}", file=file)
+        for name, seconds in sorted(stages.items(), key=lambda item: -item[1]):
+            share = 100 * seconds / busy if busy else 0.0
+            rate = lines / seconds if seconds else 0.0
+            print(f"{name:<12} {seconds:9.3f}s {share:6.1f}% {rate:13,.0f}", file=file)
+        print(f"{'total':<12} {busy:9.3f}s {100.0:6.1f}% {lines / busy if busy else 0.0:13,.0f}", file=file)
+
+        slowest = sorted(records, key=lambda record: -record.elapsed)[:self.top]
+        if slowest:
+            print(f"\nSlowest {len(slowest)} files:", file=file)
+            for record in slowest:
+                print(f"{record.elapsed:9.3f}s {record.lines:9,} lines  {record.path}", file=file)
+
+        if self.dump is not None:
+            import pstats
+            stats = [_Stats(record.cprofile_stats) for record in records if record.cprofile_stats]
+            if stats:
+                pstats.Stats(*stats).dump_stats(self.dump)
+                print(f"cProfile statistics written to {self.dump}.", file=file)
+        if self.trace is not None:
+            self.write_trace(self.trace)
+            print(f"Trace written to {self.trace}.", file=file)
+
+    def write_trace(self, path):
+        """Writes a Chrome trace-event file with a complete event per file."""
+        import json
+        origin = min((record.start for record in self.records), default=0.0)
+        events = [{
+            'name': record.path or '?',
+            'cat': 'file',
+            'ph': 'X',
+            'ts': (record.start - origin) * 1e6,
+            'dur': record.elapsed * 1e6,
+            'pid': record.pid,
+            'tid': record.pid,
+            'args': dict(lines=record.lines, bytes_read=record.bytes_read,
+                         bytes_written=record.bytes_written,
+                         **{f'{name} s': seconds for name, seconds in record.stages.items()}),
+        } for record in self.records]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def add_arguments(parser):
+    """Adds the --profile options to an argparse parser."""
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", action="store_true", help="Report the time per stage, lines/s, bytes read and written and the slowest files on stderr.")
+    group.add_argument("--profile-top", type=int, default=10, metavar="N", help="Number of slowest files to report (default: %(default)s).")
+    group.add_argument("--profile-dump", metavar="FILE", help="Write cProfile statistics of all files to FILE (implies --profile).")
+    group.add_argument("--profile-trace", metavar="FILE", help="Write a Chrome trace-event JSON file with an event per file to FILE (implies --profile).")
+
+def from_args(args):
+    """Returns the Profiler asked for by the options of add_arguments, or None."""
+    if not (args.profile or args.profile_dump or args.profile_trace):
+        return None
+    return Profiler(args.profile_top, args.profile_dump, args.profile_trace)
@@ -0,0 +1,203 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from flt.profiling import Profiler
+from flt.batch import (find_source_files, mirror_path, output_collision, read_text, run_conversions, run_pipeline,
+                       run_tasks, stream_tasks, text_lines)
+from flt.fileio import update_file
+
+def upper(task, text):
+    return ''.join(line.upper() for line in text_lines(text))
+
+def read_task(task):
+    return read_text(task[0])
+
+def write_task(task, text):
+    with open(task[1], 'w') as f:
+        f.write(text)
+    return task[1]
+
+def upper_lines(lines):
+    for line in lines:
+        yield line.upper()
+
+def upper_file(input_file, output_file, check=False):
+    with open(input_file) as f:
+        return update_file(upper_lines(f), output_file, check)
+
+def numbered_lines(path):
+    if path == 'missing':
+        yield 'first'
+    with open(path) as f:
+        for number, line in enumerate(f):
+            yield (path, number, line)
+
+def stream_task(task):
+    return 'streamed'
+
+def fail(task, text):
+    raise ValueError(task[0])
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmpdir.name, 'in')
+        self.output_dir = os.path.join(self.tmpdir.name, 'out')
+        os.makedirs(os.path.join(self.input_dir, 'sub'))
+        for i in range(12):
+            with open(os.path.join(self.input_dir, 'sub' if i % 2 else '', f'f{i}.f90'), 'w') as f:
+                f.write(f"program p{i}\n" * (i + 1) + "end\x0c\n")
+        self.tasks = [(path, mirror_path(path, self.input_dir, self.output_dir))
+                      for path in find_source_files(self.input_dir, ['.f90'])]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_outputs(self, outputs):
+        self.assertEqual(sorted(outputs), sorted(output for _, output in self.tasks))
+        for input_path, output_path in self.tasks:
+            with open(input_path) as f, open(output_path) as g:
+                self.assertEqual(g.read(), f.read().upper())
+
+    def test_run_pipeline(self):
+        for jobs in [1, 2]:
+            self.check_outputs(list(run_pipeline(read_task, upper, write_task, self.tasks, jobs=jobs, threads=2,
+                                                 weight=lambda task: os.path.getsize(task[0]))))
+
+        # without writing, the results of convert
+        texts = run_pipeline(read_task, upper, None, self.tasks, jobs=2, threads=3, depth=1)
+        self.assertEqual(sorted(texts), sorted(upper(None, read_task(task)) for task in self.tasks))
+
+    def test_depth(self):
+        lock = threading.Lock()
+        counts = {'in_flight': 0, 'most': 0}
+
+        def read(task):
+            with lock:
+                counts['in_flight'] += 1
+                counts['most'] = max(counts['most'], counts['in_flight'])
+            return read_task(task)
+
+        def write(task, text):
+            with lock:
+                counts['in_flight'] -= 1
+            return write_task(task, text)
+
+        self.check_outputs(list(run_pipeline(read, upper, write, self.tasks, jobs=1, threads=4, depth=3)))
+        self.assertLessEqual(counts['most'], 3)
+        self.assertEqual(counts['in_flight'], 0)
+
+    def test_max_bytes(self):
+        lock = threading.Lock()
+        counts = {'bytes': 0, 'most': 0}
+        weight = lambda task: os.path.getsize(task[0])
+
+        def read(task):
+            with lock:
+                counts['bytes'] += weight(task)
+                counts['most'] = max(counts['most'], counts['bytes'])
+            return read_task(task)
+
+        def write(task, text):
+            with lock:
+                counts['bytes'] -= weight(task)
+            return write_task(task, text)
+
+        for max_bytes in [60, 200]:
+            counts['most'] = 0
+            self.check_outputs(list(run_pipeline(read, upper, write, self.tasks, jobs=1, weight=weight,
+                                                 max_bytes=max_bytes)))
+            # a heavier task runs alone
+            self.assertLessEqual(counts['most'], max(max_bytes, max(map(weight, self.tasks))))
+            self.assertEqual(counts['bytes'], 0)
+
+    def test_stream(self):
+        weight = lambda task: os.path.getsize(task[0])
+        heavy = [task for task in self.tasks if weight(task) > 60]
+        self.assertTrue(0 < len(heavy) < len(self.tasks))
+        for jobs in [1, 2]:
+            results = list(run_pipeline(read_task, upper, None, self.tasks, jobs=jobs, weight=weight,
+                                        ordered=True, stream=stream_task, stream_bytes=60))
+            self.assertEqual(results, ['streamed' if weight(task) > 60 else upper(None, read_task(task))
+                                       for task in sorted(self.tasks, key=weight, reverse=True)])
+
+        # a single task is always streamed
+        self.assertEqual(list(run_pipeline(read_task, upper, None, self.tasks[:1], stream=stream_task)),
+                         ['streamed'])
+
+    def test_ordered(self):
+        lock = threading.Lock()
+        counts = {'in_flight': 0, 'most': 0}
+
+        def read(task):
+            with lock:
+                counts['in_flight'] += 1
+                counts['most'] = max(counts['most'], counts['in_flight'])
+            if task is self.tasks[0]:
+                time.sleep(0.05)  # the others finish first and have to wait
+            return read_task(task)
+
+        # a task counts from the start of reading until its result is taken
+        texts = []
+        for text in run_pipeline(read, upper, None, self.tasks, jobs=1, threads=4, depth=3, ordered=True):
+            with lock:
+                counts['in_flight'] -= 1
+            texts.append(text)
+        self.assertEqual(texts, [upper(None, read_task(task)) for task in self.tasks])
+        self.assertLessEqual(counts['most'], 3)
+
+    def test_profiler(self):
+        profiler = Profiler()
+        outputs = list(run_pipeline(read_task, upper, write_task, self.tasks, jobs=2, ordered=True, profiler=profiler))
+        self.assertEqual(outputs, [output for _, output in self.tasks])
+        self.check_outputs(outputs)
+        self.assertEqual(len(profiler.records), len(self.tasks))
+
+    def test_errors(self):
+        for jobs in [1, 2]:
+            with self.assertRaises(ValueError):
+                list(run_pipeline(read_task, fail, write_task, self.tasks, jobs=jobs))
+            with self.assertRaises(FileNotFoundError):
+                list(run_pipeline(read_task, upper, write_task, self.tasks + [('missing', 'x')], jobs=jobs))
+
+    def test_run_conversions(self):
+        outputs = sorted(output for _, output in self.tasks)
+        self.assertEqual(run_conversions(upper_lines, upper_file, self.tasks, jobs=2, check=True), outputs)
+        self.assertEqual(run_conversions(upper_lines, upper_file, self.tasks, jobs=2), outputs)
+        self.check_outputs(outputs)
+        self.assertEqual(run_conversions(upper_lines, upper_file, self.tasks, jobs=2, profiler=Profiler()), [])
+        self.assertEqual(run_conversions(upper_lines, upper_file, self.tasks[:1], jobs=2, check=True), [])
+
+    def test_output_collision(self):
+        self.assertIsNone(output_collision(self.tasks))
+        self.assertIsNone(output_collision([('a.f', 'a.f'), ('./a.f', 'a.f')]))
+        self.assertEqual(output_collision([('a/x.f', 'x.f90'), ('y.f', 'y.f90'), ('b/x.f', './x.f90')]),
+                         ('a/x.f', 'b/x.f', './x.f90'))
+
+    def test_stream_tasks(self):
+        paths = [task[0] for task in self.tasks]
+        expected = [item for path in paths for item in numbered_lines(path)]
+        for jobs in [1, 2]:
+            self.assertEqual(list(stream_tasks(numbered_lines, paths, jobs=jobs, batch_size=2)), expected)
+        profiler = Profiler()
+        self.assertEqual(list(stream_tasks(numbered_lines, paths, jobs=2, profiler=profiler)), expected)
+        self.assertEqual(len(profiler.records), len(paths))
+        self.assertEqual(list(stream_tasks(numbered_lines, [], jobs=2, profiler=profiler)), [])
+
+        # the items before the error still come
+        items = []
+        with self.assertRaises(FileNotFoundError):
+            for item in stream_tasks(numbered_lines, paths[:1] + ['missing'] + paths[1:], jobs=2, batch_size=1):
+                items.append(item)
+        self.assertEqual(items, list(numbered_lines(paths[0])) + ['first'])
+
+    def test_run_tasks(self):
+        self.assertEqual(sorted(run_tasks(os.path.getsize, [task[0] for task in self.tasks], jobs=2)),
+                         sorted(os.path.getsize(task[0]) for task in self.tasks))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+
+from flt import cache as cache_module
+from flt.cache import ConversionCache, convert_cached
+
+def upper(input_file, output_file):
+    with open(input_file) as f:
+        content = f.read()
+    with open(output_file, 'w') as f:
+        f.write(content.upper())
+    upper.calls += 1
+    return True
+
+class TestConversionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input = self.path("input.f")
+        self.output = self.path("output.f90")
+        self.write(self.input, "a = b\n")
+        upper.calls = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def make_cache(self, options=(), max_bytes=2**20):
+        return ConversionCache(self.path("cache"), __file__, options, max_bytes)
+
+    def test_unchanged_input_is_skipped(self):
+        cache = self.make_cache()
+        self.assertTrue(convert_cached(cache, upper, self.input, self.output))
+        os.utime(self.output, (0, 0))
+        self.assertFalse(convert_cached(cache, upper, self.input, self.output))
+        self.assertEqual(upper.calls, 1)
+        self.assertEqual(os.stat(self.output).st_mtime, 0)
+
+    def test_missing_output_is_restored(self):
+        cache = self.make_cache()
+        convert_cached(cache, upper, self.input, self.output)
+        os.unlink(self.output)
+        self.assertTrue(convert_cached(cache, upper, self.input, self.output))
+        self.assertEqual(upper.calls, 1)
+        self.assertEqual(self.read(self.output), "A = B\n")
+
+    def test_changed_input_or_options(self):
+        convert_cached(self.make_cache(), upper, self.input, self.output)
+        self.write(self.input, "c = d\n")
+        convert_cached(self.make_cache(), upper, self.input, self.output)
+        convert_cached(self.make_cache([('inplace', True)]), upper, self.input, self.output)
+        self.assertEqual(upper.calls, 3)
+        self.assertEqual(self.read(self.output), "C = D\n")
+
+    def test_changed_shared_source(self):
+        shared = self.path("lexer.py")
+        self.write(shared, "# version 1\n")
+        sources = cache_module.SHARED_SOURCES
+        cache_module.SHARED_SOURCES = sources + [shared]
+        try:
+            convert_cached(self.make_cache(), upper, self.input, self.output)
+            convert_cached(self.make_cache(), upper, self.input, self.output)
+            self.write(shared, "# version 2\n")
+            convert_cached(self.make_cache(), upper, self.input, self.output)
+        finally:
+            cache_module.SHARED_SOURCES = sources
+        self.assertEqual(upper.calls, 2)
+
+    def test_inplace_rerun(self):
+        cache = self.make_cache([('inplace', True)])
+        self.assertTrue(convert_cached(cache, upper, self.input, self.input))
+        self.assertFalse(convert_cached(cache, upper, self.input, self.input))
+        self.assertEqual(upper.calls, 1)
+
+    def test_lru_eviction(self):
+        cache = self.make_cache(max_bytes=12)
+        for n, name in enumerate("abc"):
+            path = self.path(name)
+            self.write(path, "%s = 1\n" % name)
+            os.utime(path, (n, n))
+            convert_cached(cache, upper, path, path + ".out")
+            os.utime(cache.entry(cache.key(path)), (n, n))
+        cache.lookup(cache.key(self.path("a")))
+        cache.evict()
+        self.assertIsNotNone(cache.lookup(cache.key(self.path("a"))))
+        self.assertIsNone(cache.lookup(cache.key(self.path("b"))))
+        self.assertIsNotNone(cache.lookup(cache.key(self.path("c"))))
+
+if __name__ == "__main__":
+    unittest.main()
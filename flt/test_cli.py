@@ -0,0 +1,82 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from flt import ROOT
+from flt.cli import main, COMMANDS, STARTUP_BUDGET
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for name in ('a.f90', 'b.f90'):
+            path = os.path.join(self.tmpdir.name, name)
+            with open(path, 'w') as f:
+                f.write("SUBROUTINE S\nX = 1 ! KEEP\nEND\n")
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_main(self, argv):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            status = main(argv)
+        return status, out.getvalue()
+
+    def python(self, code):
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        return subprocess.run([sys.executable, '-c', code], env=env, cwd=self.tmpdir.name,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+
+    def test_many_files_in_one_process(self):
+        self.assertEqual(self.run_main(['lowercase', '-i', '--check'] + self.paths)[0], 1)
+        self.run_main(['lowercase', '-i'] + self.paths)
+        self.run_main(['ends'] + self.paths)
+        self.assertEqual(self.run_main(['lowercase', '-i', '--check'] + self.paths)[0], 0)
+        for path in self.paths:
+            with open(path) as f:
+                self.assertEqual(f.read(), "subroutine s\nx = 1 ! KEEP\nend subroutine s\n")
+
+    def test_usage(self):
+        status, out = self.run_main(['--help'])
+        self.assertEqual(status, 0)
+        for command in COMMANDS:
+            self.assertIn(command, out)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(main(['nonsense']), 2)
+
+    def test_imports_only_the_selected_tool(self):
+        out = self.python("import sys\n"
+                          "from flt.cli import main\n"
+                          "main(['lowercase', '--check', 'a.f90'])\n"
+                          "print(' '.join(sys.modules))\n").stdout
+        modules = out.split()
+        self.assertIn('flowercase', modules)
+        for module in ('fixed2free2', 'add_names_to_ends', 'fdeclarations', 'file_analyzer', 'multiprocessing'):
+            self.assertNotIn(module, modules)
+
+    # wall clock times are unreliable on a loaded machine, only run on request
+    @unittest.skipUnless(os.environ.get('FLT_TIMING_TESTS'), "set FLT_TIMING_TESTS=1 to check the startup time")
+    def test_startup_budget(self):
+        def best_time(code):
+            times = []
+            for _ in range(3):
+                start = time.perf_counter()
+                self.python(code)
+                times.append(time.perf_counter() - start)
+            return min(times)
+
+        bare = best_time("pass")
+        for command, argv in [('fixed2free', ['--check', 'a.f90']), ('lowercase', ['--check', 'a.f90']),
+                              ('analyze', ['a.f90'])]:
+            elapsed = best_time(f"from flt.cli import main\nmain({[command] + argv!r})")
+            self.assertLess(elapsed - bare, STARTUP_BUDGET, command)
+
+if __name__ == '__main__':
+    unittest.main()
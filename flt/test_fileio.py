@@ -0,0 +1,102 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from flt.fileio import write_atomic, update_file
+
+class TestWriteAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "file.f90")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def test_streams_generator(self):
+        write_atomic(("line %d\n" % i for i in range(3)), self.path)
+        self.assertEqual(self.read(), "line 0\nline 1\nline 2\n")
+        self.assertEqual(os.listdir(self.tmpdir.name), ["file.f90"])
+
+    def test_failure_keeps_original(self):
+        with open(self.path, 'w') as f:
+            f.write("original\n")
+
+        def failing():
+            yield "partial\n"
+            raise RuntimeError("conversion failed")
+
+        with self.assertRaises(RuntimeError):
+            write_atomic(failing(), self.path)
+        self.assertEqual(self.read(), "original\n")
+        self.assertEqual(os.listdir(self.tmpdir.name), ["file.f90"])
+
+    def test_inplace_keeps_mode(self):
+        with open(self.path, 'w') as f:
+            f.write("A\nB\n")
+        os.chmod(self.path, 0o640)
+        with open(self.path) as f:
+            write_atomic((line.lower() for line in f), self.path)
+        self.assertEqual(self.read(), "a\nb\n")
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o640)
+
+    def test_writes_through_symlink(self):
+        with open(self.path, 'w') as f:
+            f.write("A\n")
+        link = os.path.join(self.tmpdir.name, "link.f90")
+        os.symlink("file.f90", link)
+        with open(link) as f:
+            write_atomic((line.lower() for line in f), link)
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(self.read(), "a\n")
+
+class TestUpdateFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "file.f90")
+        with open(self.path, 'w') as f:
+            f.write("a\nb\nc\n")
+        os.utime(self.path, ns=(0, 0))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    def test_same_content_is_not_written(self):
+        # split differently than the file, compared as one stream
+        self.assertFalse(update_file(["a\nb", "\nc\n"], self.path))
+        self.assertEqual(os.stat(self.path).st_mtime_ns, 0)
+
+    def test_changes(self):
+        for content in (["a\nb\n"], ["a\nb\nc\nd\n"], ["a\n", "B\n", "c\n"], []):
+            self.assertTrue(update_file(iter(content), self.path, check=True))
+            self.assertEqual(self.read(), "a\nb\nc\n")
+            self.assertEqual(os.stat(self.path).st_mtime_ns, 0)
+
+            self.assertTrue(update_file(iter(content), self.path))
+            self.assertEqual(self.read(), ''.join(content))
+            with open(self.path, 'w') as f:
+                f.write("a\nb\nc\n")
+            os.utime(self.path, ns=(0, 0))
+
+    def test_inplace_with_missing_file(self):
+        with open(self.path) as f:
+            self.assertTrue(update_file((line.upper() for line in f), self.path))
+        self.assertEqual(self.read(), "A\nB\nC\n")
+        new_path = self.path + ".new"
+        self.assertTrue(update_file(["x\n"], new_path, check=True))
+        self.assertFalse(os.path.exists(new_path))
+        self.assertTrue(update_file(["x\n"], new_path))
+        self.assertFalse(update_file(["x\n"], new_path))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import random
+import unittest
+
+from flt.lexer import split_code, split_comment, strip_comment, remove_strings, code_text
+
+class TestLexer(unittest.TestCase):
+
+    def test_split_code(self):
+        self.assertEqual(split_code("x = 1\n"), (["x = 1\n"], ''))
+        self.assertEqual(split_code("c = 'a!b' // \"it's\" ! note\n"),
+                         (["c = ", "'a!b'", " // ", "\"it's\"", " ", "! note", "\n"], ''))
+        self.assertEqual(split_code("c = 'open\n"), (["c = ", "'open\n", ""], "'"))
+        self.assertEqual(split_code("still open\n", "'"), (["", "still open\n", ""], "'"))
+        self.assertEqual(split_code("end' ! c\n", "'"), (["", "end'", " ", "! c", "\n"], ''))
+
+    def test_split_comment(self):
+        self.assertEqual(split_comment("X = 1 ! c\n"), ("X = 1 ", "! c\n"))
+        self.assertEqual(split_comment("C = 'IT''S!' !\n"), ("C = 'IT''S!' ", "!\n"))
+        self.assertEqual(split_comment("C = \"OPEN ! \n"), ("C = \"OPEN ! \n", ""))
+        self.assertEqual(split_comment("ing!' ! c\n", "'"), ("ing!' ", "! c\n"))
+        self.assertEqual(strip_comment("x = 1 ! c\n"), "x = 1 ")
+
+    def test_strings_removed(self):
+        self.assertEqual(remove_strings("print *, 'a', x, \"b\""), "print *, , x, ")
+        self.assertEqual(code_text("print *, \"x!\", y ! z\n"), "print *, , y \n")
+
+    def test_consistent(self):
+        rng = random.Random(7)
+        alphabet = "ab '\"!&\n"
+        for _ in range(2000):
+            line = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            stringchar = rng.choice(["", "'", '"'])
+            pieces, open_stringchar = split_code(line, stringchar)
+            self.assertEqual(''.join(pieces), line)
+            if '\n' not in line[:-1]:
+                comments = [index for index in range(1, len(pieces), 2)
+                            if pieces[index].startswith('!') and not (stringchar and index == 1)]
+                expected = (line, '')
+                if comments:
+                    expected = (''.join(pieces[:comments[0]]), ''.join(pieces[comments[0]:]))
+                self.assertEqual(split_comment(line, stringchar), expected, repr(line))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flt import import_tool
+from flt.pipeline import convert_file, convert_tree, output_name
+
+FIXED_FORM = """\
+      SUBROUTINE FOO(A, B,
+     &               C)
+C     Sets A from B and C
+      REAL*8 A, B, C
+      A = B + C   ! SUM
+      CALL BAR('HELLO',
+     &         8HCHECKING)
+      END
+      INTEGER FUNCTION IFUNC(X)
+      IFUNC = 1
+      END
+"""
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmpdir.name, "foo.f")
+        with open(self.input, 'w') as f:
+            f.write(FIXED_FORM)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def sequential(self, path):
+        """Run the tools one after another, the way it was done before."""
+        fixed2free2 = import_tool('fixed2free', 'fixed2free2')
+        flowercase = import_tool('flowercase', 'flowercase')
+        ends = import_tool('add_proper_endings', 'add_names_to_ends')
+        step1 = path + ".1"
+        step2 = path + ".2"
+        fixed2free2.convert_file(path, step1)
+        flowercase.convert_file(step1, step2)
+        ends.replace_generic_end(step2)
+        ends.process_fortran_file(step2)
+        with open(step2) as f:
+            return f.read()
+
+    def test_matches_sequential_tools(self):
+        output = os.path.join(self.tmpdir.name, "foo.f90")
+        convert_file(self.input, output)
+        with open(output) as f:
+            result = f.read()
+        self.assertEqual(result, self.sequential(self.input))
+        self.assertIn("end subroutine foo\n", result)
+        self.assertIn("8HCHECKING", result)
+
+    def test_selected_stages(self):
+        output = os.path.join(self.tmpdir.name, "foo.f90")
+        convert_file(self.input, output, ['fixed2free'])
+        with open(output) as f:
+            self.assertIn("SUBROUTINE FOO(A, B, &\n", f.read())
+        self.assertEqual(output_name("foo.f", ['fixed2free']), "foo.f90")
+        self.assertEqual(output_name("foo.f", ['lowercase']), "foo.f")
+
+    def test_tree(self):
+        srcdir = os.path.join(self.tmpdir.name, "src")
+        os.makedirs(os.path.join(srcdir, "sub"))
+        shutil.copy(self.input, os.path.join(srcdir, "sub", "bar.f"))
+        outdir = os.path.join(self.tmpdir.name, "out")
+        self.assertEqual(len(convert_tree(srcdir, outdir, jobs=2)), 1)
+        with open(os.path.join(outdir, "sub", "bar.f90")) as f:
+            self.assertEqual(f.read(), self.sequential(self.input))
+
+if __name__ == "__main__":
+    unittest.main()
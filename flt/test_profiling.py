@@ -0,0 +1,72 @@
+import io
+import json
+import os
+import pstats
+import tempfile
+import unittest
+
+from flt import profiling
+from flt.batch import run_tasks
+from flt.fileio import update_file
+
+def upper_file(paths):
+    input_path, output_path = paths
+    with open(input_path) as infile:
+        lines = profiling.stage('upper', (line.upper() for line in profiling.source(infile, input_path)))
+        return update_file(lines, output_path)
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tasks = []
+        for name in ('a', 'b', 'c'):
+            path = os.path.join(self.tmpdir.name, name + '.f90')
+            with open(path, 'w') as f:
+                f.write("x = 1\n" * 100)
+            self.tasks.append((path, path + '.out'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_off(self):
+        lines = iter(["x\n"])
+        self.assertIs(profiling.source(lines, self.tasks[0][0]), lines)
+        self.assertIs(profiling.stage('upper', lines), lines)
+        self.assertIs(profiling.timing('upper'), profiling.timing('other'))
+        self.assertTrue(profiling.call(None, upper_file, self.tasks[0]))
+
+    def test_call(self):
+        profiler = profiling.Profiler()
+        self.assertTrue(profiling.call(profiler, upper_file, self.tasks[0]))
+        record, = profiler.records
+        self.assertEqual(record.path, self.tasks[0][0])
+        self.assertEqual((record.lines, record.bytes_read, record.bytes_written), (100, 600, 600))
+        self.assertEqual(set(record.stages), {'other', 'read', 'upper', 'write'})
+        self.assertAlmostEqual(sum(record.stages.values()), record.elapsed)
+        self.assertIsNone(profiling._current)
+
+    def test_run_tasks_and_report(self):
+        trace = os.path.join(self.tmpdir.name, 'trace.json')
+        dump = os.path.join(self.tmpdir.name, 'stats.prof')
+        profiler = profiling.Profiler(top=2, dump=dump, trace=trace)
+        results = list(run_tasks(upper_file, self.tasks, jobs=2, profiler=profiler))
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(sorted(record.path for record in profiler.records), [task[0] for task in self.tasks])
+
+        out = io.StringIO()
+        profiler.report(out)
+        report = out.getvalue()
+        self.assertIn("3 files, 300 lines, 1,800 bytes read, 1,800 bytes written", report)
+        self.assertIn("Slowest 2 files:", report)
+        for stage in ('read', 'upper', 'write', 'total'):
+            self.assertIn(stage, report)
+
+        with open(trace) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual(sorted(event['name'] for event in events), [task[0] for task in self.tasks])
+        self.assertEqual(events[0]['args']['lines'], 100)
+        self.assertGreater(pstats.Stats(dump).total_calls, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Persistent cache of file analyses in a local SQLite database.
+
+Results are stored by the SHA-256 hash of the file content and the analyzer
+version, a hash of the analyzer sources. A file that did not change since the
+last run is therefore served from the database, and all entries become
+invalid as soon as the analyzer changes. The database also remembers which
+path had which content, per set of options, so that prune() can drop the
+entries of deleted files without touching those of runs with other options.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+
+from flt.cache import file_digest, DEFAULT_CACHE_DIR
+
+DEFAULT_DATABASE = os.path.join(DEFAULT_CACHE_DIR, 'jfortran.sqlite')
+
+# bump when the stored result format or the tables change
+SCHEMA_VERSION = 2
+
+# relative to this directory, with the shared modules the results depend on
+ANALYZER_SOURCES = ['file_analyzer.py', 'variable_collector.py', 'undeclared.py',
+                    os.path.join(os.pardir, 'flt', 'lexer.py')]
+
+def analyzer_version():
+    """Returns a hash of the analyzer sources and the schema version."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = None
+    for name in ANALYZER_SOURCES:
+        digest = file_digest(os.path.join(directory, name), digest)
+    digest.update(str(SCHEMA_VERSION).encode())
+    return digest.hexdigest()
+
+class AnalysisCache:
+    def __init__(self, path=DEFAULT_DATABASE, options=()):
+        """
+        Opens (or creates) the database at path. options (strings) are the settings
+        that change the results, such as the include search path; results stored with
+        other options are not used.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.analyzer = analyzer_version()
+        self.version = self.analyzer
+        if options:
+            self.version = hashlib.sha256(json.dumps([self.analyzer] + list(options)).encode()).hexdigest()
+        self.connection = sqlite3.connect(path)
+        # a database of an older layout is started over
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.connection.executescript(f"""
+                DROP TABLE IF EXISTS results;
+                DROP TABLE IF EXISTS files;
+                PRAGMA user_version = {SCHEMA_VERSION};
+            """)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                digest TEXT NOT NULL,
+                version TEXT NOT NULL,
+                analyzer TEXT NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (digest, version));
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT NOT NULL,
+                version TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (path, version));
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def digest(self, path, location=False):
+        """
+        Returns the key of the content of the file at path. With location, the key
+        also depends on the directory of the file, for results that do (such as
+        those following include lines, which are looked up next to the file).
+        """
+        digest = file_digest(path)
+        if location:
+            digest.update(b'\0' + os.path.dirname(os.path.abspath(path)).encode())
+        return digest.hexdigest()
+
+    def lookup(self, digest):
+        """Returns the stored result (a dict) for the content digest, or None."""
+        row = self.connection.execute(
+            "SELECT result FROM results WHERE digest = ? AND version = ?",
+            (digest, self.version)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store(self, digest, result):
+        """Stores the result (a dict that JSON can represent) for the content digest."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results (digest, version, analyzer, result) VALUES (?, ?, ?, ?)",
+            (digest, self.version, self.analyzer, json.dumps(result)))
+
+    def record(self, digests):
+        """Remembers the content digest of each path in the dict digests, for these options."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO files (path, version, digest) VALUES (?, ?, ?)",
+            [(os.path.abspath(path), self.version, digest) for path, digest in digests.items()])
+
+    def prune(self):
+        """
+        Drops the entries of deleted files, the results with these options that
+        no file has any more, and everything of other analyzer versions. The
+        results with other options of this analyzer version are kept.
+        """
+        deleted = [(path,) for path, in self.connection.execute("SELECT DISTINCT path FROM files")
+                   if not os.path.exists(path)]
+        self.connection.executemany("DELETE FROM files WHERE path = ?", deleted)
+        self.connection.execute("DELETE FROM results WHERE analyzer != ?", (self.analyzer,))
+        self.connection.execute(
+            "DELETE FROM results WHERE version = ? AND digest NOT IN (SELECT digest FROM files WHERE version = ?)",
+            (self.version, self.version))
+        self.connection.execute(
+            "DELETE FROM files WHERE version != ? AND version NOT IN (SELECT version FROM results)",
+            (self.version,))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
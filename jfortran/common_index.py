@@ -0,0 +1,195 @@
+"""
+Index of all COMMON block declarations of a source tree, and a check that
+every declaration of a block has the same layout: the same members in the
+same order, with the same types and dimensions.
+
+The index is a SQLite database that records, for every file, the hash of
+the content it was built from, the include files it was built with, and the
+COMMON blocks declared in it (one site per block and program unit), those
+of include files included. Updating the index only re-analyzes the files
+whose content or include files changed and replaces their sites; files that
+were deleted are dropped.
+
+Usage: python common_index.py [-j N] [--index FILE] [-I DIR] [--no-includes] file_or_directory ...
+"""
+import sys
+import os
+import argparse
+import hashlib
+import json
+import sqlite3
+
+from flt.batch import find_source_files
+from flt.cache import file_digest, DEFAULT_CACHE_DIR
+from flt import profiling
+
+from file_analyzer import includes_unchanged, run_analyses, FORTRAN_SUFFIXES, DEFAULT_INCLUDE_CACHE_BYTES
+from analysis_cache import analyzer_version
+
+DEFAULT_INDEX = os.path.join(DEFAULT_CACHE_DIR, 'common_index.sqlite')
+
+# bump when the tables change
+INDEX_SCHEMA = 2
+
+class CommonIndex:
+    def __init__(self, path=DEFAULT_INDEX, include_path=(), include_cache_bytes=DEFAULT_INCLUDE_CACHE_BYTES):
+        """
+        Opens (or creates) the index at path. include_path is the search path for
+        include files (after the directory of the including file); with None,
+        include lines are not followed.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.include_path = None if include_path is None else [os.path.abspath(d) for d in include_path]
+        self.include_cache_bytes = include_cache_bytes
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # sites found by another analyzer version or with other includes are not comparable, start over
+        version = hashlib.sha256(json.dumps([analyzer_version(), INDEX_SCHEMA, self.include_path]).encode()).hexdigest()
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != version:
+            self.connection.execute("DROP TABLE IF EXISTS files")
+            self.connection.execute("DROP TABLE IF EXISTS sites")
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                includes TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS sites (
+                path TEXT NOT NULL,
+                block TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                layout TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS sites_block ON sites (block);
+            CREATE INDEX IF NOT EXISTS sites_path ON sites (path);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, files, jobs=None, profiler=None):
+        """
+        Brings the entries of files up to date and drops the entries of deleted files.
+        A file is indexed again when its content or one of its include files changed.
+        Returns the list of files that were (re-)indexed. A flt.profiling.Profiler
+        measures the analysis of every file.
+        """
+        indexed = {path: (digest, json.loads(includes)) for path, digest, includes
+                   in self.connection.execute("SELECT path, digest, includes FROM files")}
+        digests = {}
+        include_digests = {}
+        for file_path in files:
+            digest = file_digest(file_path).hexdigest()
+            entry = indexed.get(os.path.abspath(file_path))
+            if entry is None or entry[0] != digest or not includes_unchanged(entry[1], include_digests):
+                digests[file_path] = digest
+
+        for result in run_analyses(list(digests), jobs, self.include_path, self.include_cache_bytes, profiler):
+            path = os.path.abspath(result.file_path)
+            self.connection.execute("DELETE FROM sites WHERE path = ?", (path,))
+            self.connection.executemany(
+                "INSERT INTO sites (path, block, line, layout) VALUES (?, ?, ?, ?)",
+                [(path, block_name, line_number, json.dumps(members))
+                 for block_name, line_number, members in result.common_layouts])
+            includes = {'includes': result.includes, 'missing_includes': result.missing_includes}
+            self.connection.execute("INSERT OR REPLACE INTO files (path, digest, includes) VALUES (?, ?, ?)",
+                                    (path, digests[result.file_path], json.dumps(includes)))
+
+        deleted = [(path,) for path in indexed if not os.path.exists(path)]
+        self.connection.executemany("DELETE FROM sites WHERE path = ?", deleted)
+        self.connection.executemany("DELETE FROM files WHERE path = ?", deleted)
+        self.connection.commit()
+        return sorted(digests)
+
+    def sites(self, block_name):
+        """Returns (path, line number, layout) of every declaration of a block, sorted."""
+        return [(path, line_number, [tuple(member) for member in json.loads(layout)])
+                for path, line_number, layout in self.connection.execute(
+                    "SELECT path, line, layout FROM sites WHERE block = ? ORDER BY path, line",
+                    (block_name.lower(),))]
+
+    def blocks(self):
+        """Returns the sorted names of all indexed blocks."""
+        return [block for block, in self.connection.execute("SELECT DISTINCT block FROM sites ORDER BY block")]
+
+    def inconsistent_blocks(self):
+        """
+        Returns {block name: {layout: [(path, line number), ...]}} for the blocks that
+        are declared with more than one layout. A layout is a tuple of
+        (lowercase member, type, dimensions).
+        """
+        inconsistent = {}
+        current_block = None
+        layouts = {}
+        rows = self.connection.execute("SELECT block, path, line, layout FROM sites ORDER BY block, path, line")
+        for block_name, path, line_number, layout in rows:
+            if block_name != current_block:
+                if len(layouts) > 1:
+                    inconsistent[current_block] = layouts
+                current_block = block_name
+                layouts = {}
+            layout = tuple((name.lower(), type_name, dimensions)
+                           for name, type_name, dimensions in json.loads(layout))
+            layouts.setdefault(layout, []).append((path, line_number))
+        if len(layouts) > 1:
+            inconsistent[current_block] = layouts
+        return inconsistent
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+def format_layout(layout):
+    return ', '.join(f"{name}{dimensions}:{type_name or 'implicit'}" for name, type_name, dimensions in layout) or '(empty)'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that COMMON blocks have the same layout in all files.")
+    parser.add_argument("paths", nargs='+', help="Fortran files or directory trees of such files.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of cores).")
+    parser.add_argument("--suffix", action="append", dest="suffixes", help="File suffix to index in a directory tree, may be repeated (default: %s)." % ' '.join(FORTRAN_SUFFIXES))
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="Database of the index (default: %(default)s).")
+    parser.add_argument("-I", "--include-dir", action="append", default=[], help="Directory to search for include files after the directory of the including file, may be repeated.")
+    parser.add_argument("--no-includes", action="store_true", help="Do not follow include lines.")
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    profiler = profiling.from_args(args)
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(find_source_files(path, args.suffixes or FORTRAN_SUFFIXES))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            parser.error(f"{path} does not exist")
+
+    include_path = None if args.no_includes else args.include_dir
+    with CommonIndex(args.index, include_path) as index:
+        updated = index.update(list(dict.fromkeys(files)), args.jobs, profiler)
+        print(f"Indexed {len(updated)} of {len(files)} files.")
+        inconsistent = index.inconsistent_blocks()
+        block_count = len(index.blocks())
+
+    if profiler is not None:
+        profiler.report()
+
+    for block_name, layouts in inconsistent.items():
+        print(f"\nCOMMON /{block_name}/ is declared with {len(layouts)} different layouts:")
+        for layout, sites in layouts.items():
+            print(f"  {format_layout(layout)}")
+            for path, line_number in sites:
+                print(f"    {path}:{line_number}")
+
+    if inconsistent:
+        print(f"\n{len(inconsistent)} of {block_count} COMMON blocks are inconsistent.")
+        return 1
+    print(f"All {block_count} COMMON blocks are consistent.")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,464 @@
+import sys
+import os
+import re
 import argparse
+from collections import OrderedDict
+
+from flt.batch import find_source_files, read_text, run_pipeline, run_tasks, text_lines
+from flt.cache import file_digest
+from flt import profiling
+
+from variable_collector import (
+    declared_in_line,
+    typed_declarations_in_line,
+    parameters_in_line,
+    common_block_in_line,
+    common_layout_in_line,
+    data_in_line
+)
 from undeclared import (
-    collect_known_variables,
-    find_undeclared_variables,
-    collect_declared_variables,
-    collect_parameter_variables,
-    collect_common_blocks,
-    collect_data_initializations,
+    scan_line,
+    is_fortran_keyword,
     check_proper_type_declaration
 )
+from analysis_cache import AnalysisCache, DEFAULT_DATABASE
 
-def main():
-    parser = argparse.ArgumentParser(description="Fortran Variable Declaration, Parameter, Common Block, Data Statement, and Undeclared Variable Analyzer")
-    parser.add_argument("file", help="Path to the Fortran file to analyze")
-    
-    args = parser.parse_args()
-    
-    # Collect declared variables
-    declared_variables = collect_declared_variables(args.file)
-
-    # Collect variables from common blocks, parameter, and data statements
-    parameter_variables = collect_parameter_variables(args.file)
-    common_blocks = collect_common_blocks(args.file)
-    data_initializations = collect_data_initializations(args.file)
-
-    # Check for missing type declarations
-    missing_declarations = check_proper_type_declaration(
-        declared_variables,
-        common_blocks,
-        parameter_variables,
-        data_initializations
-    )
+# suffixes picked up when a directory tree is analyzed
+FORTRAN_SUFFIXES = ['.f', '.F', '.for', '.f90', '.F90', '.src']
+
+# include 'file', include "file" and the preprocessor's #include "file"
+INCLUDE_PATTERN = re.compile(r'''^\s*#?\s*include\s*['"<]([^'">]+)['">]''', re.IGNORECASE)
+
+# IncludeResolver.resolve of an include file that is already being analyzed
+INCLUDE_CYCLE = 'cycle'
+
+DEFAULT_INCLUDE_CACHE_BYTES = 64 * 1024 * 1024
+
+class FileAnalysis:
+    """
+    Everything the analyzer found in one file.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.declared_variables = {}    # variable -> type
+        self.parameter_variables = {}   # variable -> 'parameter'
+        self.common_blocks = {}         # block name -> variables
+        self.data_initializations = {}  # variable -> Hollerith value
+        self.undeclared_variables = {}  # variable -> line numbers
+        # [block name, line number, [[member, type or None, dimensions], ...]] for every
+        # COMMON block of every program unit, see CommonLayouts
+        self.common_layouts = []
+        self.includes = []              # [path, content digest] of every included file
+        self.missing_includes = []      # names of include files that were not found
+
+    FIELDS = ('declared_variables', 'parameter_variables', 'common_blocks',
+              'data_initializations', 'undeclared_variables', 'common_layouts',
+              'includes', 'missing_includes')
+
+    def to_dict(self):
+        """
+        The results without the file path, as stored by the analysis cache.
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, file_path, data):
+        result = cls(file_path)
+        for field in cls.FIELDS:
+            setattr(result, field, data[field])
+        return result
+
+    @property
+    def missing_declarations(self):
+        """
+        Variables of common blocks, parameter and data statements without a type declaration.
+        """
+        return check_proper_type_declaration(
+            self.declared_variables,
+            self.common_blocks,
+            self.parameter_variables,
+            self.data_initializations
+        )
+
+class ProjectAnalysis:
+    """
+    The merged results of many files: the FileAnalysis of every file, sorted by path,
+    and for every COMMON block (by lowercase name) the sorted files that declare it.
+    """
+    def __init__(self, analyses):
+        self.files = sorted(analyses, key=lambda result: result.file_path)
+        self.common_blocks = {}
+        for result in self.files:
+            for block_name in result.common_blocks:
+                files = self.common_blocks.setdefault(block_name.lower(), [])
+                if not files or files[-1] != result.file_path:
+                    files.append(result.file_path)
+        self.common_blocks = dict(sorted(self.common_blocks.items()))
+
+# End of a program unit (not of a block construct such as 'end if')
+END_UNIT_PATTERN = re.compile(r'^end\s*(?:(?:subroutine|function|program|module|block\s*data)\b.*)?$', re.IGNORECASE)
+
+class CommonLayouts:
+    """
+    The COMMON blocks of the current program unit, with the types and dimensions
+    declared for their members in that unit. A block that appears in several COMMON
+    statements of a unit is one site, its members are concatenated.
+    """
+    def __init__(self):
+        self.types = {}       # lowercase name -> type
+        self.dimensions = {}  # lowercase name -> dimensions from a type declaration
+        self.sites = {}       # block name -> [line number, [(member, dimensions), ...]]
+
+    def declare(self, name, type_name, dimensions):
+        """Records a type declaration (see typed_declarations_in_line) of the unit."""
+        name = name.lower()
+        self.types[name] = type_name
+        if dimensions:
+            self.dimensions[name] = dimensions
+
+    def add(self, block_name, line_number, members):
+        """Adds members, (name, dimensions) or (name, dimensions, type), to a block."""
+        site = self.sites.setdefault(block_name.lower(), [line_number, []])
+        site[1].extend(members)
+
+    def include(self, included, line_number):
+        """Adds the declarations and blocks of an include file (an IncludedFile)."""
+        types, dimensions = included.declarations
+        self.types.update(types)
+        self.dimensions.update(dimensions)
+        for block_name, _, members in included.analysis.common_layouts:
+            self.add(block_name, line_number,
+                     [(name, dimensions, type_name) for name, type_name, dimensions in members])
+
+    def flush(self, layouts):
+        """Appends the sites of the unit to layouts and starts a new unit."""
+        for block_name, (line_number, members) in self.sites.items():
+            layouts.append([block_name, line_number,
+                            [[name, (member[2] if len(member) > 2 else None) or self.types.get(name.lower()),
+                              dimensions or self.dimensions.get(name.lower(), '')]
+                             for member in members for name, dimensions in [member[:2]]]])
+        self.__init__()
+
+class IncludedFile:
+    """
+    An analyzed include file: its FileAnalysis, content digest, the names it uses before
+    an implicit statement and whether it contains one, and the types and dimensions it
+    declares (for the COMMON layouts of the including unit). signatures has the
+    (modification time, size) of the file and of the files it includes, to tell when it
+    is out of date.
+    """
+    def __init__(self, analysis, digest, names_before_implicit, implicit_found, declarations, signatures):
+        self.analysis = analysis
+        self.declarations = declarations
+        self.digest = digest
+        self.names_before_implicit = names_before_implicit
+        self.implicit_found = implicit_found
+        self.signatures = signatures
+
+    def is_current(self):
+        try:
+            return all(_signature(path) == signature for path, signature in self.signatures.items())
+        except OSError:
+            return False
+
+def _signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+class IncludeResolver:
+    """
+    Finds include files, first next to the including file, then along a search path,
+    and analyzes each of them once (again only if it or a file it includes changed).
+    The analyses are kept in a least recently used cache; the total size of their
+    source files is kept below max_bytes.
+    """
+    def __init__(self, search_path=(), max_bytes=DEFAULT_INCLUDE_CACHE_BYTES):
+        self.search_path = [os.path.abspath(directory) for directory in search_path]
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()  # path -> IncludedFile
+        self.cached_bytes = 0
+        self.parsed = 0
+        self.active = set()  # include files being analyzed, to stop include cycles
+
+    def find(self, name, directory=None):
+        """Returns the path of the include file name, or None."""
+        directories = ([directory] if directory is not None else []) + self.search_path
+        for candidate in directories:
+            path = os.path.abspath(os.path.join(candidate, name))
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def resolve(self, name, directory=None):
+        """
+        Returns the IncludedFile of the include file name, None if it was not found,
+        or INCLUDE_CYCLE if it includes itself (directly or through other files).
+        """
+        path = self.find(name, directory)
+        if path is None:
+            return None
+        if path in self.active:
+            return INCLUDE_CYCLE
+
+        cached = self.cache.pop(path, None)
+        if cached is not None:
+            if cached.is_current():
+                self.cache[path] = cached
+                return cached
+            self.cached_bytes -= cached.signatures[path][1]
+
+        signature = _signature(path)
+        self.active.add(path)
+        try:
+            with open(path, 'r') as file:
+                analysis, names_before_implicit, implicit_found, declarations = _analyze_lines(file, path, self)
+        finally:
+            self.active.discard(path)
+        signatures = {path: signature}
+        for dependency, _ in analysis.includes:
+            signatures[dependency] = self.cache[dependency].signatures[dependency] \
+                if dependency in self.cache else _signature(dependency)
+        included = IncludedFile(analysis, file_digest(path).hexdigest(), names_before_implicit,
+                                implicit_found, declarations, signatures)
+        self.parsed += 1
+
+        self.cache[path] = included
+        self.cached_bytes += signature[1]
+        while self.cached_bytes > self.max_bytes and len(self.cache) > 1:
+            evicted_path, evicted = self.cache.popitem(last=False)
+            self.cached_bytes -= evicted.signatures[evicted_path][1]
+        return included
+
+def analyze_lines(lines, file_path=None, resolver=None):
+    """
+    Analyzes the lines of a Fortran file in a single sweep and returns a FileAnalysis.
+
+    Declarations, parameters, common blocks and data statements are collected from the
+    lines joined at '&' continuations, uses of variables from the physical lines, with
+    the same results as the collect_* functions and find_undeclared_variables. Uses are
+    checked against the declarations (and keywords) once at the end, as declarations
+    may come later in the file.
+
+    With an IncludeResolver, include lines are followed: the declarations, parameters,
+    common blocks and data statements of the include file count as if they were written
+    in place of the include line. Uses inside include files are not reported.
+    """
+    return _analyze_lines(lines, file_path, resolver)[0]
+
+def _analyze_lines(lines, file_path, resolver):
+    result = FileAnalysis(file_path)
+    directory = os.path.dirname(os.path.abspath(file_path)) if file_path else None
+    layouts = CommonLayouts()
+    current_line = ""
+    statement_start = 1
+
+    implicit_found = False
+    known_before_implicit = set()
+    candidates = {}  # variable -> line numbers, for uses after the implicit statement
+
+    for i, line in enumerate(lines, start=1):
+        if resolver is not None and not current_line:
+            include_match = INCLUDE_PATTERN.match(line)
+            if include_match:
+                included = resolver.resolve(include_match.group(1), directory)
+                if included is None:
+                    result.missing_includes.append(include_match.group(1))
+                    continue
+                if included is INCLUDE_CYCLE:
+                    continue  # its content is being added already
+                _merge_include(result, layouts, included, i)
+                if not implicit_found:
+                    known_before_implicit |= included.names_before_implicit
+                    implicit_found = included.implicit_found
+                continue
+
+        # Uses of variables
+        kind, names = scan_line(line)
+        if kind == 'implicit':
+            implicit_found = True
+        elif not implicit_found:
+            if kind != 'call':
+                known_before_implicit.update(var.lower() for var in names)
+        elif kind == 'call' or kind == 'code':
+            for var in names:
+                candidates.setdefault(var.lower(), []).append(i)
+
+        # Join continued lines as preprocess_lines does
+        stripped_line = line.strip()
+        if not current_line:
+            statement_start = i
+        if stripped_line.endswith('&'):
+            current_line += stripped_line[:-1] + " "
+            continue
+        _collect_statement(result, layouts, current_line + stripped_line, statement_start)
+        current_line = ""
+
+    if current_line:
+        _collect_statement(result, layouts, current_line, statement_start)
+    # what an include file declares outside of a unit counts in the unit including it
+    declarations = (layouts.types, layouts.dimensions)
+    layouts.flush(result.common_layouts)
+
+    known_variables = set(result.declared_variables) | known_before_implicit
+    result.undeclared_variables = {var: line_numbers for var, line_numbers in candidates.items()
+                                   if var not in known_variables and not is_fortran_keyword(var)}
+    return result, known_before_implicit, implicit_found, declarations
+
+def _merge_include(result, layouts, included, line_number):
+    analysis = included.analysis
+    result.declared_variables.update(analysis.declared_variables)
+    result.parameter_variables.update(analysis.parameter_variables)
+    result.common_blocks.update(analysis.common_blocks)
+    result.data_initializations.update(analysis.data_initializations)
+    layouts.include(included, line_number)
+    for dependency in [[analysis.file_path, included.digest]] + analysis.includes:
+        if dependency not in result.includes:
+            result.includes.append(dependency)
+    result.missing_includes.extend(analysis.missing_includes)
+
+# First letters of the statements that declarations, parameters, common blocks and
+# ends of units are recognised from; their patterns are anchored at the start of the
+# (stripped) line
+_STATEMENT_STARTS = frozenset(('int', 'log', 'cha', 'dou', 'rea', 'com', 'par', 'end'))
+
+def _collect_statement(result, layouts, line, line_number):
+    start = line[:3].lower()
+    if start == 'end':
+        if END_UNIT_PATTERN.match(line):
+            layouts.flush(result.common_layouts)
+    elif start in _STATEMENT_STARTS:
+        for var, key in declared_in_line(line):
+            result.declared_variables[var] = key
+        for name, type_name, dimensions in typed_declarations_in_line(line):
+            layouts.declare(name, type_name, dimensions)
+        for param in parameters_in_line(line):
+            result.parameter_variables[param] = 'parameter'
+        common_block = common_block_in_line(line)
+        if common_block:
+            block_name, variables = common_block
+            result.common_blocks[block_name] = variables
+        for block_name, members in common_layout_in_line(line):
+            layouts.add(block_name, line_number, members)
+    if '/' in line:
+        for var_name, hollerith_value in data_in_line(line):
+            result.data_initializations[var_name] = hollerith_value
+
+def analyze_file(file_path, resolver=None):
+    """
+    Reads a Fortran file once and analyzes it, see analyze_lines.
+    """
+    with open(file_path, 'r') as file, profiling.timing('analyze'):
+        return analyze_lines(profiling.source(file, file_path), file_path, resolver)
+
+# include resolvers of this process by (search path, cache size), so that worker
+# processes analyze each include file once for all the files they are given
+_resolvers = {}
+
+def get_resolver(search_path, max_bytes=DEFAULT_INCLUDE_CACHE_BYTES):
+    key = (tuple(search_path), max_bytes)
+    if key not in _resolvers:
+        _resolvers[key] = IncludeResolver(search_path, max_bytes)
+    return _resolvers[key]
+
+def _analyze_file_job(job):
+    file_path, include_path, include_cache_bytes = job
+    resolver = get_resolver(include_path, include_cache_bytes) if include_path is not None else None
+    return analyze_file(file_path, resolver)
+
+# the stages of a pipelined run, see flt.batch.run_pipeline
+def _read_job(job):
+    return read_text(job[0])
+
+def _analyze_text_job(job, text):
+    file_path, include_path, include_cache_bytes = job
+    resolver = get_resolver(include_path, include_cache_bytes) if include_path is not None else None
+    return analyze_lines(text_lines(text), file_path, resolver)
+
+def run_analyses(files, jobs=None, include_path=None, include_cache_bytes=DEFAULT_INCLUDE_CACHE_BYTES,
+                 profiler=None):
+    """
+    Yields the FileAnalysis of all files as they are done by a pool of worker
+    processes, see analyze_files. Nothing is cached.
+    """
+    tasks = [(file_path, include_path, include_cache_bytes) for file_path in files]
+    weight = lambda task: os.path.getsize(task[0])
+    if profiler is None:
+        return run_pipeline(_read_job, _analyze_text_job, None, tasks, jobs, weight=weight, stream=_analyze_file_job)
+    return run_tasks(_analyze_file_job, tasks, jobs, weight=weight, profiler=profiler)
+
+def includes_unchanged(data, digests):
+    """Checks the include files a cached result depends on, digests memoizes their hashes."""
+    if data['missing_includes']:
+        return False  # might be there now
+    for path, digest in data['includes']:
+        if path not in digests:
+            digests[path] = file_digest(path).hexdigest() if os.path.isfile(path) else None
+        if digests[path] != digest:
+            return False
+    return True
+
+def analyze_files(files, jobs=None, cache=None, include_path=None,
+                  include_cache_bytes=DEFAULT_INCLUDE_CACHE_BYTES, profiler=None):
+    """
+    Returns the FileAnalysis of all files, computed in a pool of worker processes.
+
+    include_path is the search path for include files (after the directory of the
+    including file); with None, include lines are not followed. Every worker analyzes
+    an include file once, within the include_cache_bytes limit.
+
+    With an AnalysisCache, files whose content (and that of their include files) was
+    analyzed before by the same analyzer version are served from the cache and only
+    the others are analyzed. The cache then forgets about deleted files.
+
+    A flt.profiling.Profiler measures every file that is analyzed, otherwise
+    threads read the files while the workers analyze others (flt.batch.run_pipeline).
+    """
+    if cache is None:
+        return list(run_analyses(files, jobs, include_path, include_cache_bytes, profiler))
+
+    results = []
+    digests = {}
+    include_digests = {}
+    missing = []
+    for file_path in files:
+        # the include files of a file depend on its directory
+        digest = digests[file_path] = cache.digest(file_path, location=include_path is not None)
+        data = cache.lookup(digest)
+        if data is None or not includes_unchanged(data, include_digests):
+            missing.append(file_path)
+        else:
+            results.append(FileAnalysis.from_dict(file_path, data))
+
+    for result in run_analyses(missing, jobs, include_path, include_cache_bytes, profiler):
+        cache.store(digests[result.file_path], result.to_dict())
+        results.append(result)
+
+    cache.record(digests)
+    cache.prune()
+    return results
+
+def analyze_tree(paths, suffixes=FORTRAN_SUFFIXES, jobs=None, cache=None, include_path=None,
+                 include_cache_bytes=DEFAULT_INCLUDE_CACHE_BYTES, profiler=None):
+    """
+    Analyzes files and all files below directories in a pool of worker processes (map)
+    and merges the results (reduce). The result does not depend on the number of workers.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(find_source_files(path, suffixes))
+        else:
+            files.append(path)
+    files = list(dict.fromkeys(files))
+
+    return ProjectAnalysis(analyze_files(files, jobs, cache, include_path, include_cache_bytes, profiler))
+
+def print_analysis(result):
+    for name in dict.fromkeys(result.missing_includes):
+        print(f"Warning: include file '{name}' was not found.")
 
     # Print missing type declarations
+    missing_declarations = result.missing_declarations
     if missing_declarations:
         print("\nVariables missing type declarations:")
         for var in sorted(missing_declarations):
@@ -39,22 +466,64 @@ def main():
     else:
         print("All variables have proper type declarations.")
 
-    # Collect all known variables as a set
-    known_variables = set(declared_variables.keys())  # Convert to a set
-
-    # Find undeclared variables
-    undeclared_variables = find_undeclared_variables(args.file, known_variables)
-
     # Print undeclared variables with line numbers
-    if undeclared_variables:
+    if result.undeclared_variables:
         print("\nUndeclared variables found:")
-        for var, lines in sorted(undeclared_variables.items()):
+        for var, lines in sorted(result.undeclared_variables.items()):
             line_info = ', '.join(str(line) for line in lines)
             print(f"Variable '{var}' is used but not declared. Found on line(s): {line_info}")
     else:
         print("No undeclared variables found.")
 
+def print_project_analysis(project):
+    for result in project.files:
+        print(f"\n=== {result.file_path} ===")
+        print_analysis(result)
 
-if __name__ == "__main__":
-    main()
+    print("\nCOMMON blocks:")
+    if not project.common_blocks:
+        print("No common blocks found.")
+    for block_name, files in project.common_blocks.items():
+        print(f"/{block_name}/ declared in {len(files)} file(s): {', '.join(files)}")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fortran Variable Declaration, Parameter, Common Block, Data Statement, and Undeclared Variable Analyzer")
+    parser.add_argument("file", nargs='+', help="Path to the Fortran file to analyze, or a directory tree of such files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of cores).")
+    parser.add_argument("--suffix", action="append", dest="suffixes", help="File suffix to analyze in a directory tree, may be repeated (default: %s)." % ' '.join(FORTRAN_SUFFIXES))
+    parser.add_argument("--cache", action="store_true", help="Keep results in a database and reuse them for unchanged files.")
+    parser.add_argument("--cache-file", default=DEFAULT_DATABASE, help="Database of the analysis cache (default: %(default)s).")
+    parser.add_argument("-I", "--include-dir", action="append", default=[], help="Directory to search for include files after the directory of the including file, may be repeated.")
+    parser.add_argument("--no-includes", action="store_true", help="Do not follow include lines.")
+    parser.add_argument("--include-cache-size", type=int, default=DEFAULT_INCLUDE_CACHE_BYTES // (1024 * 1024), help="Size limit in MB of the analyzed include files kept in memory (default: %(default)s).")
+    profiling.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    profiler = profiling.from_args(args)
+    include_path = None if args.no_includes else args.include_dir
+    include_cache_bytes = args.include_cache_size * 1024 * 1024
+
+    for path in args.file:
+        if not os.path.exists(path):
+            print(f"Error: The file '{path}' was not found.")
+            return 1
+
+    options = ['includes'] + [os.path.abspath(directory) for directory in include_path] if include_path is not None else []
+    cache = AnalysisCache(args.cache_file, options) if args.cache else None
+    try:
+        if len(args.file) == 1 and not os.path.isdir(args.file[0]):
+            print_analysis(analyze_files(args.file, cache=cache, include_path=include_path,
+                                         include_cache_bytes=include_cache_bytes, profiler=profiler)[0])
+        else:
+            print_project_analysis(analyze_tree(args.file, args.suffixes or FORTRAN_SUFFIXES, args.jobs, cache,
+                                                include_path, include_cache_bytes, profiler))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if profiler is not None:
+        profiler.report()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
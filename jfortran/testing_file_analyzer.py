@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from variable_collector import collect_declared_variables, collect_parameter_variables,collect_common_blocks, collect_data_initializations
 from undeclared import (
@@ -6,6 +8,10 @@ from undeclared import (
     find_undeclared_variables,
     is_fortran_keyword
 )
+from file_analyzer import analyze_file, analyze_tree, analyze_files, IncludeResolver
+from analysis_cache import AnalysisCache
+from common_index import CommonIndex
+from variable_collector import common_layout_in_line, typed_declarations_in_line
 
 class TestVariableCollector(unittest.TestCase):
 
@@ -105,6 +111,23 @@ class TestVariableCollector(unittest.TestCase):
         
         self.assertEqual(collect_declared_variables('test_no_declarations.f90'), expected_variables)
 
+    def test_uppercase_declarations(self):
+        file_content = """\
+        INTEGER N, IERR
+        DOUBLE PRECISION A, X2
+        """
+        with open('test_uppercase.f90', 'w') as f:
+            f.write(file_content)
+
+        expected_variables = {
+            'N': 'integer',
+            'IERR': 'integer',
+            'A': 'double precision',
+            'X2': 'double precision',
+        }
+
+        self.assertEqual(collect_declared_variables('test_uppercase.f90'), expected_variables)
+
     def test_parameter_variables(self):
         file_content = """\
         integer ddi_world, ddi_group
@@ -229,6 +252,8 @@ class TestVariableCollector(unittest.TestCase):
         line_with_no_strings = "a = b + c"
         self.assertEqual(remove_string_literals(line_with_no_strings), line_with_no_strings)
 
+        self.assertEqual(remove_string_literals('print *, "double", x, \'it\'\'s\''), "print *, , x, ")
+
     def test_find_undeclared_variables(self):
         file_content = """\
         integer a, b
@@ -311,6 +336,282 @@ class TestVariableCollector(unittest.TestCase):
         self.assertFalse(is_fortran_keyword('i_variable'))
         self.assertFalse(is_fortran_keyword('f1234x'))
 
+    def test_analyze_file(self):
+        file_content = """\
+        integer a, b, &
+                k
+        parameter (c=1)
+        common /block1/ d, e(10), &
+                        f
+        data g /8HSTRING /
+        implicit double precision (a-h,o-z)
+        print *, 'This is a test', var1, 'Another string'
+        x = a + b + c
+        call sub(y, k)
+        z = g + h
+        """
+        with open('test_analyze_file.f90', 'w') as f:
+            f.write(file_content)
+
+        result = analyze_file('test_analyze_file.f90')
+
+        self.assertEqual(result.declared_variables, collect_declared_variables('test_analyze_file.f90'))
+        self.assertEqual(result.parameter_variables, {'c': 'parameter'})
+        self.assertEqual(result.common_blocks, {'block1': ['d', 'e', 'f']})
+        self.assertEqual(result.data_initializations, {'g': 'STRING'})
+        self.assertEqual(result.missing_declarations, {'c', 'd', 'e', 'f', 'g'})
+        self.assertEqual(result.undeclared_variables,
+                         find_undeclared_variables('test_analyze_file.f90', set(result.declared_variables)))
+        self.assertEqual(result.undeclared_variables['y'], [10])
+
+    def test_analyze_tree(self):
+        contents = {
+            'a.f90': "        common /shared/ x, y\n        common /only_a/ z\n",
+            os.path.join('sub', 'b.src'): "        COMMON /SHARED/ x, y\n        implicit none\n        w = x\n",
+            os.path.join('sub', 'c.f90'): "        integer q\n",
+            'notes.txt': "        common /ignored/ v\n",
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, 'sub'))
+            for name, content in contents.items():
+                with open(os.path.join(tmpdir, name), 'w') as f:
+                    f.write(content)
+
+            serial = analyze_tree([tmpdir], jobs=1)
+            parallel = analyze_tree([tmpdir], jobs=3)
+
+            a, b, c = (os.path.join(tmpdir, name) for name in ('a.f90', os.path.join('sub', 'b.src'), os.path.join('sub', 'c.f90')))
+            for project in (serial, parallel):
+                self.assertEqual([result.file_path for result in project.files], [a, b, c])
+                self.assertEqual(project.common_blocks, {'only_a': [a], 'shared': [a, b]})
+                self.assertEqual(project.files[1].undeclared_variables, {'w': [3]})
+
+    def test_analysis_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, name) for name in ('a.f90', 'b.f90')]
+            for path in paths:
+                with open(path, 'w') as f:
+                    f.write("        common /blk/ x\n        implicit none\n        y = x\n")
+            database = os.path.join(tmpdir, 'cache', 'analysis.sqlite')
+
+            with AnalysisCache(database) as cache:
+                first = analyze_files(paths, jobs=1, cache=cache)
+            with AnalysisCache(database) as cache:
+                digest = cache.digest(paths[0])
+                self.assertEqual(cache.lookup(digest), first[0].to_dict())
+                second = analyze_files(paths, jobs=1, cache=cache)
+            self.assertEqual([result.file_path for result in second], paths)
+            self.assertEqual([result.to_dict() for result in second], [result.to_dict() for result in first])
+            self.assertEqual(second[0].undeclared_variables, {'y': [3]})
+
+            os.remove(paths[0])
+            os.remove(paths[1])
+            with AnalysisCache(database) as cache:
+                analyze_files([], cache=cache)
+                self.assertIsNone(cache.lookup(digest))
+
+    def test_common_layout_in_line(self):
+        self.assertEqual(common_layout_in_line("common /stats/  timstp(maxtstp, 4), var2 /b/ c ! comment"),
+                         [('stats', [('timstp', '(maxtstp,4)'), ('var2', '')]), ('b', [('c', '')])])
+        self.assertEqual(common_layout_in_line("common x, y"), [('', [('x', ''), ('y', '')])])
+        self.assertEqual(common_layout_in_line("integer x"), [])
+
+    def test_typed_declarations_in_line(self):
+        self.assertEqual(typed_declarations_in_line("real*8 x, y(n, 3)"),
+                         [('x', 'real*8', ''), ('y', 'real*8', '(n,3)')])
+        self.assertEqual(typed_declarations_in_line("REAL x, y"), [('x', 'real', ''), ('y', 'real', '')])
+        self.assertEqual(typed_declarations_in_line("character*8 a, b*4, c(2)"),
+                         [('a', 'character*8', ''), ('b', 'character*4', ''), ('c', 'character*8', '(2)')])
+        self.assertEqual(typed_declarations_in_line("real(kind=8), dimension(3) :: v, w(2)"),
+                         [('v', 'real(kind=8)', '(3)'), ('w', 'real(kind=8)', '(2)')])
+        self.assertEqual(typed_declarations_in_line("double  precision d"), [('d', 'double precision', '')])
+        for line in ["real function f(x)", "realx = 1", "real = 2", "common /b/ x"]:
+            self.assertEqual(typed_declarations_in_line(line), [], line)
+
+    def test_common_layout_types(self):
+        units = {
+            'a': "      subroutine a\n      real*8 x, y\n      common /blk/ x, y\n      end\n",
+            'b': "      subroutine b\n      real*8 x\n      real*8 y\n      common /blk/ x, y\n      end\n",
+            'c': "      subroutine c\n      real x, y\n      common /plain/ x, y\n      end\n",
+            'd': "      subroutine d\n      real*4 x\n      real*8 y\n      common /blk/ x, y\n      end\n",
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = {}
+            for name, text in units.items():
+                paths[name] = os.path.join(tmpdir, name + '.f')
+                with open(paths[name], 'w') as f:
+                    f.write(text)
+            self.assertEqual(analyze_file(paths['c']).common_layouts,
+                             [['plain', 3, [['x', 'real', ''], ['y', 'real', '']]]])
+
+            with CommonIndex(os.path.join(tmpdir, 'index.sqlite')) as index:
+                index.update([paths[name] for name in 'abc'], jobs=1)
+                self.assertEqual(index.inconsistent_blocks(), {})
+                index.update(list(paths.values()), jobs=1)
+                inconsistent = index.inconsistent_blocks()
+            self.assertEqual(list(inconsistent), ['blk'])
+            self.assertEqual(inconsistent['blk'][(('x', 'real*4', ''), ('y', 'real*8', ''))], [(paths['d'], 4)])
+
+    def test_common_index_includes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            include = os.path.join(tmpdir, 'blk.h')
+            with open(include, 'w') as f:
+                f.write("      real*8 x(10)\n      common /blk/ x\n")
+            paths = [os.path.join(tmpdir, name + '.f') for name in ('a', 'b')]
+            with open(paths[0], 'w') as f:
+                f.write("      subroutine a\n      include 'blk.h'\n      end\n")
+            with open(paths[1], 'w') as f:
+                f.write("      subroutine b\n      real*8 x(10)\n      common /blk/ x\n      end\n")
+            database = os.path.join(tmpdir, 'index.sqlite')
+            with CommonIndex(database) as index:
+                self.assertEqual(index.update(paths, jobs=1), sorted(paths))
+                self.assertEqual(index.sites('blk'), [(paths[0], 2, [('x', 'real*8', '(10)')]),
+                                                      (paths[1], 3, [('x', 'real*8', '(10)')])])
+                self.assertEqual(index.inconsistent_blocks(), {})
+
+            # a changed include file indexes the files including it again
+            with open(include, 'w') as f:
+                f.write("      real*4 x(10)\n      common /blk/ x\n")
+            with CommonIndex(database) as index:
+                self.assertEqual(index.update(paths, jobs=1), [paths[0]])
+                self.assertEqual(list(index.inconsistent_blocks()), ['blk'])
+
+    def test_common_index(self):
+        unit = "      subroutine {name}\n      double precision x(10)\n      integer n\n      common /blk/ x, &\n         n\n{extra}      end\n"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, name + '.f90') for name in ('a', 'b', 'c')]
+            for path, name in zip(paths, ('a', 'b', 'c')):
+                with open(path, 'w') as f:
+                    f.write(unit.format(name=name, extra=''))
+            database = os.path.join(tmpdir, 'index.sqlite')
+
+            with CommonIndex(database) as index:
+                self.assertEqual(index.update(paths, jobs=1), sorted(paths))
+                self.assertEqual(index.inconsistent_blocks(), {})
+                self.assertEqual(index.sites('BLK')[0],
+                                 (paths[0], 4, [('x', 'double precision', '(10)'), ('n', 'integer', '')]))
+
+            # only the changed file is analyzed again
+            with open(paths[2], 'w') as f:
+                f.write(unit.format(name='c', extra="      common /blk/ extra(3)\n"))
+            with CommonIndex(database) as index:
+                self.assertEqual(index.update(paths, jobs=1), [paths[2]])
+                inconsistent = index.inconsistent_blocks()
+                self.assertEqual(list(inconsistent), ['blk'])
+                self.assertEqual(inconsistent['blk'][(('x', 'double precision', '(10)'), ('n', 'integer', ''), ('extra', None, '(3)'))],
+                                 [(paths[2], 4)])
+
+            os.remove(paths[2])
+            with CommonIndex(database) as index:
+                self.assertEqual(index.update(paths[:2], jobs=1), [])
+                self.assertEqual(index.inconsistent_blocks(), {})
+
+    def test_includes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, 'inc'))
+            with open(os.path.join(tmpdir, 'inc', 'sizes.inc'), 'w') as f:
+                f.write("      integer n\n      parameter (n = 10)\n")
+            with open(os.path.join(tmpdir, 'inc', 'blk.h'), 'w') as f:
+                f.write("      include 'sizes.inc'\n      double precision x\n      common /blk/ x(n)\n")
+            paths = [os.path.join(tmpdir, name + '.f90') for name in ('a', 'b')]
+            for path in paths:
+                with open(path, 'w') as f:
+                    f.write("      subroutine s\n      implicit none\n      include 'blk.h'\n"
+                            "      include 'missing.h'\n      x(1) = n + y\n      end\n")
+
+            resolver = IncludeResolver([os.path.join(tmpdir, 'inc')])
+            first, second = (analyze_file(path, resolver) for path in paths)
+            self.assertEqual(resolver.parsed, 2)  # each include file once
+            for result in (first, second):
+                self.assertEqual(result.declared_variables, {'n': 'integer', 'x': 'double precision'})
+                self.assertEqual(result.parameter_variables, {'n': 'parameter'})
+                self.assertEqual(result.undeclared_variables, {'y': [5]})
+                self.assertEqual(result.common_layouts, [['blk', 3, [['x', 'double precision', '(n)']]]])
+                self.assertEqual([path for path, _ in result.includes],
+                                 [os.path.join(tmpdir, 'inc', name) for name in ('blk.h', 'sizes.inc')])
+                self.assertEqual(result.missing_includes, ['missing.h'])
+
+            # without a resolver include lines are not followed
+            undeclared = analyze_file(paths[0]).undeclared_variables
+            self.assertEqual([undeclared[var] for var in ('x', 'n', 'y')], [[5], [5], [5]])
+
+            # the size limit evicts the least recently used include file
+            resolver = IncludeResolver([os.path.join(tmpdir, 'inc')], max_bytes=1)
+            analyze_file(paths[0], resolver)
+            self.assertEqual(len(resolver.cache), 1)
+
+            # cached results are used again only while their include files are unchanged
+            database = os.path.join(tmpdir, 'analysis.sqlite')
+            include_path = [os.path.join(tmpdir, 'inc')]
+            with AnalysisCache(database, ['includes'] + include_path) as cache:
+                analyze_files(paths, jobs=1, cache=cache, include_path=include_path)
+            with open(os.path.join(tmpdir, 'inc', 'sizes.inc'), 'w') as f:
+                f.write("      integer n, y\n      parameter (n = 10)\n")
+            with AnalysisCache(database, ['includes'] + include_path) as cache:
+                results = analyze_files(paths, jobs=1, cache=cache, include_path=include_path)
+            self.assertEqual([result.undeclared_variables for result in results], [{}, {}])
+
+    def test_include_cycle(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, other, var in (('a.inc', 'b.inc', 'x'), ('b.inc', 'a.inc', 'y')):
+                with open(os.path.join(tmpdir, name), 'w') as f:
+                    f.write(f"      include '{other}'\n      integer {var}\n")
+            path = os.path.join(tmpdir, 's.f')
+            with open(path, 'w') as f:
+                f.write("      subroutine s\n      implicit none\n      include 'a.inc'\n      x = y\n      end\n")
+            result = analyze_file(path, IncludeResolver())
+            self.assertEqual(result.missing_includes, [])
+            self.assertEqual(result.undeclared_variables, {})
+            self.assertEqual(sorted(result.declared_variables), ['x', 'y'])
+
+            # and the result can be used from the cache
+            database = os.path.join(tmpdir, 'analysis.sqlite')
+            with AnalysisCache(database, ['includes']) as cache:
+                analyze_files([path], jobs=1, cache=cache, include_path=[])
+                self.assertIsNotNone(cache.lookup(cache.digest(path, location=True)))
+
+    def test_cache_include_location(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for directory, var in (('a', 'x'), ('b', 'y')):
+                os.makedirs(os.path.join(tmpdir, directory))
+                with open(os.path.join(tmpdir, directory, 'decl.inc'), 'w') as f:
+                    f.write(f"      integer {var}\n")
+                paths.append(os.path.join(tmpdir, directory, 's.f'))
+                with open(paths[-1], 'w') as f:
+                    f.write("      subroutine s\n      implicit none\n      include 'decl.inc'\n      x = 1\n      end\n")
+
+            database = os.path.join(tmpdir, 'analysis.sqlite')
+            for run in range(2):
+                with AnalysisCache(database, ['includes']) as cache:
+                    results = analyze_files(paths, jobs=1, cache=cache, include_path=[])
+                self.assertEqual({result.file_path: result.undeclared_variables for result in results},
+                                 {paths[0]: {}, paths[1]: {'x': [4]}}, run)
+
+    def test_cache_options_kept(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 's.f')
+            with open(path, 'w') as f:
+                f.write("      subroutine s\n      implicit none\n      x = 1\n      end\n")
+            database = os.path.join(tmpdir, 'analysis.sqlite')
+
+            # runs with and without includes keep each other's results
+            with AnalysisCache(database) as cache:
+                analyze_files([path], jobs=1, cache=cache)
+            with AnalysisCache(database, ['includes']) as cache:
+                analyze_files([path], jobs=1, cache=cache, include_path=[])
+            with AnalysisCache(database) as cache:
+                self.assertIsNotNone(cache.lookup(cache.digest(path)))
+            with AnalysisCache(database, ['includes']) as cache:
+                self.assertIsNotNone(cache.lookup(cache.digest(path, location=True)))
+
+            # but a deleted file is dropped from all of them
+            os.remove(path)
+            with AnalysisCache(database) as cache:
+                analyze_files([], cache=cache)
+                self.assertEqual(cache.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0], 0)
+                self.assertEqual(cache.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0], 1)
+
 '''
     def test_collect_common_blocks_handling(self):
         file_content = """\
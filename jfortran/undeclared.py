@@ -6,6 +6,30 @@ from variable_collector import (
 )
 import re
 
+from flt.lexer import remove_strings, code_text
+
+# Fortran keywords
+FORTRAN_KEYWORDS = frozenset({
+    'do', 'if', 'then', 'else', 'elseif', 'end', 'subroutine', 'function', 'program', 'module',
+    'use', 'call', 'continue', 'return', 'stop', 'print', 'write', 'read', 'format', 'go', 'to',
+    'parameter', 'common', 'dimension', 'logical', 'integer', 'real', 'character', 'complex',
+    'double', 'precision', 'implicit', 'none', 'data', 'contains', 'external', 'intrinsic', 'endif'
+})
+
+# Logical operators
+FORTRAN_LOGICAL_OPERATORS = frozenset({
+    '.and.', '.or.', '.not.', '.eq.', '.ne.', '.lt.', '.le.', '.gt.', '.ge.', '.eqv.', '.neqv.', '.true.', '.false.'
+})
+
+ALL_FORTRAN_KEYWORDS = FORTRAN_KEYWORDS | FORTRAN_LOGICAL_OPERATORS
+
+VARIABLE_PATTERN = re.compile(r'\b([a-zA-Z]\w*)\b')
+IMPLICIT_PATTERN = re.compile(r'implicit\s+', re.IGNORECASE)
+LOGICAL_OPERATORS_PATTERN = re.compile(r'\.\s*(and|or|not|eq|ne|lt|le|gt|ge|eqv|neqv)\s*\.', re.IGNORECASE)
+SUBROUTINE_CALL_PATTERN = re.compile(r'\bcall\s+([a-zA-Z]\w*)\s*\((.*)\)', re.IGNORECASE)
+FORMAT_STATEMENT_PATTERN = re.compile(r'^\s*\d+\s*format\s*\(.*\)', re.IGNORECASE)
+COMMON_BLOCK_PATTERN = re.compile(r'^\s*common\s*/', re.IGNORECASE)
+
 def collect_known_variables(file_path):
     """
     Collects all known variables from declared variables, parameters, common blocks, and data initializations.
@@ -32,11 +56,44 @@ def collect_known_variables(file_path):
     return known_variables
 def remove_string_literals(line):
     """
-    Removes string literals from the line, ignoring text within quotes.
+    Removes string literals, single and double quoted, from the line.
+    """
+    return remove_strings(line)
+
+def scan_line(line):
+    """
+    Classifies one source line for the undeclared variable search and returns (kind, names):
+    ('implicit', []) for an implicit statement, ('call', argument names) for a subroutine call,
+    ('common', names) for a common block, ('code', names) for anything else, and (None, [])
+    for comments, FORMAT statements and calls whose arguments cannot be found.
     """
-    return re.sub(r"'.*?'", '', line)  # Removes single-quoted strings
-    # Optionally, you can extend this to handle double-quoted strings if used:
-    # return re.sub(r"['\"].*?['\"]", '', line)
+    # Skip entire line if it's a comment or FORMAT statement
+    stripped_line = line.lstrip()
+    if stripped_line.startswith('!') or (stripped_line[:1].isdigit() and is_format_statement(line)):
+        return None, []
+
+    # Check for implicit statement
+    lowered = line.lower()
+    if 'implicit' in lowered and IMPLICIT_PATTERN.search(line):
+        return 'implicit', []
+
+    # Remove inline comments and string literals
+    line = code_text(line)
+
+    # Replace logical operators with spaces to prevent variable concatenation
+    if '.' in line:
+        line = LOGICAL_OPERATORS_PATTERN.sub(' ', line)
+
+    # Check for subroutine calls and handle them
+    if "call" in lowered and "call" in line.lower():
+        match = SUBROUTINE_CALL_PATTERN.search(line)
+        if match:
+            arguments = match.group(2)  # The arguments inside the parentheses (e.g., 'x')
+            return 'call', VARIABLE_PATTERN.findall(arguments)
+        return None, []
+
+    # Find all other variables in the line
+    return ('common' if is_common_block(line) else 'code'), VARIABLE_PATTERN.findall(line)
 
 def find_undeclared_variables(file_path, known_variables):
     """
@@ -52,57 +109,29 @@ def find_undeclared_variables(file_path, known_variables):
         return {}
 
     undeclared_variables = {}
-    variable_pattern = re.compile(r'\b([a-zA-Z]\w*)\b')
     implicit_found = False
 
     for i, line in enumerate(lines, start=1):  # Enumerate lines with line numbers starting at 1
-        # Skip entire line if it's a comment or FORMAT statement
-        if line.strip().startswith('!') or is_format_statement(line):
-            continue
-
-        # Check for implicit statement
-        if re.search(r'implicit\s+', line, re.IGNORECASE):
+        kind, names = scan_line(line)
+        if kind == 'implicit':
             implicit_found = True
             continue  # Move to next line after finding implicit
 
-        # Remove inline comments
-        line = line.split('!')[0]
-
-        # Remove string literals
-        line = remove_string_literals(line)
-
-        # Replace logical operators with spaces to prevent variable concatenation
-        logical_operators_pattern = re.compile(r'\.\s*(and|or|not|eq|ne|lt|le|gt|ge|eqv|neqv)\s*\.', re.IGNORECASE)
-        line = logical_operators_pattern.sub(' ', line)
-
-        # Check for subroutine calls and handle them
-        if "call" in line.lower():
-            subroutine_call_pattern = re.compile(r'\bcall\s+([a-zA-Z]\w*)\s*\((.*)\)', re.IGNORECASE)
-            match = subroutine_call_pattern.search(line)
-            if match:
-                subroutine_name = match.group(1)  # The subroutine name (e.g., 'a')
-                arguments = match.group(2)  # The arguments inside the parentheses (e.g., 'x')
-                argument_vars = variable_pattern.findall(arguments)
-                for arg in argument_vars:
-                    arg_lower = arg.lower()
-                    if implicit_found and arg_lower not in known_variables and not is_fortran_keyword(arg_lower):
-                        if arg_lower not in undeclared_variables:
-                            undeclared_variables[arg_lower] = []
-                        undeclared_variables[arg_lower].append(i)
+        if kind == 'call':
+            for arg in names:
+                arg_lower = arg.lower()
+                if implicit_found and arg_lower not in known_variables and not is_fortran_keyword(arg_lower):
+                    undeclared_variables.setdefault(arg_lower, []).append(i)
             continue  # Skip to the next line
 
-        # Find all other variables in the line
-        matches = variable_pattern.findall(line)
-        for var in matches:
+        for var in names:
             var_lower = var.lower()
             # Before implicit, add variables to known_variables
             if not implicit_found:
                 known_variables.add(var_lower)
             # After implicit, check for undeclared variables
-            elif var_lower not in known_variables and not is_fortran_keyword(var_lower) and not is_common_block(line):
-                if var_lower not in undeclared_variables:
-                    undeclared_variables[var_lower] = []
-                undeclared_variables[var_lower].append(i)  # Append the line number
+            elif var_lower not in known_variables and not is_fortran_keyword(var_lower) and kind != 'common':
+                undeclared_variables.setdefault(var_lower, []).append(i)  # Append the line number
 
     return undeclared_variables
 
@@ -111,13 +140,13 @@ def is_format_statement(line):
     """
     Checks if a line is a FORMAT statement.
     """
-    return bool(re.match(r'^\s*\d+\s*format\s*\(.*\)', line, re.IGNORECASE))
+    return bool(FORMAT_STATEMENT_PATTERN.match(line))
 
 def is_common_block(line):
     """
     Checks if a line is declaring a common block.
     """
-    return bool(re.match(r'^\s*common\s*/', line, re.IGNORECASE))
+    return bool(COMMON_BLOCK_PATTERN.match(line))
 
 def check_proper_type_declaration(declared_variables, common_blocks, parameter_variables, data_initializations):
     """
@@ -142,30 +171,6 @@ def is_fortran_keyword(word):
     """
     Checks if a word is a Fortran keyword, logical operator, or format specifier to avoid false positives.
     """
-    # Fortran keywords
-    fortran_keywords = {
-        'do', 'if', 'then', 'else', 'elseif', 'end', 'subroutine', 'function', 'program', 'module',
-        'use', 'call', 'continue', 'return', 'stop', 'print', 'write', 'read', 'format', 'go', 'to',
-        'parameter', 'common', 'dimension', 'logical', 'integer', 'real', 'character', 'complex',
-        'double', 'precision', 'implicit', 'none', 'data', 'contains', 'external', 'intrinsic', 'endif'
-    }
-
-    # Logical operators
-    fortran_logical_operators = {
-        '.and.', '.or.', '.not.', '.eq.', '.ne.', '.lt.', '.le.', '.gt.', '.ge.', '.eqv.', '.neqv.', '.true.', '.false.'
-    }
-
-    # Combine keywords and logical operators
-    all_fortran_keywords = fortran_keywords.union(fortran_logical_operators)
-
-    # Check if the word matches format specifiers with numbers (like i8, f12.5, etc.)
-    format_specifiers = {'i', 'f', 'e', 'g', 'a', 'l', 'd', 'x', '1x', 'h'}
-    if word.lower() in format_specifiers:
-        return False  # Exclude basic format specifiers from being treated as keywords
-
-    # Check if the word starts with a format specifier and is followed by digits
-    if any(word.lower().startswith(fmt) and word[len(fmt):].isdigit() for fmt in format_specifiers):
-        return False  # Exclude format specifiers with numbers
-
-    return word.lower() in all_fortran_keywords
-
+    # Format specifiers, with or without a width, are excluded: none of them is in the
+    # keyword table, so a single lookup gives the answer.
+    return word.lower() in ALL_FORTRAN_KEYWORDS
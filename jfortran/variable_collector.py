@@ -1,5 +1,7 @@
 import re
 
+from flt.lexer import strip_comment
+
 def extract_variables(line, keyword):
     """
     Extracts variables from a line of Fortran code given a specific keyword.
@@ -7,7 +9,7 @@ def extract_variables(line, keyword):
     # Remove keyword and split by commas
     variables_part = line.split(keyword, 1)[1]
     # Remove anything after a comment or continuation mark
-    variables_part = variables_part.split('!')[0].split('&')[0]
+    variables_part = strip_comment(variables_part).split('&')[0]
     # Split variables and strip spaces
     variables = [var.strip() for var in variables_part.split(',')]
     return variables
@@ -34,6 +36,175 @@ def preprocess_lines(lines):
 
     return concatenated_lines
 
+# Regular expressions for identifying declarations
+DECLARATION_PATTERNS = {
+    'integer': re.compile(r'^\s*integer\b', re.IGNORECASE),
+    'logical': re.compile(r'^\s*logical\b', re.IGNORECASE),
+    'character': re.compile(r'^\s*character\*\d+\s+(\w+)', re.IGNORECASE),
+    'double precision': re.compile(r'^\s*double\s+precision\b', re.IGNORECASE),
+    'real': re.compile(r'^\s*real\*\d+\s+(\w+)', re.IGNORECASE),
+    'complex': re.compile(r'^\s*complex\b', re.IGNORECASE),
+}
+
+# Regular expression to identify parameter statements
+PARAMETER_PATTERN = re.compile(r'^\s*parameter\s*\((.*?)\)', re.IGNORECASE)
+
+# Regular expression to identify common block declarations
+COMMON_PATTERN = re.compile(r'^\s*common\s*/(\w+)/\s*(.*)', re.IGNORECASE)
+
+# Regular expression to identify data statements with Hollerith constants
+DATA_PATTERN = re.compile(r'\b(\w+)\s*/\d+H([\w\s]*)\s*/')
+
+def declared_in_line(line):
+    """
+    Yields (variable, type) for the declarations in a preprocessed line.
+    """
+    for key, pattern in DECLARATION_PATTERNS.items():
+        if key in ['character', 'real']:
+            match = pattern.search(line)
+            if match:
+                yield match.group(1), key
+        else:
+            match = pattern.search(line)
+            if match:
+                # the keyword as written, in any case
+                for var in extract_variables(line, match.group(0).strip()):
+                    yield var, key
+
+# A type with its kind or length as written: real*8, character*(*), integer(kind=4), ...
+TYPE_SPEC_PATTERN = re.compile(
+    r'^\s*(integer|real|double\s*precision|complex|double\s*complex|logical|character)'
+    r'(\s*\*\s*(?:\d+|\(\s*[^)]*\))|\s*\((?:[^()]|\([^()]*\))*\))?', re.IGNORECASE)
+# An entity of a declaration: name, length (character x*8), dimensions, length again
+ENTITY_PATTERN = re.compile(
+    r'\s*(\w+)\s*(\*\s*(?:\d+|\(\s*[^)]*\)))?\s*(\((?:[^()]|\([^()]*\))*\))?\s*(\*\s*(?:\d+|\(\s*[^)]*\)))?')
+DIMENSION_ATTRIBUTE_PATTERN = re.compile(r'\bdimension\s*(\((?:[^()]|\([^()]*\))*\))', re.IGNORECASE)
+
+def _normalized(text):
+    return re.sub(r'\s+', '', text).lower()
+
+def typed_declarations_in_line(line):
+    """
+    Returns (variable, type, dimensions) for every variable of a type declaration in a
+    preprocessed line, or an empty list. The type includes its kind or length as written,
+    without blanks and in lowercase ('real*8', 'character*(*)', 'integer(kind=4)', but
+    'double precision'); a length given with the variable (character c*8) takes precedence.
+    Dimensions are normalized like those of common_layout_in_line, '' for a scalar.
+    """
+    match = TYPE_SPEC_PATTERN.match(line)
+    if not match:
+        return []
+    keyword = ' '.join(match.group(1).lower().replace('double', 'double ').split())
+    kind = _normalized(match.group(2) or '')
+    rest = strip_comment(line[match.end():])
+
+    attributes = ''
+    if '::' in rest:
+        attributes, rest = rest.split('::', 1)
+        if attributes.strip() and not attributes.lstrip().startswith(','):
+            return []
+    elif not (rest[:1].isspace() or kind) or rest.lstrip()[:1] in ('', '=', '('):
+        return []  # an assignment to a variable named like a type, or realx = 1
+    elif re.match(r'\s*function\b', rest, re.IGNORECASE):
+        return []
+    default_dimensions = DIMENSION_ATTRIBUTE_PATTERN.search(attributes)
+    default_dimensions = _normalized(default_dimensions.group(1)) if default_dimensions else ''
+
+    declarations = []
+    for piece in split_top_level(rest)[0]:
+        entity = ENTITY_PATTERN.match(piece)
+        if not entity:
+            continue
+        name, length, dimensions, length_after = entity.groups()
+        length = length or length_after
+        type_name = keyword + (_normalized(length) if length else kind)
+        declarations.append((name, type_name, _normalized(dimensions) if dimensions else default_dimensions))
+    return declarations
+
+def parameters_in_line(line):
+    """
+    Returns the names defined by a parameter statement, or an empty list.
+    """
+    match = PARAMETER_PATTERN.search(line)
+    if not match:
+        return []
+    params_part = match.group(1)
+    return [param.split('=')[0].strip() for param in params_part.split(',')]
+
+def common_block_in_line(line):
+    """
+    Returns (block name, variables) of a common block declaration, or None.
+    """
+    match = COMMON_PATTERN.search(line)
+    if not match:
+        return None
+    # Extract only variable names, removing any array dimensions
+    variables = [var.strip().split('(')[0] for var in match.group(2).split(',')]
+    return match.group(1), variables
+
+# Start of a COMMON statement, the blocks and members follow
+COMMON_STATEMENT_PATTERN = re.compile(r'^\s*common\b', re.IGNORECASE)
+BLOCK_NAME_PATTERN = re.compile(r'\s*/\s*(\w*)\s*/')
+
+def split_top_level(text, separators=','):
+    """
+    Splits text at the separators that are not inside parentheses.
+    Returns the pieces and the rest of text after an unmatched separator '/'.
+    """
+    pieces = []
+    depth = 0
+    start = 0
+    for position, character in enumerate(text):
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif depth == 0 and character in separators:
+            pieces.append(text[start:position])
+            start = position + 1
+            if character == '/':
+                return pieces, text[position:]
+    pieces.append(text[start:])
+    return pieces, ''
+
+def common_layout_in_line(line):
+    """
+    Returns the blocks of a COMMON statement as a list of (block name, [(member, dimensions)]),
+    in order, or an empty list for any other line. Dimensions are kept as written, without
+    blanks and in lowercase, e.g. '(mxatm,3)', or '' for a scalar. Blank common has the name ''.
+    """
+    match = COMMON_STATEMENT_PATTERN.match(line)
+    if not match:
+        return []
+    rest = strip_comment(line[match.end():])
+
+    blocks = []
+    block_name = ''
+    while rest.strip():
+        name_match = BLOCK_NAME_PATTERN.match(rest)
+        if name_match:
+            block_name = name_match.group(1)
+            rest = rest[name_match.end():]
+        elif rest.lstrip().startswith('/'):
+            rest = rest.lstrip()[1:]  # a lone '/', not a block name
+        pieces, rest = split_top_level(rest, ',/')
+        members = []
+        for piece in pieces:
+            name, parenthesis, dimensions = piece.strip().partition('(')
+            if name.strip():
+                dimensions = (parenthesis + dimensions).replace(' ', '').lower()
+                members.append((name.strip(), dimensions))
+        if members or name_match:
+            blocks.append((block_name, members))
+    return blocks
+
+def data_in_line(line):
+    """
+    Returns (variable, Hollerith value) for the data initializations in a line.
+    """
+    return [(var_name.strip(), hollerith_value.strip())
+            for var_name, hollerith_value in DATA_PATTERN.findall(line)]
+
 def collect_declared_variables(file_path):
     """
     Collects all variables that are properly declared with a valid Fortran identifier.
@@ -50,27 +221,9 @@ def collect_declared_variables(file_path):
     # Preprocess lines to handle multi-line declarations
     lines = preprocess_lines(lines)
 
-    # Regular expressions for identifying declarations
-    patterns = {
-        'integer': re.compile(r'^\s*integer\b', re.IGNORECASE),
-        'logical': re.compile(r'^\s*logical\b', re.IGNORECASE),
-        'character': re.compile(r'^\s*character\*\d+\s+(\w+)', re.IGNORECASE),
-        'double precision': re.compile(r'^\s*double\s+precision\b', re.IGNORECASE),
-        'real': re.compile(r'^\s*real\*\d+\s+(\w+)', re.IGNORECASE),
-        'complex': re.compile(r'^\s*complex\b', re.IGNORECASE),
-    }
-
     for line in lines:
-        for key, pattern in patterns.items():
-            if key in ['character', 'real']:
-                match = pattern.search(line)
-                if match:
-                    declared_variables[match.group(1)] = key
-            else:
-                if pattern.search(line):
-                    variables = extract_variables(line, key)
-                    for var in variables:
-                        declared_variables[var] = key
+        for var, key in declared_in_line(line):
+            declared_variables[var] = key
 
     return declared_variables
 
@@ -90,16 +243,9 @@ def collect_parameter_variables(file_path):
     # Preprocess lines to handle multi-line declarations
     lines = preprocess_lines(lines)
 
-    # Regular expression to identify parameter statements
-    parameter_pattern = re.compile(r'^\s*parameter\s*\((.*?)\)', re.IGNORECASE)
-
     for line in lines:
-        match = parameter_pattern.search(line)
-        if match:
-            params_part = match.group(1)
-            params = [param.split('=')[0].strip() for param in params_part.split(',')]
-            for param in params:
-                parameter_variables[param] = 'parameter'
+        for param in parameters_in_line(line):
+            parameter_variables[param] = 'parameter'
 
     return parameter_variables
 def collect_common_blocks(file_path):
@@ -118,15 +264,10 @@ def collect_common_blocks(file_path):
     # Preprocess lines to handle multi-line common blocks
     lines = preprocess_lines(lines)
 
-    # Regular expression to identify common block declarations
-    common_pattern = re.compile(r'^\s*common\s*/(\w+)/\s*(.*)', re.IGNORECASE)
-
     for line in lines:
-        match = common_pattern.search(line)
-        if match:
-            block_name = match.group(1)
-            # Extract only variable names, removing any array dimensions
-            variables = [var.strip().split('(')[0] for var in match.group(2).split(',')]
+        common_block = common_block_in_line(line)
+        if common_block:
+            block_name, variables = common_block
             common_blocks[block_name] = variables
 
     return common_blocks
@@ -148,16 +289,8 @@ def collect_data_initializations(file_path):
     # Preprocess lines to handle multi-line data statements
     lines = preprocess_lines(lines)
 
-    # Regular expression to identify data statements with Hollerith constants
-    data_pattern = re.compile(r'\b(\w+)\s*/\d+H([\w\s]*)\s*/')
-
     for line in lines:
-        # Find all matches in the line
-        matches = data_pattern.findall(line)
-        for match in matches:
-            # Extract variable names and their corresponding Hollerith values
-            var_name = match[0].strip()
-            hollerith_value = match[1].strip()
+        for var_name, hollerith_value in data_in_line(line):
             data_initializations[var_name] = hollerith_value
 
     return data_initializations